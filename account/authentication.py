@@ -0,0 +1,272 @@
+import atexit
+import binascii
+import secrets
+import threading
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.knox_auth_token import KnoxTokenScheme
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from knox.settings import knox_settings
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+
+
+REVOCATION_SEQUENCE_KEY = "auth:token:revocations"
+
+
+def get_token_cache_key(digest: str) -> str:
+    return f"auth:token:{digest}"
+
+
+def get_token_revoked_key(digest: str) -> str:
+    return f"auth:token:revoked:{digest}"
+
+
+def get_ticket_cache_key(ticket: str) -> str:
+    return f"auth:ticket:{ticket}"
+
+
+def get_revocation_sequence() -> int:
+    sequence = cache.get(REVOCATION_SEQUENCE_KEY)
+    if sequence is None:
+        # Starting over only keeps tokens with newer markers out longer
+        cache.add(REVOCATION_SEQUENCE_KEY, 0, timeout=None)
+        sequence = cache.get(REVOCATION_SEQUENCE_KEY, 0)
+    return sequence
+
+
+def cache_token(auth_token: AuthToken) -> None:
+    """
+    Keep the token with its user until it expires, unless it was revoked
+    after it was loaded. Tokens are set first and checked afterwards, so
+    an eviction running in between still removes them.
+    """
+    timeout = settings.AUTH_TOKEN_CACHE_TTL
+    if auth_token.expiry is not None:
+        timeout = min(timeout, (auth_token.expiry - timezone.now()).total_seconds())
+    if timeout <= 0:
+        return
+
+    key = get_token_cache_key(auth_token.digest)
+    cache.set(key, auth_token, timeout)
+    revoked_at = cache.get(get_token_revoked_key(auth_token.digest))
+    # Copies cached before markers existed have no loaded_at
+    if revoked_at is not None and revoked_at > getattr(auth_token, "loaded_at", 0):
+        cache.delete(key)
+
+
+def get_cached_token(digest: str) -> AuthToken | None:
+    return cache.get(get_token_cache_key(digest))
+
+
+def issue_ticket(auth_token: AuthToken, ttl: int) -> str:
+    """
+    Single use stand-in for a token in the query string,
+    for clients that can't send headers like EventSource.
+    """
+    # Tickets are redeemed from the cached token, it outlives the ticket
+    cache_token(auth_token)
+    ticket = secrets.token_urlsafe(32)
+    cache.set(get_ticket_cache_key(ticket), auth_token.digest, ttl)
+    return ticket
+
+
+def redeem_ticket(ticket: str) -> AuthToken | None:
+    key = get_ticket_cache_key(ticket)
+    digest = cache.get(key)
+    # Only the request that deletes the ticket gets to use it
+    if digest is None or not cache.delete(key):
+        return None
+    return get_cached_token(digest)
+
+
+def evict_tokens(*digests: str) -> None:
+    """
+    Drop the tokens once the transaction deleting or changing them commits.
+    Their revocation markers keep requests that loaded them earlier from
+    caching them again.
+    """
+    if not digests:
+        return
+
+    def evict() -> None:
+        get_revocation_sequence()
+        revoked_at = cache.incr(REVOCATION_SEQUENCE_KEY)
+        cache.set_many(
+            {get_token_revoked_key(digest): revoked_at for digest in digests},
+            settings.AUTH_TOKEN_CACHE_TTL,
+        )
+        cache.delete_many([get_token_cache_key(digest) for digest in digests])
+
+    transaction.on_commit(evict)
+
+
+def evict_user_tokens(user_id: int) -> None:
+    evict_tokens(
+        *AuthToken.objects.filter(user_id=user_id).values_list("digest", flat=True)
+    )
+
+
+class ExpiryRefreshBuffer:
+    """
+    Collect token expiry refreshes and write them in one bulk update,
+    flush_interval seconds after the first one or when the process exits
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self.flush_interval = flush_interval
+        self._expiries = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, digest: str, expiry: datetime) -> None:
+        with self._lock:
+            self._expiries[digest] = expiry
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            expiries, self._expiries = self._expiries, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        self.write(expiries)
+
+    def flush_on_timer(self) -> None:
+        try:
+            self.flush()
+        finally:
+            # The connection of the timer thread goes back to the pool
+            connection.close()
+
+    @staticmethod
+    def write(expiries: dict[str, datetime]) -> None:
+        if expiries:
+            AuthToken.objects.bulk_update(
+                [
+                    AuthToken(digest=digest, expiry=expiry)
+                    for digest, expiry in expiries.items()
+                ],
+                ["expiry"],
+            )
+
+
+expiry_refreshes = ExpiryRefreshBuffer(settings.AUTH_TOKEN_REFRESH_FLUSH_INTERVAL)
+atexit.register(expiry_refreshes.flush)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Knox token authentication backed by the shared cache,
+    so warm requests skip the database.
+    """
+
+    async def aauthenticate(self, request: HttpRequest) -> tuple | None:
+        """
+        Authenticate a plain Django request inside an async view.
+        Warm tokens are answered from the cache without blocking,
+        anything needing the database or a refresh takes the sync path.
+        """
+        auth = get_authorization_header(request).split()
+        prefix = knox_settings.AUTH_HEADER_PREFIX.encode()
+        if len(auth) == 2 and auth[0].lower() == prefix.lower():
+            digest = self.get_digest(auth[1])
+            auth_token = await sync_to_async(get_cached_token, thread_sensitive=False)(
+                digest
+            )
+            if not (
+                auth_token is None
+                or self.is_expired(auth_token)
+                or self.is_refresh_due(auth_token)
+            ):
+                return self.validate_user(auth_token)
+
+        return await sync_to_async(self.authenticate)(request)
+
+    def authenticate_credentials(self, token: bytes) -> tuple:
+        auth_token = get_cached_token(self.get_digest(token))
+        if auth_token is None or self.is_expired(auth_token):
+            loaded_at = get_revocation_sequence()
+            # Knox looks the token up and deletes it when it is expired
+            auth_token = super().authenticate_credentials(token)[1]
+            auth_token.loaded_at = loaded_at
+            self.load_principal(auth_token)
+            cache_token(auth_token)
+            return auth_token.user, auth_token
+
+        if self.is_refresh_due(auth_token):
+            self.renew_token(auth_token)
+        return self.validate_user(auth_token)
+
+    def renew_token(self, auth_token: AuthToken) -> None:
+        if self.is_refresh_due(auth_token):
+            auth_token.expiry = timezone.now() + knox_settings.TOKEN_TTL
+            expiry_refreshes.add(auth_token.digest, auth_token.expiry)
+            cache_token(auth_token)
+
+    @staticmethod
+    def load_principal(auth_token: AuthToken) -> None:
+        """
+        Load the user together with the profile, a missing profile is cached
+        as well so permissions and views never query it again.
+        """
+        auth_token.user = (
+            get_user_model()
+            .objects.select_related("profile")
+            .get(pk=auth_token.user_id)
+        )
+
+    @staticmethod
+    def is_expired(auth_token: AuthToken) -> bool:
+        return auth_token.expiry is not None and auth_token.expiry < timezone.now()
+
+    @staticmethod
+    def is_refresh_due(auth_token: AuthToken) -> bool:
+        if not (knox_settings.AUTO_REFRESH and auth_token.expiry):
+            return False
+
+        new_expiry = timezone.now() + knox_settings.TOKEN_TTL
+        delta = (new_expiry - auth_token.expiry).total_seconds()
+        return delta > knox_settings.MIN_REFRESH_INTERVAL
+
+    @staticmethod
+    def get_digest(token: bytes) -> str:
+        try:
+            return hash_token(token.decode("utf-8"))
+        except (TypeError, UnicodeDecodeError, binascii.Error):
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+
+class TicketAuthentication(CachedTokenAuthentication):
+    """
+    Accept a ticket from issue_ticket as the ticket query parameter in place
+    of the Authorization header. Revoking the token voids its tickets.
+    """
+
+    async def aauthenticate(self, request: HttpRequest) -> tuple | None:
+        ticket = request.GET.get("ticket")
+        if ticket is None:
+            return await super().aauthenticate(request)
+
+        auth_token = await sync_to_async(redeem_ticket, thread_sensitive=False)(ticket)
+        if auth_token is None or self.is_expired(auth_token):
+            raise exceptions.AuthenticationFailed(_("Invalid ticket."))
+        return self.validate_user(auth_token)
+
+
+class CachedTokenScheme(KnoxTokenScheme):
+    target_class = CachedTokenAuthentication
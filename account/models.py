@@ -19,8 +19,9 @@ class User(AbstractUser):
     @property
     def has_profile(self) -> bool:
         try:
-            self.profile
+            profile = self.profile
         except self.__class__.profile.RelatedObjectDoesNotExist:
             return False
 
-        return True
+        # A soft deleted profile is gone for its owner while it is purged
+        return profile.deleted_at is None
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from account.authentication import evict_tokens, evict_user_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=AuthToken)
+def evict_deleted_token(sender, instance: AuthToken, **kwargs) -> None:
+    evict_tokens(instance.digest)
+
+
+@receiver(post_save, sender=User)
+def evict_saved_user_tokens(
+    sender, instance: User, created: bool, update_fields=None, **kwargs
+) -> None:
+    # Cached tokens carry the user, drop them unless only the login time changed
+    if created or update_fields and set(update_fields) <= {"last_login"}:
+        return
+
+    evict_user_tokens(instance.pk)
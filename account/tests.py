@@ -1,3 +1,92 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from account.authentication import (
+    CachedTokenAuthentication,
+    ExpiryRefreshBuffer,
+    cache_token,
+    evict_tokens,
+    get_cached_token,
+)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password", username="user"
+        )
+        self.auth_token, self.token = AuthToken.objects.create(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+        self.expiry = timezone.now() + timedelta(days=1)
+
+    def authenticate(self) -> AuthToken:
+        return CachedTokenAuthentication().authenticate_credentials(
+            self.token.encode()
+        )[1]
+
+    def test_warm_tokens_skip_the_database(self) -> None:
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_logout_rejects_the_token(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/v1/account/logout/")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(get_cached_token(self.auth_token.digest))
+        self.assertEqual(self.client.post("/api/v1/account/logout/").status_code, 401)
+
+    def test_copies_loaded_before_revocation_are_not_cached(self) -> None:
+        stale_token = self.authenticate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            evict_tokens(stale_token.digest)
+        cache_token(stale_token)
+
+        self.assertIsNone(get_cached_token(stale_token.digest))
+        self.authenticate()
+        self.assertIsNotNone(get_cached_token(stale_token.digest))
+
+    def test_tokens_are_evicted_once_the_transaction_commits(self) -> None:
+        self.authenticate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            evict_tokens(self.auth_token.digest)
+            self.assertIsNotNone(get_cached_token(self.auth_token.digest))
+
+        self.assertIsNone(get_cached_token(self.auth_token.digest))
+
+    def test_refreshes_are_written_after_flush_interval(self) -> None:
+        expiry_refreshes = ExpiryRefreshBuffer(0.2)
+        written = threading.Event()
+
+        with mock.patch.object(
+            ExpiryRefreshBuffer, "write", side_effect=lambda _: written.set()
+        ) as write:
+            expiry_refreshes.add("first", self.expiry)
+            expiry_refreshes.add("second", self.expiry)
+
+            self.assertTrue(written.wait(5))
+
+        write.assert_called_once_with({"first": self.expiry, "second": self.expiry})
+
+    def test_flush_writes_pending_refreshes(self) -> None:
+        expiry_refreshes = ExpiryRefreshBuffer(60)
+        expiry_refreshes.add(self.auth_token.digest, self.expiry)
+
+        expiry_refreshes.flush()
 
-# Create your tests here.
+        self.auth_token.refresh_from_db()
+        self.assertEqual(self.auth_token.expiry, self.expiry)
@@ -1,7 +1,11 @@
 from django.urls import path
-from knox.views import LogoutAllView
 
-from account.views import UserCreateApiView, LoginApiView, LogoutView
+from account.views import (
+    UserCreateApiView,
+    LoginApiView,
+    LogoutView,
+    LogoutAllView,
+)
 
 urlpatterns = [
     path("register/", UserCreateApiView.as_view(), name="user_create"),
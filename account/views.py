@@ -1,7 +1,11 @@
 from typing import Any
 
 from django.contrib.auth import login
-from knox.views import LoginView, LogoutView as KnoxLogoutView
+from knox.views import (
+    LoginView,
+    LogoutView as KnoxLogoutView,
+    LogoutAllView as KnoxLogoutAllView,
+)
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
@@ -37,3 +41,10 @@ class LogoutView(KnoxLogoutView):
     def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Delete an auth token for the user"""
         return super().post(request, *args, **kwargs)
+
+
+class LogoutAllView(KnoxLogoutAllView):
+
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Delete all auth tokens of the user"""
+        return super().post(request, *args, **kwargs)
@@ -0,0 +1,294 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import Serializer
+
+from account.authentication import CachedTokenAuthentication, TicketAuthentication
+from social_media.cache import (
+    cache_metrics,
+    cache_to_async,
+    get_version,
+    get_profile_version_key,
+    get_response_cache_key,
+)
+from social_media.conditional import aconditional_response
+from social_media.events import (
+    get_event_bus,
+    get_profile_channel,
+    coalesce_events,
+    format_event,
+)
+from social_media.filters import HashtagSearchBackend
+from social_media.models import UserProfile, Post, Comment
+from social_media.pagination import IdCursorPagination
+from social_media.permissions import HasUserProfile
+from social_media.serializers import (
+    UserProfileSerializer,
+    PostSerializer,
+    CommentThreadSerializer,
+)
+from social_media.timeline import aget_home_timeline
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of the DRF read views for ASGI servers.
+    Requests are authenticated from the token cache tiers and rendered
+    as JSON on the event loop, only the ORM queries leave it.
+    """
+
+    authentication_class = CachedTokenAuthentication
+    permission_classes = [HasUserProfile]
+    pagination_class = IdCursorPagination
+    renderer_class = JSONRenderer
+
+    async def dispatch(
+        self, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponse:
+        try:
+            self.request = await self.initialize_request(request)
+            self.check_permissions(self.request)
+            return await super().dispatch(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def initialize_request(self, request: HttpRequest) -> Request:
+        renderer = self.renderer_class()
+        drf_request = Request(request)
+        drf_request.accepted_renderer = renderer
+        drf_request.accepted_media_type = renderer.media_type
+
+        user_auth = await self.authentication_class().aauthenticate(request)
+        drf_request.user, drf_request.auth = user_auth or (AnonymousUser(), None)
+        return drf_request
+
+    def check_permissions(self, request: Request) -> None:
+        for permission_class in self.permission_classes:
+            permission = permission_class()
+            if not permission.has_permission(request, self):
+                if request.auth is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, "message", None))
+
+    def handle_exception(self, exc: exceptions.APIException) -> HttpResponse:
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {"detail": exc.detail}
+
+        response = self.render(data, exc.status_code)
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            response["WWW-Authenticate"] = (
+                self.authentication_class().authenticate_header(self.request)
+            )
+        return response
+
+    def render(self, data: Any, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+        renderer = self.renderer_class()
+        return HttpResponse(
+            renderer.render(data),
+            status=status_code,
+            content_type=renderer.media_type,
+        )
+
+    async def paginate(
+        self,
+        queryset: QuerySet,
+        serializer_class: type[Serializer],
+        prepare_page: Callable[[list], Awaitable[None]] | None = None,
+    ) -> HttpResponse:
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, self.request)
+        if prepare_page is not None:
+            await prepare_page(page)
+        serializer = serializer_class(
+            page, many=True, context={"request": self.request}
+        )
+        return self.render(paginator.get_paginated_response(serializer.data).data)
+
+
+class AsyncPostListView(AsyncAPIView):
+    # The pulled authors of the fan-out timeline take one more query
+    query_budget = 2
+
+    async def get(self, request: Request) -> HttpResponse:
+        """Return own posts and posts of followed profiles"""
+        if settings.TIMELINE_FANOUT_ENABLED:
+            post_qs = await aget_home_timeline(request.user.profile)
+        else:
+            post_qs = Post.visible_to(request.user.profile)
+
+        post_qs = HashtagSearchBackend().filter_queryset(request, post_qs, self)
+        return await self.paginate(
+            post_qs.select_related("user_profile__user").defer("search_vector"),
+            PostSerializer,
+        )
+
+
+class AsyncPostDetailView(AsyncAPIView):
+    query_budget = 1
+
+    async def get(self, request: Request, pk: int) -> HttpResponse:
+        """Return a post detail"""
+        post = (
+            await Post.visible_to(request.user.profile)
+            .select_related("user_profile__user")
+            .defer("search_vector")
+            .filter(pk=pk)
+            .afirst()
+        )
+        if post is None:
+            raise exceptions.NotFound()
+
+        async def get_response() -> HttpResponse:
+            return self.render(PostSerializer(post, context={"request": request}).data)
+
+        return await aconditional_response(
+            request,
+            (
+                post.updated_at,
+                post.user_profile.user.username,
+                post.like_count,
+                post.comment_count,
+            ),
+            post.updated_at,
+            get_response,
+        )
+
+
+class AsyncUserProfileDetailView(AsyncAPIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budget = 2
+
+    def get_cached(self, pk: int) -> tuple[str, dict | None]:
+        version = get_version(get_profile_version_key(pk))
+        key = get_response_cache_key("profile:detail", version, self.request)
+        return key, cache.get(key)
+
+    async def get(self, request: Request, pk: int) -> HttpResponse:
+        """Return a single profile"""
+        profile_qs = UserProfile.active().select_related("user").filter(pk=pk)
+        (key, cached), state = await asyncio.gather(
+            cache_to_async(self.get_cached)(pk),
+            profile_qs.values_list(
+                "updated_at",
+                "user__username",
+                "follower_count",
+                "following_count",
+                "post_count",
+            ).afirst(),
+        )
+        if state is None:
+            raise exceptions.NotFound()
+
+        async def get_response() -> HttpResponse:
+            if cached is not None:
+                cache_metrics["profile_detail.hit"] += 1
+                response = self.render(cached)
+                response["X-Cache"] = "HIT"
+                return response
+
+            cache_metrics["profile_detail.miss"] += 1
+            user_profile = await profile_qs.aget()
+            data = UserProfileSerializer(
+                user_profile, context={"request": request}
+            ).data
+            await cache_to_async(cache.set)(key, data, settings.PROFILE_CACHE_TTL)
+            response = self.render(data)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return await aconditional_response(request, state, state[0], get_response)
+
+
+class AsyncCommentListView(AsyncAPIView):
+    query_budget = 4
+
+    async def get(self, request: Request, post_pk: int) -> HttpResponse:
+        """
+        Return the threads of the post, newest first,
+        with the first replies of each thread
+        """
+        comment_qs = Comment.visible().filter(post_id=post_pk)
+        post, state = await asyncio.gather(
+            Post.visible_to(request.user.profile).filter(pk=post_pk).afirst(),
+            Comment.objects.filter(post_id=post_pk).aaggregate(
+                **Comment.get_list_state()
+            ),
+        )
+        if post is None:
+            raise exceptions.NotFound()
+
+        # Deleting a comment only shows up in the post counter and timestamp
+        return await aconditional_response(
+            request,
+            (post.comment_count, post.updated_at, *state.values()),
+            max([post.updated_at, *filter(None, state.values())]),
+            lambda: self.paginate(
+                comment_qs.filter(parent__isnull=True).select_related(
+                    "user_profile__user"
+                ),
+                CommentThreadSerializer,
+                self.attach_replies,
+            ),
+        )
+
+    @staticmethod
+    async def attach_replies(roots: list[Comment]) -> None:
+        replies = Comment.get_reply_previews([root.id for root in roots])
+        Comment.attach_replies(roots, [reply async for reply in replies])
+
+
+class AsyncEventStreamView(AsyncAPIView):
+    """
+    Server-sent events with the likes, comments and follows aimed at
+    the profile. Open streams only hold a queue on the event loop.
+    EventSource can't send headers, browsers pass a ticket instead.
+    """
+
+    authentication_class = TicketAuthentication
+    query_budget = 0
+
+    async def get(self, request: Request) -> StreamingHttpResponse:
+        """Stream activity events of the authenticated profile"""
+        response = StreamingHttpResponse(
+            self.stream(get_profile_channel(request.user.profile.id)),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    async def stream(channel: str) -> AsyncIterator[str]:
+        async with get_event_bus().subscribe(channel) as queue:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), settings.EVENT_STREAM_HEARTBEAT_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                # Let a burst build up and send it as one message per post
+                await asyncio.sleep(settings.EVENT_STREAM_COALESCE_WINDOW)
+                events = [event]
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+
+                for event in coalesce_events(events):
+                    yield format_event(event)
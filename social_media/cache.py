@@ -0,0 +1,84 @@
+import hashlib
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+PROFILE_LIST_VERSION_KEY = "profile:list:version"
+
+cache_metrics = Counter()
+
+
+def get_profile_version_key(user_profile_id: int | str) -> str:
+    return f"profile:{user_profile_id}:version"
+
+
+def get_version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted version is never reused
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_profile_versions(*user_profile_ids: int) -> None:
+    """
+    Invalidate cached responses of the profiles once the changes commit.
+    List pages show every profile field, so any profile write drops them.
+    """
+
+    def bump() -> None:
+        for user_profile_id in user_profile_ids:
+            bump_version(get_profile_version_key(user_profile_id))
+        bump_version(PROFILE_LIST_VERSION_KEY)
+
+    transaction.on_commit(bump)
+
+
+def cache_to_async(func: Callable) -> Callable[..., Awaitable]:
+    """
+    Run a cache call on the shared thread pool instead of the request thread.
+    Django runs every async ORM query on the request thread one by one,
+    so cache I/O awaited next to a query only overlaps it from another thread.
+    """
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def get_response_cache_key(prefix: str, version: int, request: Request) -> str:
+    url_hash = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+    return f"{prefix}:v{version}:{url_hash}"
+
+
+def get_cache_metrics() -> dict:
+    return dict(cache_metrics)
+
+
+def cached_response(
+    name: str, key: str, timeout: int, get_response: Callable[[], Response]
+) -> Response:
+    cached = cache.get(key)
+    if cached is not None:
+        cache_metrics[f"{name}.hit"] += 1
+        response = Response(cached)
+        response["X-Cache"] = "HIT"
+        return response
+
+    cache_metrics[f"{name}.miss"] += 1
+    response = get_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout)
+    response["X-Cache"] = "MISS"
+    return response
@@ -0,0 +1,80 @@
+import hashlib
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable
+
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.request import Request
+
+
+def get_etag(request: Request, version: Iterable) -> str:
+    """
+    Build a strong ETag of the representation.
+    The query string and the negotiated media type are part of it because
+    both change the rendered body. Validators are scoped to their URL
+    already, so the sync and async views of a resource share them.
+    """
+    fingerprint = repr(
+        (request.META["QUERY_STRING"], request.accepted_media_type, tuple(version))
+    )
+    return quote_etag(hashlib.sha256(fingerprint.encode()).hexdigest())
+
+
+def get_precondition_response(
+    request: Request, etag: str, last_modified: int | None
+) -> HttpResponseBase | None:
+    return get_conditional_response(
+        request._request, etag=etag, last_modified=last_modified
+    )
+
+
+def add_validators(
+    response: HttpResponseBase, etag: str, last_modified: int | None
+) -> HttpResponseBase:
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_response(
+    request: Request,
+    version: Iterable,
+    last_modified: datetime | None,
+    get_response: Callable[[], HttpResponseBase],
+) -> HttpResponseBase:
+    """
+    Answer 304 when the client already holds the current representation,
+    otherwise build the response and attach the validators to it.
+    """
+    etag = get_etag(request, version)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_precondition_response(request, etag, last_modified)
+    if response is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+
+    return add_validators(response, etag, last_modified)
+
+
+async def aconditional_response(
+    request: Request,
+    version: Iterable,
+    last_modified: datetime | None,
+    get_response: Callable[[], Awaitable[HttpResponseBase]],
+) -> HttpResponseBase:
+    """Async variant of conditional_response, the response is awaited"""
+    etag = get_etag(request, version)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_precondition_response(request, etag, last_modified)
+    if response is None:
+        response = await get_response()
+        if response.status_code != 200:
+            return response
+
+    return add_validators(response, etag, last_modified)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import cache
+from typing import AsyncIterator
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def get_profile_channel(user_profile_id: int) -> str:
+    return f"events:profile:{user_profile_id}"
+
+
+def encode_event(event: dict) -> str:
+    return json.dumps(event, cls=DjangoJSONEncoder)
+
+
+class EventBus:
+    """
+    Publish events to profile channels and fan them out to the streams
+    open in this process, one bounded queue per stream.
+    """
+
+    def __init__(self) -> None:
+        self.queues = defaultdict(dict)
+        self.lock = threading.Lock()
+        self.subscription_lock = None
+
+    def publish(self, channel: str, event: dict) -> None:
+        raise NotImplementedError
+
+    async def add_channel(self, channel: str) -> None:
+        """Called before the first stream of the process joins the channel"""
+
+    async def remove_channel(self, channel: str) -> None:
+        """Called after the last stream of the process left the channel"""
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        if self.subscription_lock is None:
+            self.subscription_lock = asyncio.Lock()
+        queue = asyncio.Queue(settings.EVENT_STREAM_QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+
+        async with self.subscription_lock:
+            with self.lock:
+                is_first = not self.queues[channel]
+                self.queues[channel][queue] = loop
+            if is_first:
+                await self.add_channel(channel)
+
+        try:
+            yield queue
+        finally:
+            async with self.subscription_lock:
+                with self.lock:
+                    del self.queues[channel][queue]
+                    is_last = not self.queues[channel]
+                    if is_last:
+                        del self.queues[channel]
+                if is_last:
+                    await self.remove_channel(channel)
+
+    def deliver(self, channel: str, event: dict) -> None:
+        """Hand the event to the local streams, safe to call from any thread"""
+        with self.lock:
+            queues = list(self.queues.get(channel, {}).items())
+
+        for queue, loop in queues:
+            loop.call_soon_threadsafe(self.put_latest, queue, event)
+
+    @staticmethod
+    def put_latest(queue: asyncio.Queue, event: dict) -> None:
+        # A stream that can't keep up loses its oldest events
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+class InMemoryEventBus(EventBus):
+    """Deliver events within the process, for tests and single process setups"""
+
+    def publish(self, channel: str, event: dict) -> None:
+        self.deliver(channel, json.loads(encode_event(event)))
+
+
+class RedisEventBus(EventBus):
+    """
+    Publish through Redis pub/sub. Each process holds one subscriber
+    connection for all of its streams and joins only the channels
+    of the profiles that have a stream open.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.url = settings.EVENT_BUS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self.pubsub = None
+        self.listener = None
+
+    def publish(self, channel: str, event: dict) -> None:
+        self.client.publish(channel, encode_event(event))
+
+    async def add_channel(self, channel: str) -> None:
+        if self.pubsub is None:
+            self.pubsub = redis.asyncio.Redis.from_url(self.url).pubsub(
+                ignore_subscribe_messages=True
+            )
+        await self.pubsub.subscribe(channel)
+
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen())
+
+    async def remove_channel(self, channel: str) -> None:
+        await self.pubsub.unsubscribe(channel)
+
+    async def listen(self) -> None:
+        # Runs while any stream is open, add_channel restarts it afterwards
+        while self.queues:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except redis.RedisError:
+                logger.warning("Event bus connection lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+                continue
+
+            if message is not None and message["type"] == "message":
+                self.deliver(message["channel"].decode(), json.loads(message["data"]))
+
+
+@cache
+def get_event_bus() -> EventBus:
+    return import_string(settings.EVENT_BUS_BACKEND)()
+
+
+def publish_event(
+    user_profile_id: int, event_type: str, actor_id: int, **data: int
+) -> None:
+    """
+    Push an event to the streams of the profile once the transaction commits.
+    Profiles aren't notified about their own actions.
+    """
+    if user_profile_id == actor_id:
+        return
+
+    event = {
+        "type": event_type,
+        "actor_id": actor_id,
+        **data,
+        "created_at": timezone.now(),
+    }
+    transaction.on_commit(
+        lambda: get_event_bus().publish(get_profile_channel(user_profile_id), event),
+        robust=True,
+    )
+
+
+def coalesce_events(events: list[dict]) -> list[dict]:
+    """
+    Merge a burst into one event per type and post, keeping the latest
+    payload and the number of merged events as count.
+    """
+    merged = {}
+    for event in events:
+        key = (event["type"], event.get("post_id"))
+        previous = merged.pop(key, None)
+        merged[key] = {**event, "count": previous["count"] + 1 if previous else 1}
+    return list(merged.values())
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {encode_event(event)}\n\n"
@@ -0,0 +1,120 @@
+import gzip
+import json
+import tarfile
+from tempfile import TemporaryFile
+from typing import IO, Iterator
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, QuerySet
+
+from social_media.models import DataExport, UserProfile, Post, Comment
+from social_media.storage import get_media_storage
+
+FollowThrough = UserProfile.followers.through
+LikeThrough = Post.likes.through
+
+
+def iter_rows(queryset: QuerySet) -> Iterator[dict]:
+    return queryset.order_by().iterator(chunk_size=settings.DATA_EXPORT_CHUNK_SIZE)
+
+
+def iter_export_records(user_profile: UserProfile) -> Iterator[dict]:
+    """Yield every record of the profile, one JSON object per line"""
+    yield {
+        "type": "profile",
+        "id": user_profile.id,
+        "username": user_profile.user.username,
+        "email": user_profile.user.email,
+        "bio": user_profile.bio,
+        "profile_picture": user_profile.profile_picture.name,
+    }
+
+    posts = Post.objects.filter(user_profile=user_profile).values(
+        "id", "content", "image", "like_count", "comment_count", "created_at"
+    )
+    for post in iter_rows(posts):
+        yield {"type": "post", **post}
+
+    comments = Comment.objects.filter(user_profile=user_profile).values(
+        "id", "post_id", "content", "created_at"
+    )
+    for comment in iter_rows(comments):
+        yield {"type": "comment", **comment}
+
+    likes = LikeThrough.objects.filter(userprofile=user_profile).values("post_id")
+    for like in iter_rows(likes):
+        yield {"type": "like", **like}
+
+    # from_userprofile is the followed profile, to_userprofile the follower
+    followings = FollowThrough.objects.filter(to_userprofile=user_profile).values(
+        profile_id=F("from_userprofile_id"),
+        username=F("from_userprofile__user__username"),
+    )
+    for following in iter_rows(followings):
+        yield {"type": "following", **following}
+
+    followers = FollowThrough.objects.filter(from_userprofile=user_profile).values(
+        profile_id=F("to_userprofile_id"),
+        username=F("to_userprofile__user__username"),
+    )
+    for follower in iter_rows(followers):
+        yield {"type": "follower", **follower}
+
+
+def iter_media_names(user_profile: UserProfile) -> Iterator[str]:
+    if user_profile.profile_picture:
+        yield user_profile.profile_picture.name
+
+    images = (
+        Post.objects.filter(user_profile=user_profile)
+        .exclude(image="")
+        .values_list("image", flat=True)
+        .distinct()
+    )
+    yield from iter_rows(images)
+
+
+def write_ndjson(records: Iterator[dict], output: IO[bytes]) -> None:
+    with gzip.GzipFile(fileobj=output, mode="wb") as archive:
+        for record in records:
+            archive.write(json.dumps(record, cls=DjangoJSONEncoder).encode() + b"\n")
+
+
+def write_media_archive(user_profile: UserProfile, output: IO[bytes]) -> None:
+    """Bundle the compressed records with the original media in a tar"""
+    storage = get_media_storage()
+
+    with TemporaryFile() as records, tarfile.open(fileobj=output, mode="w|") as tar:
+        write_ndjson(iter_export_records(user_profile), records)
+        info = tarfile.TarInfo("data.ndjson.gz")
+        info.size = records.tell()
+        records.seek(0)
+        tar.addfile(info, records)
+
+        for name in iter_media_names(user_profile):
+            if not storage.exists(name):
+                continue
+
+            info = tarfile.TarInfo(f"media/{name}")
+            info.size = storage.size(name)
+            with storage.open(name) as media:
+                tar.addfile(info, media)
+
+
+def build_export(export: DataExport) -> None:
+    """
+    Write the export archive without holding more than one chunk of rows
+    or one media file in memory.
+    """
+    with TemporaryFile() as output:
+        if export.include_media:
+            write_media_archive(export.user_profile, output)
+            name = f"{export.id}.tar"
+        else:
+            write_ndjson(iter_export_records(export.user_profile), output)
+            name = f"{export.id}.ndjson.gz"
+
+        output.seek(0)
+        export.file.save(name, File(output), save=False)
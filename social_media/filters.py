@@ -1,16 +1,39 @@
-from django.db.models import QuerySet, Q
+from django.db.models import QuerySet, Q, Exists, OuterRef
 from django.http import QueryDict
 from rest_framework.filters import BaseFilterBackend
 
+from social_media.helpers import normalize_hashtag
+from social_media.models import PostHashtag
+
 
 class HashtagSearchBackend(BaseFilterBackend):
+    match_query_param = "hashtags_match"
+
+    @staticmethod
+    def get_hashtags_from_query_params(query_params: QueryDict) -> list[str]:
+        hashtags = (
+            normalize_hashtag(hashtag) for hashtag in query_params.getlist("hashtags")
+        )
+        return [hashtag for hashtag in hashtags if hashtag]
 
     @staticmethod
-    def get_q_filters_from_query_params(query_params: QueryDict) -> Q:
-        q = Q()
-        for hashtag in query_params.getlist("hashtags"):
-            q |= Q(content__icontains=f"#{hashtag}")
-        return q
+    def has_hashtags(hashtags: list[str]) -> Exists:
+        return Exists(
+            PostHashtag.objects.filter(post=OuterRef("pk"), hashtag__name__in=hashtags)
+        )
+
+    def get_q_filters_from_query_params(self, query_params: QueryDict) -> Q:
+        hashtags = self.get_hashtags_from_query_params(query_params)
+        if not hashtags:
+            return Q()
+
+        if query_params.get(self.match_query_param) == "all":
+            q = Q()
+            for hashtag in hashtags:
+                q &= Q(self.has_hashtags([hashtag]))
+            return q
+
+        return Q(self.has_hashtags(hashtags))
 
     def filter_queryset(self, request, queryset, view) -> QuerySet:
         filters = self.get_q_filters_from_query_params(request.query_params)
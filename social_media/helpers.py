@@ -1,3 +1,4 @@
+import re
 import uuid
 from pathlib import Path
 
@@ -9,3 +10,23 @@ def upload_image_file_path(instance, filename: str) -> Path:
     filename = Path(f"{slugify(instance.id)}-{uuid.uuid4()}{extension}")
     directory = Path("upload", instance.__class__.__name__.lower())
     return directory / filename
+
+
+HASHTAG_PATTERN = re.compile(r"#(\w+)")
+HASHTAG_MAX_LENGTH = 100
+
+
+def normalize_hashtag(hashtag: str) -> str:
+    return hashtag.lstrip("#").lower()[:HASHTAG_MAX_LENGTH]
+
+
+def extract_hashtags(text: str) -> set[str]:
+    return {normalize_hashtag(hashtag) for hashtag in HASHTAG_PATTERN.findall(text)}
+
+
+COMMENT_PATH_SEGMENT_LENGTH = 13
+
+
+def get_comment_path_segment(comment_id: int) -> str:
+    """Zero padded so materialized paths sort in thread order"""
+    return f"{comment_id:0{COMMENT_PATH_SEGMENT_LENGTH - 1}d}/"
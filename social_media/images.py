@@ -0,0 +1,75 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import FieldFile
+from PIL import Image, ImageOps
+
+IMAGE_VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def open_image(image: FieldFile) -> Image.Image:
+    with image.open("rb") as image_file:
+        pil_image = Image.open(image_file)
+        pil_image = ImageOps.exif_transpose(pil_image)
+        pil_image.load()
+
+    if pil_image.mode not in ("RGB", "RGBA"):
+        pil_image = pil_image.convert("RGBA" if "A" in pil_image.getbands() else "RGB")
+
+    return pil_image
+
+
+def encode_image(pil_image: Image.Image, image_format: str) -> bytes:
+    if image_format == "JPEG" and pil_image.mode == "RGBA":
+        background = Image.new("RGB", pil_image.size, (255, 255, 255))
+        background.paste(pil_image, mask=pil_image.getchannel("A"))
+        pil_image = background
+
+    buffer = BytesIO()
+    # No exif is passed, so the metadata of the original is stripped
+    pil_image.save(
+        buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True
+    )
+    return buffer.getvalue()
+
+
+def build_image_variants(image: FieldFile) -> dict:
+    """
+    Encode resized variants of the image next to the original and
+    return a map of variant name to dimensions and stored file names.
+    """
+    pil_image = open_image(image)
+    base_path = PurePosixPath(image.name).with_suffix("")
+
+    variants = {
+        "original": {"width": pil_image.width, "height": pil_image.height},
+    }
+    for variant_name, max_size in settings.IMAGE_VARIANTS.items():
+        variant_image = pil_image.copy()
+        variant_image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+        variant = {"width": variant_image.width, "height": variant_image.height}
+        for extension, image_format in IMAGE_VARIANT_FORMATS.items():
+            name = str(base_path / f"{variant_name}.{extension}")
+            variant[extension] = image.storage.save(
+                name, ContentFile(encode_image(variant_image, image_format))
+            )
+
+        variants[variant_name] = variant
+
+    return variants
+
+
+def get_variant_file_names(variants: dict) -> list[str]:
+    """
+    One name per stored variant file. Small images encode to the same
+    bytes at every size, so names repeat once per reference they hold.
+    """
+    return [
+        variant[extension]
+        for variant in variants.values()
+        for extension in IMAGE_VARIANT_FORMATS
+        if extension in variant
+    ]
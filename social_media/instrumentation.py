@@ -0,0 +1,165 @@
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Callable
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+query_metrics = defaultdict(Counter)
+
+# Savepoints depend on how deeply the request is nested in transactions
+TRANSACTION_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+    @property
+    def duplicates(self) -> int:
+        """Queries repeating the SQL of an earlier one, a sign of N+1"""
+        return sum(count - 1 for count in self.statements.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(TRANSACTION_STATEMENTS):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+def get_view_class(func: Callable) -> type | None:
+    """DRF views keep their class in cls, plain Django views in view_class"""
+    return getattr(func, "cls", None) or getattr(func, "view_class", None)
+
+
+def get_view_name(request: HttpRequest) -> str | None:
+    match = request.resolver_match
+    if match is None:
+        return None
+
+    view = get_view_class(match.func)
+    actions = getattr(match.func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{view.__name__}.{action}" if view else match.view_name
+
+
+def get_query_budget(request: HttpRequest) -> int | None:
+    """
+    Read query_budget of the resolved view,
+    either one number or a mapping of viewset actions to numbers.
+    """
+    match = request.resolver_match
+    view = get_view_class(match.func) if match else None
+    budget = getattr(view, "query_budget", None)
+    if isinstance(budget, dict):
+        actions = getattr(match.func, "actions", None) or {}
+        budget = budget.get(actions.get(request.method.lower()))
+    return budget
+
+
+def get_query_metrics() -> dict:
+    return {name: dict(metrics) for name, metrics in query_metrics.items()}
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record count, total time and duplicates of the SQL run by each request.
+    The numbers are aggregated per view, logged, and sent as
+    response headers when QUERY_INSTRUMENTATION_HEADERS is on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = QueryStats()
+        with self.instrument(stats):
+            response = self.get_response(request)
+        return self.process_response(request, response, stats)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        # Connections are per thread and async ORM queries run on the
+        # request's sync thread, so the wrappers are installed over there
+        stats = QueryStats()
+        stack = await sync_to_async(self.instrument)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.process_response(request, response, stats)
+
+    @staticmethod
+    def instrument(stats: QueryStats) -> ExitStack:
+        """Enter an execute wrapper on every connection of the calling thread"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponse, stats: QueryStats
+    ) -> HttpResponse:
+        view_name = get_view_name(request)
+        if view_name is None:
+            return response
+
+        budget = get_query_budget(request)
+        response.query_stats = stats
+        response.query_budget = budget
+        self.record(view_name, stats, budget)
+
+        if settings.QUERY_INSTRUMENTATION_HEADERS:
+            response["X-DB-Query-Count"] = stats.count
+            response["X-DB-Time-Ms"] = f"{stats.duration * 1000:.2f}"
+            response["X-DB-Duplicate-Queries"] = stats.duplicates
+            if budget is not None:
+                response["X-DB-Query-Budget"] = budget
+
+        return response
+
+    @staticmethod
+    def record(view_name: str, stats: QueryStats, budget: int | None) -> None:
+        metrics = query_metrics[view_name]
+        metrics["requests"] += 1
+        metrics["queries"] += stats.count
+        metrics["duplicates"] += stats.duplicates
+        metrics["time_us"] += int(stats.duration * 1_000_000)
+
+        logger.debug(
+            "%s ran %d queries in %.2f ms, %d duplicated",
+            view_name,
+            stats.count,
+            stats.duration * 1000,
+            stats.duplicates,
+        )
+        if budget is not None and stats.count > budget:
+            metrics["over_budget"] += 1
+            logger.warning(
+                "%s ran %d queries, its budget is %d",
+                view_name,
+                stats.count,
+                budget,
+            )
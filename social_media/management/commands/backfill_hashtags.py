@@ -0,0 +1,33 @@
+from typing import Any
+
+from django.core.management import BaseCommand
+
+from social_media.models import Post, Hashtag
+
+
+class Command(BaseCommand):
+    help = "Extract hashtags of existing posts into the hashtag tables"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        chunk_size = options["chunk_size"]
+        last_id = 0
+        processed = 0
+
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", "content")[:chunk_size]
+            )
+            if not posts:
+                break
+
+            Hashtag.sync_posts(posts)
+            last_id = posts[-1].id
+            processed += len(posts)
+            self.stdout.write(f"Processed {processed} posts...")
+
+        self.stdout.write(self.style.SUCCESS("Hashtags backfilled!"))
@@ -0,0 +1,227 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from knox.models import AuthToken
+
+from social_media.models import UserProfile, Post, Comment
+
+API_PREFIX = "/api/v1/social-media/"
+
+
+def get_git_revision() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    try:
+        return {"rev": git("rev-parse", "HEAD"), "dirty": bool(git("status", "-s"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"rev": None, "dirty": None}
+
+
+def summarize(latencies: list[float], errors: int, wall_time: float) -> dict:
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_time, 2),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3),
+            "p50": round(percentiles[49] * 1000, 3),
+            "p90": round(percentiles[89] * 1000, 3),
+            "p95": round(percentiles[94] * 1000, 3),
+            "p99": round(percentiles[98] * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+    }
+
+
+class Client:
+    def __init__(self, base_url: str, token: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def request(self, method: str, path: str) -> tuple[float, bool]:
+        request = urllib.request.Request(
+            self.base_url + API_PREFIX + path,
+            method=method,
+            headers={"Authorization": f"Token {self.token}"},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = response.status < 400
+        except urllib.error.HTTPError as error:
+            ok = error.code < 400
+        return time.perf_counter() - start, ok
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the main endpoints against a running server "
+        "and write throughput and latency percentiles as JSON"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark.json")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        rng = random.Random(options["seed"])
+        profiles = list(
+            UserProfile.objects.filter(
+                user__username__startswith=options["prefix"], post_count__gt=0
+            )
+            .select_related("user")
+            .order_by("id")[: options["users"]]
+        )
+        if not profiles:
+            raise CommandError(
+                "No generated users found, run generate_social_graph first"
+            )
+
+        profile_ids = list(
+            UserProfile.objects.filter(
+                user__username__startswith=options["prefix"]
+            ).values_list("id", flat=True)
+        )
+        tokens = {
+            profile.id: AuthToken.objects.create(profile.user) for profile in profiles
+        }
+        # Writes only touch rows the user isn't linked to yet, undoing them
+        # right after keeps the data set identical between runs
+        own_posts = {
+            profile.id: list(
+                Post.objects.filter(user_profile=profile)
+                .exclude(likes=profile)
+                .order_by("-comment_count")
+                .values_list("id", flat=True)[:10]
+            )
+            for profile in profiles
+        }
+        unfollowed = {
+            profile.id: list(
+                set(rng.sample(profile_ids, min(len(profile_ids), 50)))
+                - set(profile.followings.values_list("id", flat=True))
+                - {profile.id}
+            )
+            for profile in profiles
+        }
+        profiles = [
+            profile
+            for profile in profiles
+            if own_posts[profile.id] and unfollowed[profile.id]
+        ]
+
+        def session(profile: UserProfile) -> Client:
+            return Client(options["base_url"], tokens[profile.id][1])
+
+        def read(path: Callable[[UserProfile], str]) -> Callable[[], list]:
+            def run() -> list:
+                profile = rng.choice(profiles)
+                return [session(profile).request("GET", path(profile))]
+
+            return run
+
+        def toggle(action: str, undo: str, targets: dict[int, list]) -> Callable:
+            def run() -> list:
+                profile = rng.choice(profiles)
+                target = rng.choice(targets[profile.id])
+                client = session(profile)
+                return [
+                    client.request("POST", action.format(target)),
+                    client.request("POST", undo.format(target)),
+                ]
+
+            return run
+
+        scenarios = {
+            "feed": read(lambda profile: "posts/"),
+            "liked_post": read(lambda profile: "posts/liked_post/"),
+            "profile_list": read(lambda profile: "user-profiles/"),
+            "comments": read(
+                lambda profile: f"posts/{rng.choice(own_posts[profile.id])}/comments/"
+            ),
+            "async_feed": read(lambda profile: "async/posts/"),
+            "async_comments": read(
+                lambda profile: (
+                    f"async/posts/{rng.choice(own_posts[profile.id])}/comments/"
+                )
+            ),
+            "follow_unfollow": toggle(
+                "user-profiles/{}/follow/", "user-profiles/{}/unfollow/", unfollowed
+            ),
+            "like_unlike": toggle("posts/{}/like/", "posts/{}/unlike/", own_posts),
+        }
+
+        results = {}
+        try:
+            for name, scenario in scenarios.items():
+                self.stdout.write(f"Running {name}...")
+                results[name] = self.run_scenario(scenario, options)
+        finally:
+            AuthToken.objects.filter(
+                digest__in=[token.digest for token, _ in tokens.values()]
+            ).delete()
+
+        report = {
+            "git": get_git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "config": {
+                name: options[name]
+                for name in ["users", "requests", "concurrency", "warmup", "seed"]
+            },
+            "dataset": {
+                "profiles": len(profile_ids),
+                "posts": Post.objects.count(),
+                "comments": Comment.objects.count(),
+                "follows": UserProfile.followers.through.objects.count(),
+                "likes": Post.likes.through.objects.count(),
+            },
+            "endpoints": results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    @staticmethod
+    def run_scenario(scenario: Callable[[], list], options: dict) -> dict:
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            list(executor.map(lambda _: scenario(), range(options["warmup"])))
+
+            start = time.perf_counter()
+            samples = [
+                sample
+                for samples in executor.map(
+                    lambda _: scenario(), range(options["requests"])
+                )
+                for sample in samples
+            ]
+            wall_time = time.perf_counter() - start
+
+        latencies = [latency for latency, _ in samples]
+        errors = sum(not ok for _, ok in samples)
+        return summarize(latencies, errors, wall_time)
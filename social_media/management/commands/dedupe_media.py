@@ -0,0 +1,104 @@
+from typing import Any
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management import BaseCommand
+from django.db.models import Model
+
+from social_media.images import IMAGE_VARIANT_FORMATS
+from social_media.models import Post, PostponedPost, UserProfile
+from social_media.storage import ContentAddressedStorage
+
+MEDIA_FIELDS = [
+    (Post, "image"),
+    (PostponedPost, "image"),
+    (UserProfile, "profile_picture"),
+]
+
+
+class Command(BaseCommand):
+    help = "Move existing uploaded media into the content-addressed storage"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--keep-originals",
+            action="store_true",
+            help="Don't remove the original files after migrating them",
+        )
+
+    def migrate_file(self, storage: ContentAddressedStorage, name: str) -> str | None:
+        if name.startswith(storage.blob_directory + "/"):
+            return name
+
+        if not storage.exists(name):
+            self.stderr.write(f"Missing file {name}, skipping")
+            return None
+
+        self.migrated_files[name] = storage
+        with storage.open(name, "rb") as media_file:
+            return storage.save(name, media_file)
+
+    def migrate_variants(
+        self, storage: ContentAddressedStorage, variants: dict
+    ) -> dict:
+        migrated_variants = {}
+        for variant_name, variant in variants.items():
+            migrated_variant = dict(variant)
+            for extension in IMAGE_VARIANT_FORMATS:
+                if extension in variant:
+                    migrated_variant[extension] = self.migrate_file(
+                        storage, variant[extension]
+                    )
+
+            if None not in migrated_variant.values():
+                migrated_variants[variant_name] = migrated_variant
+
+        return migrated_variants
+
+    def migrate_model(
+        self, model: type[Model], field_name: str, chunk_size: int
+    ) -> None:
+        storage = model._meta.get_field(field_name).storage
+        if not isinstance(storage, ContentAddressedStorage):
+            self.stderr.write(f"{model.__name__}.{field_name} is not content-addressed")
+            return
+
+        rows = (
+            model.objects.exclude(**{field_name: ""})
+            .exclude(**{f"{field_name}__startswith": storage.blob_directory + "/"})
+            .order_by("id")
+            .values_list("id", field_name, "image_variants")
+        )
+        last_id = 0
+        migrated = 0
+
+        while True:
+            chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+
+            for pk, name, variants in chunk:
+                blob_name = self.migrate_file(storage, name)
+                if blob_name is not None:
+                    model.objects.filter(pk=pk).update(
+                        **{field_name: blob_name},
+                        image_variants=self.migrate_variants(storage, variants),
+                    )
+                    migrated += 1
+
+            last_id = chunk[-1][0]
+
+        self.stdout.write(f"{model.__name__}: migrated {migrated} files")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.migrated_files = {}
+
+        for model, field_name in MEDIA_FIELDS:
+            self.migrate_model(model, field_name, options["chunk_size"])
+
+        # Originals can be shared by several rows, so remove them only at the end
+        if not options["keep_originals"]:
+            for name, storage in self.migrated_files.items():
+                FileSystemStorage.delete(storage, name)
+
+        self.stdout.write(self.style.SUCCESS("Media deduplicated!"))
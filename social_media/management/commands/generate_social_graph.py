@@ -0,0 +1,392 @@
+import random
+from collections import Counter
+from datetime import timedelta
+from itertools import accumulate, islice
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Model
+from django.utils import timezone
+
+from social_media.cache import bump_profile_versions
+from social_media.helpers import get_comment_path_segment
+from social_media.models import UserProfile, Post, Comment, Hashtag, PostHashtag
+
+User = get_user_model()
+FollowThrough = UserProfile.followers.through
+LikeThrough = Post.likes.through
+
+WORDS = (
+    "coffee morning city light river music friends weekend travel story "
+    "garden coding photo sunset mountain book dinner rain summer idea"
+).split()
+
+
+def pareto_count(rng: random.Random, mean: float, alpha: float, limit: int) -> int:
+    """Heavy tailed non negative count with the given mean"""
+    if mean <= 0:
+        return 0
+    value = mean * (alpha - 1) / alpha * rng.paretovariate(alpha)
+    return min(limit, int(value))
+
+
+def reserve_ids(model: type[Model], count: int) -> list[int]:
+    """Take ids from the table sequence so rows can be copied with their ids"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def iter_chunks(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def iter_shuffled(counts: list[int], rng: random.Random) -> Iterator[int]:
+    """
+    Yield every index as often as its count in random order, like shuffling
+    the expanded list while only holding the counts. A Fenwick tree of the
+    remaining counts picks each next index in O(log n).
+    """
+    size = len(counts)
+    tree = [0, *counts]
+    for index in range(1, size + 1):
+        parent = index + (index & -index)
+        if parent <= size:
+            tree[parent] += tree[index]
+
+    top_step = 1 << max(size.bit_length() - 1, 0)
+    for remaining in range(sum(counts), 0, -1):
+        target = rng.randrange(remaining)
+        position, step = 0, top_step
+        while step:
+            if position + step <= size and tree[position + step] <= target:
+                position += step
+                target -= tree[position]
+            step >>= 1
+        yield position
+
+        index = position + 1
+        while index <= size:
+            tree[index] -= 1
+            index += index & -index
+
+
+def copy_rows(model: type[Model], columns: list[str], rows: Iterable) -> int:
+    copied = 0
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN"
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+                copied += 1
+    return copied
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate users with a power law follower graph, posts, likes "
+        "and comments for load testing"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--avg-followings", type=float, default=50)
+        parser.add_argument("--avg-posts", type=float, default=10)
+        parser.add_argument("--avg-likes", type=float, default=5)
+        parser.add_argument("--avg-comments", type=float, default=2)
+        parser.add_argument(
+            "--alpha",
+            type=float,
+            default=2.1,
+            help="Power law exponent of the degree distributions",
+        )
+        parser.add_argument("--hashtags", type=int, default=200)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--password", default="benchmark")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if connection.vendor != "postgresql":
+            raise CommandError("Generating a social graph needs PostgreSQL COPY")
+        if options["alpha"] <= 1:
+            raise CommandError("--alpha must be greater than 1")
+        if User.objects.filter(username__startswith=options["prefix"]).exists():
+            raise CommandError(
+                f"Users prefixed {options['prefix']!r} exist, pass another --prefix"
+            )
+
+        self.options = options
+        self.now = timezone.now()
+
+        # Chunks commit one by one, a failed run keeps the ones before it
+        profile_ids = self.create_profiles()
+        self.create_follows(profile_ids)
+        self.create_posts(profile_ids)
+        bump_profile_versions()
+
+        if settings.TIMELINE_FANOUT_ENABLED:
+            call_command("rebuild_timelines", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Social graph generated!"))
+
+    def iter_followings(self) -> Iterator[tuple[int, set[int]]]:
+        """
+        Yield the followed user indexes of every user index.
+        Popularity follows Zipf's law so follower counts get a power law tail,
+        the same seed always yields the same graph.
+        """
+        users = self.options["users"]
+        alpha = self.options["alpha"]
+        rng = random.Random(self.options["seed"])
+        indexes = range(users)
+        cum_weights = list(
+            accumulate((rank + 1) ** (-1 / (alpha - 1)) for rank in indexes)
+        )
+
+        for index in indexes:
+            count = pareto_count(rng, self.options["avg_followings"], alpha, users - 1)
+            followings = set(rng.choices(indexes, cum_weights=cum_weights, k=count))
+            followings.discard(index)
+            yield index, followings
+
+    def create_profiles(self) -> list[int]:
+        users = self.options["users"]
+        prefix = self.options["prefix"]
+        rng = random.Random(self.options["seed"] + 1)
+
+        follower_counts = Counter()
+        following_counts = {}
+        for index, followings in self.iter_followings():
+            following_counts[index] = len(followings)
+            follower_counts.update(followings)
+
+        self.post_counts = [
+            pareto_count(rng, self.options["avg_posts"], self.options["alpha"], 10**6)
+            for _ in range(users)
+        ]
+
+        password = make_password(self.options["password"])
+        profile_ids = []
+        for indexes in iter_chunks(range(users), self.options["chunk_size"]):
+            with transaction.atomic():
+                user_ids = reserve_ids(User, len(indexes))
+                copy_rows(
+                    User,
+                    [
+                        "id",
+                        "password",
+                        "is_superuser",
+                        "username",
+                        "first_name",
+                        "last_name",
+                        "email",
+                        "is_staff",
+                        "is_active",
+                        "date_joined",
+                    ],
+                    (
+                        (
+                            user_id,
+                            password,
+                            False,
+                            f"{prefix}{index}",
+                            "",
+                            "",
+                            f"{prefix}{index}@example.com",
+                            False,
+                            True,
+                            self.now,
+                        )
+                        for index, user_id in zip(indexes, user_ids)
+                    ),
+                )
+
+                chunk_profile_ids = reserve_ids(UserProfile, len(indexes))
+                copy_rows(
+                    UserProfile,
+                    [
+                        "id",
+                        "user_id",
+                        "bio",
+                        "profile_picture",
+                        "image_variants",
+                        "follower_count",
+                        "following_count",
+                        "post_count",
+                        "unread_notification_count",
+                        "updated_at",
+                    ],
+                    (
+                        (
+                            profile_id,
+                            user_id,
+                            f"Benchmark user {index}",
+                            "",
+                            "{}",
+                            follower_counts[index],
+                            following_counts[index],
+                            self.post_counts[index],
+                            0,
+                            self.now,
+                        )
+                        for index, user_id, profile_id in zip(
+                            indexes, user_ids, chunk_profile_ids
+                        )
+                    ),
+                )
+            profile_ids += chunk_profile_ids
+        self.stdout.write(f"Created {users} users with profiles")
+        return profile_ids
+
+    def create_follows(self, profile_ids: list[int]) -> None:
+        # from_userprofile is the followed profile, to_userprofile the follower
+        follows = (
+            (profile_ids[following], profile_ids[index])
+            for index, followings in self.iter_followings()
+            for following in followings
+        )
+        copied = 0
+        for rows in iter_chunks(follows, self.options["chunk_size"]):
+            copied += copy_rows(
+                FollowThrough, ["from_userprofile_id", "to_userprofile_id"], rows
+            )
+        self.stdout.write(f"Created {copied} follows")
+
+    def create_posts(self, profile_ids: list[int]) -> None:
+        chunk_size = self.options["chunk_size"]
+        rng = random.Random(self.options["seed"] + 2)
+
+        hashtag_names = [f"tag{index}" for index in range(self.options["hashtags"])]
+        Hashtag.objects.bulk_create(
+            [Hashtag(name=name) for name in hashtag_names], ignore_conflicts=True
+        )
+        hashtag_ids = dict(
+            Hashtag.objects.filter(name__in=hashtag_names).values_list("name", "id")
+        )
+        hashtag_weights = list(
+            accumulate(1 / (rank + 1) for rank in range(len(hashtag_names)))
+        )
+
+        # Posts of all profiles in random order without listing them up front
+        authors = (
+            profile_ids[index]
+            for index in iter_shuffled(
+                self.post_counts, random.Random(self.options["seed"] + 3)
+            )
+        )
+        span = timedelta(days=self.options["days"]) / max(sum(self.post_counts), 1)
+        start = self.now - timedelta(days=self.options["days"])
+
+        created = Counter()
+        offset = 0
+        for chunk in iter_chunks(authors, chunk_size):
+            post_rows, like_rows, comment_rows, hashtag_rows = [], [], [], []
+
+            for post_id, author_id in zip(reserve_ids(Post, len(chunk)), chunk):
+                created_at = start + span * (offset + len(post_rows))
+                names = set(
+                    rng.choices(hashtag_names, cum_weights=hashtag_weights, k=2)
+                )
+                content = " ".join(rng.choices(WORDS, k=12)) + "".join(
+                    f" #{name}" for name in names
+                )
+                likers = rng.sample(
+                    profile_ids,
+                    pareto_count(
+                        rng,
+                        self.options["avg_likes"],
+                        self.options["alpha"],
+                        len(profile_ids),
+                    ),
+                )
+                commenters = rng.choices(
+                    profile_ids,
+                    k=pareto_count(
+                        rng, self.options["avg_comments"], self.options["alpha"], 1000
+                    ),
+                )
+
+                post_rows.append(
+                    (
+                        post_id,
+                        author_id,
+                        content,
+                        "",
+                        "{}",
+                        len(likers),
+                        len(commenters),
+                        created_at,
+                        created_at,
+                    )
+                )
+                like_rows += [(post_id, liker_id) for liker_id in likers]
+                comment_rows += [
+                    (post_id, commenter_id, rng.choice(WORDS), created_at, created_at)
+                    for commenter_id in commenters
+                ]
+                hashtag_rows += [(post_id, hashtag_ids[name]) for name in names]
+
+            # The rows of a chunk commit together
+            with transaction.atomic():
+                created["posts"] += copy_rows(
+                    Post,
+                    [
+                        "id",
+                        "user_profile_id",
+                        "content",
+                        "image",
+                        "image_variants",
+                        "like_count",
+                        "comment_count",
+                        "created_at",
+                        "updated_at",
+                    ],
+                    post_rows,
+                )
+                created["likes"] += copy_rows(
+                    LikeThrough, ["post_id", "userprofile_id"], like_rows
+                )
+                # Generated comments are thread roots
+                comment_ids = reserve_ids(Comment, len(comment_rows))
+                created["comments"] += copy_rows(
+                    Comment,
+                    [
+                        "id",
+                        "root_id",
+                        "path",
+                        "depth",
+                        "post_id",
+                        "user_profile_id",
+                        "content",
+                        "created_at",
+                        "updated_at",
+                    ],
+                    (
+                        (
+                            comment_id,
+                            comment_id,
+                            get_comment_path_segment(comment_id),
+                            0,
+                        )
+                        + row
+                        for comment_id, row in zip(comment_ids, comment_rows)
+                    ),
+                )
+                copy_rows(PostHashtag, ["post_id", "hashtag_id"], hashtag_rows)
+            offset += len(chunk)
+            self.stdout.write(
+                f"Created {created['posts']} posts, {created['likes']} likes "
+                f"and {created['comments']} comments..."
+            )
@@ -0,0 +1,17 @@
+from typing import Any
+
+from django.core.management import BaseCommand
+
+from social_media.models import UserProfile
+from social_media.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "Fill the materialized home timelines from the current follow graph"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        profiles = UserProfile.objects.order_by("id")
+        for user_profile in profiles.iterator(chunk_size=500):
+            rebuild_timeline(user_profile)
+
+        self.stdout.write(self.style.SUCCESS("Timelines rebuilt!"))
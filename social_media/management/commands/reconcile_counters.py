@@ -0,0 +1,82 @@
+from typing import Any
+
+from django.core.management import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, QuerySet, Model, Q, F
+from django.db.models.functions import Coalesce
+
+from social_media.models import UserProfile, Post, Comment, Notification
+
+FollowThrough = UserProfile.followers.through
+LikeThrough = Post.likes.through
+
+
+def count_subquery(queryset: QuerySet, field: str) -> Coalesce:
+    counts = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute denormalized like, comment, follower, post "
+        "and unread notification counters"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def reconcile(self, model: type[Model], batch_size: int, **counters) -> None:
+        ids = model.objects.order_by("id").values_list("id", flat=True)
+        last_id = 0
+        repaired = 0
+
+        while True:
+            batch_ids = list(ids.filter(id__gt=last_id)[:batch_size])
+            if not batch_ids:
+                break
+
+            drift_filter = Q()
+            for name in counters:
+                drift_filter |= ~Q(**{name: F(f"actual_{name}")})
+
+            drifted_ids = (
+                model.objects.filter(id__in=batch_ids)
+                .annotate(
+                    **{f"actual_{name}": value for name, value in counters.items()}
+                )
+                .filter(drift_filter)
+                .values_list("id", flat=True)
+            )
+            repaired += model.objects.filter(id__in=list(drifted_ids)).update(
+                **counters
+            )
+            last_id = batch_ids[-1]
+
+        self.stdout.write(f"{model.__name__}: repaired {repaired} rows")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        batch_size = options["batch_size"]
+
+        self.reconcile(
+            UserProfile,
+            batch_size,
+            follower_count=count_subquery(FollowThrough.objects, "from_userprofile"),
+            following_count=count_subquery(FollowThrough.objects, "to_userprofile"),
+            post_count=count_subquery(Post.objects, "user_profile"),
+            unread_notification_count=count_subquery(
+                Notification.objects.filter(is_read=False), "recipient"
+            ),
+        )
+        self.reconcile(
+            Post,
+            batch_size,
+            like_count=count_subquery(LikeThrough.objects, "post"),
+            comment_count=count_subquery(Comment.objects, "post"),
+        )
+
+        self.stdout.write(self.style.SUCCESS("Counters reconciled!"))
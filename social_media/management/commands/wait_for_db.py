@@ -1,22 +1,53 @@
 import time
 from typing import Any
 
+from django.core.management import BaseCommand, CommandError
 from django.db import connections
-from django.db.utils import OperationalError
-from django.core.management import BaseCommand
 
 
 class Command(BaseCommand):
+    help = "Wait for the database with exponential backoff"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--database", default="default")
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="Seconds to wait before giving up",
+        )
+        parser.add_argument("--initial-delay", type=float, default=0.1)
+        parser.add_argument("--max-delay", type=float, default=5)
 
     def handle(self, *args: Any, **options: Any) -> None:
         self.stdout.write("Waiting for database...")
 
-        db_conn = None
-        while not db_conn:
+        connection = connections[options["database"]]
+        deadline = time.monotonic() + options["timeout"]
+        delay = options["initial_delay"]
+
+        # Connect directly so a pool doesn't hold the attempts up
+        while True:
+            remaining = deadline - time.monotonic()
             try:
-                db_conn = connections["default"].cursor()
-            except OperationalError:
-                self.stdout.write("Database unavailable, waiting 1 second...")
-                time.sleep(1)
+                connection.Database.connect(
+                    **connection.get_connection_params(),
+                    connect_timeout=max(1, int(remaining)),
+                ).close()
+            except connection.Database.OperationalError as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f"Database unavailable after {options['timeout']:g} seconds"
+                    ) from error
+
+                wait = min(delay, remaining)
+                self.stdout.write(
+                    f"Database unavailable, waiting {wait:.1f} seconds..."
+                )
+                time.sleep(wait)
+                delay = min(delay * 2, options["max_delay"])
+            else:
+                break
 
-            self.stdout.write(self.style.SUCCESS("Database available!"))
+        self.stdout.write(self.style.SUCCESS("Database available!"))
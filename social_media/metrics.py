@@ -0,0 +1,15 @@
+from social_media.cache import get_cache_metrics
+from social_media.instrumentation import get_query_metrics
+from social_media_service.db.base import get_pool_metrics
+
+
+def get_metrics() -> dict:
+    """
+    Metrics of the calling process, each worker counts its own requests.
+    Scrapers should query every worker and add the numbers up.
+    """
+    return {
+        "queries": get_query_metrics(),
+        "cache": get_cache_metrics(),
+        "pools": get_pool_metrics(),
+    }
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0002_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["post", "-id"], name="comment_post_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["user_profile", "-id"], name="post_profile_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0003_post_comment_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Hashtag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                "ordering": ("name",),
+            },
+        ),
+        migrations.CreateModel(
+            name="PostHashtag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "hashtag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="post_hashtags",
+                        to="social_media.hashtag",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="post_hashtags",
+                        to="social_media.post",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="hashtags",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="posts",
+                through="social_media.PostHashtag",
+                to="social_media.hashtag",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="posthashtag",
+            constraint=models.UniqueConstraint(
+                fields=("hashtag", "post"), name="unique_post_hashtag"
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    counts = (
+        model.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def populate_counters(apps, schema_editor):
+    UserProfile = apps.get_model("social_media", "UserProfile")
+    Post = apps.get_model("social_media", "Post")
+    Comment = apps.get_model("social_media", "Comment")
+    FollowThrough = UserProfile.followers.through
+    LikeThrough = Post.likes.through
+
+    UserProfile.objects.update(
+        follower_count=count_subquery(FollowThrough, "from_userprofile"),
+        following_count=count_subquery(FollowThrough, "to_userprofile"),
+        post_count=count_subquery(Post, "user_profile"),
+    )
+    Post.objects.update(
+        like_count=count_subquery(LikeThrough, "post"),
+        comment_count=count_subquery(Comment, "post"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0004_hashtag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="follower_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="post_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_TRIGGER_SQL = """
+CREATE FUNCTION social_media_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('pg_catalog.english', coalesce(NEW.content, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER social_media_post_search_vector_trigger
+BEFORE INSERT OR UPDATE OF content ON social_media_post
+FOR EACH ROW EXECUTE FUNCTION social_media_post_search_vector_update();
+
+UPDATE social_media_post
+SET search_vector = to_tsvector('pg_catalog.english', coalesce(content, ''));
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS social_media_post_search_vector_trigger ON social_media_post;
+DROP FUNCTION IF EXISTS social_media_post_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0005_engagement_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="post_search_vector_idx"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0006_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="postponedpost",
+            index=models.Index(
+                condition=models.Q(("published", False)),
+                fields=["postponed_at"],
+                name="postponed_post_due_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0007_postponed_post_due_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="postponedpost",
+            name="task_id",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:45
+
+import social_media.helpers
+import social_media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0009_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("digest", models.CharField(db_index=True, max_length=64)),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ("name",),
+            },
+        ),
+        migrations.AlterField(
+            model_name="post",
+            name="image",
+            field=models.ImageField(
+                storage=social_media.storage.get_media_storage,
+                upload_to=social_media.helpers.upload_image_file_path,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="postponedpost",
+            name="image",
+            field=models.ImageField(
+                storage=social_media.storage.get_media_storage,
+                upload_to=social_media.helpers.upload_image_file_path,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="userprofile",
+            name="profile_picture",
+            field=models.ImageField(
+                storage=social_media.storage.get_media_storage,
+                upload_to=social_media.helpers.upload_image_file_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:17
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0013_data_export"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="unread_notification_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="Notification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "verb",
+                    models.CharField(
+                        choices=[
+                            ("like", "Like"),
+                            ("comment", "Comment"),
+                            ("follow", "Follow"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "actor_ids",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.IntegerField(), default=list, size=None
+                    ),
+                ),
+                ("actor_count", models.PositiveIntegerField(default=1)),
+                ("is_read", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="social_media.post",
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="social_media.userprofile",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("-updated_at", "-id"),
+                "indexes": [
+                    models.Index(
+                        fields=["recipient", "-updated_at", "-id"],
+                        name="notification_inbox_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_read", False)),
+                fields=("recipient", "verb", "post"),
+                name="unique_unread_notification",
+                nulls_distinct=False,
+            ),
+        ),
+    ]
@@ -0,0 +1,85 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+
+def make_comments_roots(apps, schema_editor):
+    Comment = apps.get_model("social_media", "Comment")
+    Comment.objects.update(
+        root_id=F("id"),
+        path=Concat(
+            LPad(Cast("id", models.CharField()), 12, Value("0")),
+            Value("/"),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0014_notifications"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="social_media.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(
+                db_collation="C", default="", editable=False, max_length=255
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="root",
+            field=models.ForeignKey(
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="social_media.comment",
+            ),
+        ),
+        migrations.RunPython(make_comments_roots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="comment",
+            name="root",
+            field=models.ForeignKey(
+                db_index=False,
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="social_media.comment",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("parent__isnull", True)),
+                fields=["post", "-id"],
+                name="comment_post_root_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["root", "path"], name="comment_root_path_idx"),
+        ),
+    ]
@@ -1,76 +1,907 @@
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
 from django.contrib.auth import get_user_model
-from django.db import models, transaction
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, models, transaction
+from django.db.models import F, Exists, OuterRef, Subquery, Count, Max, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
-from social_media.helpers import upload_image_file_path
+from social_media.cache import bump_profile_versions
+from social_media.events import publish_event
+from social_media.helpers import (
+    upload_image_file_path,
+    extract_hashtags,
+    get_comment_path_segment,
+    HASHTAG_MAX_LENGTH,
+)
+from social_media.storage import (
+    get_media_storage,
+    get_export_storage,
+    retain_media,
+)
 
 User = get_user_model()
 
 
-class UserProfile(models.Model):
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("name",)
+
+    def __str__(self) -> str:
+        return f"Media blob {self.name}"
+
+
+class CounterMixin:
+    @classmethod
+    def update_counters(cls, pk: int, **deltas: int) -> None:
+        cls.update_counters_many([pk], **deltas)
+
+    @classmethod
+    def update_counters_many(cls, pks: Iterable[int], **deltas: int) -> None:
+        cls.objects.filter(pk__in=pks).update(
+            **{name: F(name) + delta for name, delta in deltas.items()},
+            updated_at=timezone.now(),
+        )
+
+
+class UserProfile(CounterMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     bio = models.TextField()
-    profile_picture = models.ImageField(upload_to=upload_image_file_path)
+    profile_picture = models.ImageField(
+        upload_to=upload_image_file_path, storage=get_media_storage
+    )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     followers = models.ManyToManyField(
         "UserProfile", related_name="followings", blank=True
     )
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ("user",)
+        indexes = [
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="profile_deleted_at_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"User profile ID {self.pk}"
 
+    @classmethod
+    def active(cls) -> models.QuerySet:
+        """Profiles that are not soft deleted"""
+        return cls.objects.filter(deleted_at__isnull=True)
+
+    def soft_delete(self) -> None:
+        """
+        Hide the profile and its content at once,
+        the rows are deleted in the background by purge_profile.
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=["deleted_at", "updated_at"])
+        bump_profile_versions(self.pk)
+
+    @classmethod
+    def update_counters_many(cls, pks: Iterable[int], **deltas: int) -> None:
+        pks = list(pks)
+        super().update_counters_many(pks, **deltas)
+        bump_profile_versions(*pks)
+
+    def lock(self) -> None:
+        """Serialize changes to the follows and likes of the profile"""
+        list(UserProfile.objects.select_for_update().filter(pk=self.pk).values("pk"))
+
+    def add_follower(self, follower: "UserProfile") -> bool:
+        with transaction.atomic():
+            # Same lock as follow_many, so both don't count one follow twice
+            follower.lock()
+            _, created = UserProfile.followers.through.objects.get_or_create(
+                from_userprofile=self, to_userprofile=follower
+            )
+            if created:
+                UserProfile.update_counters(self.pk, follower_count=1)
+                UserProfile.update_counters(follower.pk, following_count=1)
+                Notification.notify(self.pk, Notification.Verb.FOLLOW, follower.pk)
+
+        return created
+
+    def remove_follower(self, follower: "UserProfile") -> bool:
+        with transaction.atomic():
+            follower.lock()
+            deleted, _ = UserProfile.followers.through.objects.filter(
+                from_userprofile=self, to_userprofile=follower
+            ).delete()
+            if deleted:
+                UserProfile.update_counters(self.pk, follower_count=-1)
+                UserProfile.update_counters(follower.pk, following_count=-1)
+
+        return bool(deleted)
+
+    def follow_many(self, user_profile_ids: Iterable[int]) -> dict[int, str]:
+        """Follow the profiles in bulk and return the outcome per profile id"""
+        FollowThrough = UserProfile.followers.through
+        results = dict.fromkeys(user_profile_ids, "not_found")
+
+        with transaction.atomic():
+            self.lock()
+            states = (
+                UserProfile.active()
+                .filter(id__in=results)
+                .annotate(
+                    followed=Exists(
+                        FollowThrough.objects.filter(
+                            from_userprofile=OuterRef("pk"), to_userprofile=self
+                        )
+                    )
+                )
+            )
+            created_ids = []
+            for user_profile_id, followed in states.values_list("id", "followed"):
+                if user_profile_id == self.pk:
+                    results[user_profile_id] = "self"
+                elif followed:
+                    results[user_profile_id] = "already_following"
+                else:
+                    results[user_profile_id] = "followed"
+                    created_ids.append(user_profile_id)
+
+            if created_ids:
+                FollowThrough.objects.bulk_create(
+                    [
+                        FollowThrough(from_userprofile_id=pk, to_userprofile=self)
+                        for pk in created_ids
+                    ],
+                    ignore_conflicts=True,
+                )
+                UserProfile.update_counters_many(created_ids, follower_count=1)
+                UserProfile.update_counters(self.pk, following_count=len(created_ids))
+                Notification.notify_many(
+                    Notification.Verb.FOLLOW,
+                    self.pk,
+                    [(user_profile_id, None) for user_profile_id in created_ids],
+                )
+
+        return results
+
+    def unfollow_many(self, user_profile_ids: Iterable[int]) -> dict[int, str]:
+        """Unfollow the profiles in bulk and return the outcome per profile id"""
+        FollowThrough = UserProfile.followers.through
+        results = dict.fromkeys(user_profile_ids, "not_found")
+
+        with transaction.atomic():
+            self.lock()
+            states = (
+                UserProfile.active()
+                .filter(id__in=results)
+                .annotate(
+                    followed=Exists(
+                        FollowThrough.objects.filter(
+                            from_userprofile=OuterRef("pk"), to_userprofile=self
+                        )
+                    )
+                )
+            )
+            deleted_ids = []
+            for user_profile_id, followed in states.values_list("id", "followed"):
+                if followed:
+                    results[user_profile_id] = "unfollowed"
+                    deleted_ids.append(user_profile_id)
+                else:
+                    results[user_profile_id] = "not_following"
+
+            if deleted_ids:
+                FollowThrough.objects.filter(
+                    from_userprofile_id__in=deleted_ids, to_userprofile=self
+                ).delete()
+                UserProfile.update_counters_many(deleted_ids, follower_count=-1)
+                UserProfile.update_counters(self.pk, following_count=-len(deleted_ids))
+
+        return results
+
+
+class Hashtag(models.Model):
+    name = models.CharField(max_length=HASHTAG_MAX_LENGTH, unique=True)
+
+    class Meta:
+        ordering = ("name",)
+
+    def __str__(self) -> str:
+        return f"#{self.name}"
+
+    @classmethod
+    def sync_posts(cls, posts: Iterable["Post"], replace: bool = True) -> None:
+        """Replace hashtag links of the posts with hashtags found in content,
+        new posts have no links to replace"""
+        names_by_post_id = {post.id: extract_hashtags(post.content) for post in posts}
+        if not names_by_post_id:
+            return
 
-class Post(models.Model):
+        names = set().union(*names_by_post_id.values())
+
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(name=name) for name in names], ignore_conflicts=True
+            )
+            hashtag_ids = dict(
+                cls.objects.filter(name__in=names).values_list("name", "id")
+            )
+
+            if replace:
+                PostHashtag.objects.filter(post_id__in=names_by_post_id).delete()
+            PostHashtag.objects.bulk_create(
+                [
+                    PostHashtag(post_id=post_id, hashtag_id=hashtag_ids[name])
+                    for post_id, post_names in names_by_post_id.items()
+                    for name in post_names
+                ]
+            )
+
+
+class Post(CounterMixin, models.Model):
     user_profile = models.ForeignKey(
         UserProfile, on_delete=models.CASCADE, related_name="posts"
     )
     content = models.TextField()
-    image = models.ImageField(upload_to=upload_image_file_path)
+    image = models.ImageField(
+        upload_to=upload_image_file_path, storage=get_media_storage
+    )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     likes = models.ManyToManyField(UserProfile, related_name="liked_posts", blank=True)
+    hashtags = models.ManyToManyField(
+        Hashtag, through="PostHashtag", related_name="posts", blank=True
+    )
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["user_profile", "-id"], name="post_profile_id_idx"),
+            GinIndex(fields=["search_vector"], name="post_search_vector_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Post {self.id}"
 
+    @classmethod
+    def visible_to(cls, user_profile: UserProfile) -> models.QuerySet:
+        """Own posts and posts of followed profiles, each one once"""
+        return cls.objects.filter(
+            models.Q(user_profile=user_profile)
+            | models.Q(
+                user_profile__in=user_profile.followings.filter(
+                    deleted_at__isnull=True
+                ).values("id")
+            )
+        )
+
+    def sync_hashtags(self, replace: bool = True) -> None:
+        Hashtag.sync_posts([self], replace)
+
+    def add_like(self, user_profile: UserProfile) -> bool:
+        with transaction.atomic():
+            # Same lock as like_many, so both don't count one like twice
+            user_profile.lock()
+            _, created = Post.likes.through.objects.get_or_create(
+                post=self, userprofile=user_profile
+            )
+            if created:
+                Post.update_counters(self.pk, like_count=1)
+                Notification.notify(
+                    self.user_profile_id,
+                    Notification.Verb.LIKE,
+                    user_profile.pk,
+                    post_id=self.pk,
+                )
+
+        return created
+
+    def remove_like(self, user_profile: UserProfile) -> bool:
+        with transaction.atomic():
+            user_profile.lock()
+            deleted, _ = Post.likes.through.objects.filter(
+                post=self, userprofile=user_profile
+            ).delete()
+            if deleted:
+                Post.update_counters(self.pk, like_count=-1)
+
+        return bool(deleted)
+
+    @classmethod
+    def like_many(
+        cls, user_profile: UserProfile, post_ids: Iterable[int]
+    ) -> dict[int, str]:
+        """Like the visible posts in bulk and return the outcome per post id"""
+        LikeThrough = cls.likes.through
+        results = dict.fromkeys(post_ids, "not_found")
+
+        with transaction.atomic():
+            user_profile.lock()
+            states = (
+                cls.visible_to(user_profile)
+                .filter(id__in=results)
+                .annotate(
+                    liked=Exists(
+                        LikeThrough.objects.filter(
+                            post=OuterRef("pk"), userprofile=user_profile
+                        )
+                    )
+                )
+            )
+            created_ids = []
+            targets = []
+            for post_id, liked, author_id in states.values_list(
+                "id", "liked", "user_profile_id"
+            ):
+                if liked:
+                    results[post_id] = "already_liked"
+                else:
+                    results[post_id] = "liked"
+                    created_ids.append(post_id)
+                    targets.append((author_id, post_id))
+
+            if created_ids:
+                LikeThrough.objects.bulk_create(
+                    [
+                        LikeThrough(post_id=post_id, userprofile=user_profile)
+                        for post_id in created_ids
+                    ],
+                    ignore_conflicts=True,
+                )
+                cls.update_counters_many(created_ids, like_count=1)
+                Notification.notify_many(
+                    Notification.Verb.LIKE, user_profile.pk, targets
+                )
+
+        return results
+
+    @classmethod
+    def unlike_many(
+        cls, user_profile: UserProfile, post_ids: Iterable[int]
+    ) -> dict[int, str]:
+        """Remove likes of the visible posts and return the outcome per post id"""
+        LikeThrough = cls.likes.through
+        results = dict.fromkeys(post_ids, "not_found")
+
+        with transaction.atomic():
+            user_profile.lock()
+            states = (
+                cls.visible_to(user_profile)
+                .filter(id__in=results)
+                .annotate(
+                    liked=Exists(
+                        LikeThrough.objects.filter(
+                            post=OuterRef("pk"), userprofile=user_profile
+                        )
+                    )
+                )
+            )
+            deleted_ids = []
+            for post_id, liked in states.values_list("id", "liked"):
+                if liked:
+                    results[post_id] = "unliked"
+                    deleted_ids.append(post_id)
+                else:
+                    results[post_id] = "not_liked"
+
+            if deleted_ids:
+                LikeThrough.objects.filter(
+                    post_id__in=deleted_ids, userprofile=user_profile
+                ).delete()
+                cls.update_counters_many(deleted_ids, like_count=-1)
+
+        return results
+
+
+class PostHashtag(models.Model):
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="post_hashtags"
+    )
+    hashtag = models.ForeignKey(
+        Hashtag, on_delete=models.CASCADE, related_name="post_hashtags"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hashtag", "post"], name="unique_post_hashtag"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Post hashtag {self.id}"
+
 
 class PostponedPost(models.Model):
     user_profile = models.ForeignKey(
         UserProfile, on_delete=models.CASCADE, related_name="postponed_posts"
     )
     content = models.TextField()
-    image = models.ImageField(upload_to=upload_image_file_path)
+    image = models.ImageField(
+        upload_to=upload_image_file_path, storage=get_media_storage
+    )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     postponed_at = models.DateTimeField()
     published = models.BooleanField(default=False)
+    task_id = models.CharField(max_length=255, blank=True, editable=False)
 
     class Meta:
         ordering = ("-postponed_at",)
+        indexes = [
+            models.Index(
+                fields=["postponed_at"],
+                condition=models.Q(published=False),
+                name="postponed_post_due_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Postponed post {self.id}"
 
-    def publish(self) -> None:
+    @classmethod
+    def publish_many(cls, postponed_posts: list["PostponedPost"]) -> list[Post]:
+        """
+        Publish already locked postponed posts in bulk.
+        Must be called inside a transaction holding the row locks.
+        """
+        posts = Post.objects.bulk_create(
+            [
+                Post(
+                    user_profile_id=postponed_post.user_profile_id,
+                    content=postponed_post.content,
+                    image=postponed_post.image,
+                    image_variants=postponed_post.image_variants,
+                )
+                for postponed_post in postponed_posts
+            ]
+        )
+        Hashtag.sync_posts(posts, replace=False)
+        for postponed_post in postponed_posts:
+            retain_media(postponed_post, "image")
+
+        post_counts = Counter(post.user_profile_id for post in posts)
+        for user_profile_id, post_count in post_counts.items():
+            UserProfile.update_counters(user_profile_id, post_count=post_count)
+
+        cls.objects.filter(
+            id__in=[postponed_post.id for postponed_post in postponed_posts]
+        ).update(published=True)
+
+        return posts
+
+    @classmethod
+    def publish_due(cls, chunk_size: int) -> list[Post]:
+        """
+        Claim up to chunk_size due posts and publish them.
+        Rows locked by another worker are skipped, so it is safe to run
+        several workers at the same time.
+        """
         with transaction.atomic():
-            Post.objects.create(
-                user_profile=self.user_profile, content=self.content, image=self.image
+            postponed_posts = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(published=False, postponed_at__lte=timezone.now())
+                .order_by("id")[:chunk_size]
             )
-            self.published = True
-            self.save()
+            if not postponed_posts:
+                return []
+
+            return cls.publish_many(postponed_posts)
+
+    def publish(self) -> Post | None:
+        with transaction.atomic():
+            postponed_post = (
+                PostponedPost.objects.select_for_update()
+                .filter(pk=self.pk, published=False)
+                .first()
+            )
+            if postponed_post is None:
+                return None
+
+            [post] = PostponedPost.publish_many([postponed_post])
+
+        self.published = True
+        return post
 
 
 class Comment(models.Model):
+    """
+    Comments form reply threads. path holds the zero padded ids from
+    the thread root down to the comment, so a subtree is a path prefix
+    and sorting by path gives the thread order.
+    """
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     user_profile = models.ForeignKey(
         UserProfile, on_delete=models.CASCADE, related_name="comments"
     )
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="replies",
+    )
+    root = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        related_name="+",
+        db_index=False,
+        editable=False,
+    )
+    # C collation sorts and prefix matches paths byte by byte on the index
+    path = models.CharField(max_length=255, db_collation="C", editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["post", "-id"], name="comment_post_id_idx"),
+            models.Index(
+                fields=["post", "-id"],
+                condition=models.Q(parent__isnull=True),
+                name="comment_post_root_idx",
+            ),
+            models.Index(fields=["root", "path"], name="comment_root_path_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Comment {self.id}"
+
+    @classmethod
+    def visible(cls) -> models.QuerySet:
+        """Comments of profiles that are not soft deleted"""
+        return cls.objects.filter(user_profile__deleted_at__isnull=True)
+
+    @staticmethod
+    def get_list_state() -> dict:
+        """
+        Aggregates of the comments of a post that change with every edit.
+        Comments of soft deleted profiles count, so the deletion changes them.
+        """
+        return {
+            "updated_at": Max("updated_at"),
+            "author_updated_at": Max("user_profile__updated_at"),
+        }
+
+    @classmethod
+    def get_thread_fields(cls, parent: "Comment | None") -> dict:
+        """
+        Reserve the id of a new comment so its root and path
+        are written with the row.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id'))",
+                [cls._meta.db_table],
+            )
+            comment_id = cursor.fetchone()[0]
+
+        segment = get_comment_path_segment(comment_id)
+        if parent is None:
+            return {"id": comment_id, "root_id": comment_id, "path": segment}
+        return {
+            "id": comment_id,
+            "parent": parent,
+            "root_id": parent.root_id,
+            "path": parent.path + segment,
+            "depth": parent.depth + 1,
+        }
+
+    @classmethod
+    def get_reply_previews(cls, root_ids: list[int]) -> models.QuerySet:
+        """
+        First COMMENT_THREAD_PREVIEW_SIZE replies of each thread in thread
+        order, annotated with the number of replies in the thread.
+        """
+        return (
+            cls.visible()
+            .filter(root_id__in=root_ids, parent__isnull=False)
+            .annotate(
+                position=Window(
+                    RowNumber(), partition_by=F("root_id"), order_by=F("path").asc()
+                ),
+                thread_size=Window(Count("*"), partition_by=F("root_id")),
+            )
+            .filter(position__lte=settings.COMMENT_THREAD_PREVIEW_SIZE)
+            .select_related("user_profile__user")
+            .order_by("path")
+        )
+
+    @staticmethod
+    def attach_replies(roots: list["Comment"], replies: list["Comment"]) -> None:
+        """Set preview_replies and reply_count of the thread roots"""
+        replies_by_root = {}
+        for reply in replies:
+            replies_by_root.setdefault(reply.root_id, []).append(reply)
+
+        for root in roots:
+            root.preview_replies = replies_by_root.get(root.id, [])
+            root.reply_count = (
+                root.preview_replies[0].thread_size if root.preview_replies else 0
+            )
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(
+        UserProfile, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+
+    class Meta:
+        ordering = ("-post",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "post"], name="unique_timeline_entry"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Timeline entry {self.id}"
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_profile = models.ForeignKey(
+        UserProfile, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self) -> str:
+        return f"Upload session {self.id}"
+
+    @property
+    def path(self) -> Path:
+        return Path(settings.UPLOAD_SESSION_ROOT, f"{self.id}.part")
+
+    def write_chunk(self, stream, length: int) -> int:
+        """Append up to length bytes from the stream without buffering them"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+
+        with open(self.path, "ab") as part_file:
+            part_file.truncate(self.offset)
+            while written < length:
+                chunk = stream.read(
+                    min(settings.UPLOAD_CHUNK_READ_SIZE, length - written)
+                )
+                if not chunk:
+                    break
+                part_file.write(chunk)
+                written += len(chunk)
+
+        self.offset += written
+        return written
+
+    def open(self) -> File:
+        return File(open(self.path, "rb"), name=self.filename)
+
+    def discard(self) -> None:
+        path = self.path
+        self.delete()
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
+
+
+class DataExport(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        COMPLETED = "completed"
+        FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_profile = models.ForeignKey(
+        UserProfile, on_delete=models.CASCADE, related_name="data_exports"
+    )
+    include_media = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    file = models.FileField(storage=get_export_storage, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self) -> str:
+        return f"Data export {self.id}"
+
+
+class Notification(models.Model):
+    """
+    Likes, comments and follows aimed at a profile. Events of the same kind
+    on the same target are rolled up into one unread row with the number
+    of actors and a sample of the latest ones.
+    """
+
+    class Verb(models.TextChoices):
+        LIKE = "like"
+        COMMENT = "comment"
+        FOLLOW = "follow"
+
+    recipient = models.ForeignKey(
+        UserProfile, on_delete=models.CASCADE, related_name="notifications"
+    )
+    verb = models.CharField(max_length=16, choices=Verb.choices)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="notifications",
+    )
+    actor_ids = ArrayField(models.IntegerField(), default=list)
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-updated_at", "-id")
+        indexes = [
+            models.Index(
+                fields=["recipient", "-updated_at", "-id"],
+                name="notification_inbox_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "verb", "post"],
+                condition=models.Q(is_read=False),
+                nulls_distinct=False,
+                name="unique_unread_notification",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Notification {self.id}"
+
+    @classmethod
+    def notify(
+        cls, recipient_id: int, verb: str, actor_id: int, post_id: int = None, **data
+    ) -> None:
+        cls.notify_many(verb, actor_id, [(recipient_id, post_id)], **data)
+
+    @classmethod
+    def notify_many(
+        cls,
+        verb: str,
+        actor_id: int,
+        targets: Iterable[tuple[int, int | None]],
+        **data: int,
+    ) -> None:
+        """
+        Roll the action up into the unread notification of every
+        (recipient, post) target and publish it to the event streams.
+        Targets must be distinct, own profiles are skipped.
+        """
+        targets = [target for target in targets if target[0] != actor_id]
+        if not targets:
+            return
+
+        # One statement upserts the rollups and counts the new unread rows,
+        # actors already in the sample aren't counted twice
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH rollup AS (
+                    INSERT INTO {cls._meta.db_table} AS notification (
+                        recipient_id, verb, post_id, actor_ids, actor_count,
+                        is_read, created_at, updated_at
+                    )
+                    SELECT target.recipient_id, %(verb)s, target.post_id,
+                        ARRAY[%(actor_id)s]::integer[], 1, false, %(now)s, %(now)s
+                    FROM unnest(%(recipient_ids)s::integer[], %(post_ids)s::integer[])
+                        AS target (recipient_id, post_id)
+                    ON CONFLICT (recipient_id, verb, post_id) WHERE NOT is_read
+                    DO UPDATE SET
+                        actor_count = notification.actor_count + CASE
+                            WHEN %(actor_id)s = ANY(notification.actor_ids) THEN 0
+                            ELSE 1
+                        END,
+                        actor_ids = (
+                            ARRAY[%(actor_id)s]::integer[]
+                            || array_remove(notification.actor_ids, %(actor_id)s)
+                        )[1:%(sample_size)s],
+                        updated_at = EXCLUDED.updated_at
+                    RETURNING notification.recipient_id, xmax = 0 AS inserted
+                )
+                UPDATE {UserProfile._meta.db_table} AS user_profile
+                SET unread_notification_count = (
+                    user_profile.unread_notification_count + created.count
+                )
+                FROM (
+                    SELECT recipient_id, count(*) AS count
+                    FROM rollup
+                    WHERE inserted
+                    GROUP BY recipient_id
+                ) AS created
+                WHERE user_profile.id = created.recipient_id
+                """,
+                {
+                    "verb": verb,
+                    "actor_id": actor_id,
+                    "now": now,
+                    "recipient_ids": [recipient_id for recipient_id, _ in targets],
+                    "post_ids": [post_id for _, post_id in targets],
+                    "sample_size": settings.NOTIFICATION_ACTOR_SAMPLE_SIZE,
+                },
+            )
+
+        for recipient_id, post_id in targets:
+            event_data = data if post_id is None else {"post_id": post_id, **data}
+            publish_event(recipient_id, verb, actor_id, **event_data)
+
+    @classmethod
+    def mark_read(cls, recipient_id: int, **filters) -> int:
+        """Mark the matching unread notifications read and return their number"""
+        with transaction.atomic():
+            marked = cls.objects.filter(
+                recipient_id=recipient_id, is_read=False, **filters
+            ).update(is_read=True)
+            if marked:
+                # The counter isn't part of the profile representation,
+                # so the profile caches are left alone
+                UserProfile.objects.filter(pk=recipient_id).update(
+                    unread_notification_count=Greatest(
+                        F("unread_notification_count") - marked, 0
+                    )
+                )
+
+        return marked
+
+    @classmethod
+    def discard_unread(cls, **filters) -> None:
+        """
+        Take the matching unread notifications out of the unread count of
+        each recipient, they are about to be deleted with their post
+        """
+        unread = cls.objects.filter(is_read=False, **filters).order_by()
+        totals = (
+            unread.filter(recipient_id=OuterRef("pk"))
+            .values("recipient_id")
+            .annotate(total=Count("*"))
+            .values("total")
+        )
+        UserProfile.objects.filter(pk__in=unread.values("recipient_id")).update(
+            unread_notification_count=Greatest(
+                F("unread_notification_count") - Subquery(totals), 0
+            )
+        )
@@ -0,0 +1,123 @@
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import QuerySet
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+
+def estimate_count(queryset: QuerySet) -> int | None:
+    """
+    Return the planner's row estimate for the queryset.
+    Only PostgreSQL is supported, other backends return None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = "-id"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    count_query_param = "with_count"
+    count_query_description = "Include a planner estimated total count."
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view=None
+    ) -> list | None:
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.estimated_count = estimate_count(queryset)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset: QuerySet, request: Request) -> list:
+        """
+        Async variant of paginate_queryset for the unique id ordering.
+        Ids never repeat so cursors need no offset,
+        they are interchangeable with the ones of the sync endpoints.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, None)
+        assert self.ordering == ("-id",), "Only the -id ordering is supported"
+
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.estimated_count = await sync_to_async(estimate_count)(queryset)
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor else None
+        if position is not None:
+            queryset = queryset.filter(**{"id__gt" if reverse else "id__lt": position})
+
+        queryset = queryset.order_by("id" if reverse else "-id")
+        results = [instance async for instance in queryset[: self.page_size + 1]]
+        self.page = results[: self.page_size]
+        following_position = (
+            str(results[-1].id) if len(results) > self.page_size else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.next_position, self.previous_position = position, following_position
+        else:
+            self.next_position, self.previous_position = following_position, position
+        self.has_next = self.next_position is not None
+        self.has_previous = self.previous_position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data: list) -> Response:
+        response_data = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+        }
+        if self.estimated_count is not None:
+            response_data["estimated_count"] = self.estimated_count
+        response_data["results"] = data
+
+        return Response(response_data)
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["estimated_count"] = {
+            "type": "integer",
+            "example": 123,
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view) -> list[dict]:
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append(
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": self.count_query_description,
+                "schema": {"type": "boolean"},
+            }
+        )
+        return parameters
+
+
+class SearchCursorPagination(IdCursorPagination):
+    ordering = ("-search_score", "-id")
+
+
+class NotificationCursorPagination(IdCursorPagination):
+    ordering = ("-updated_at", "-id")
+
+
+class CommentThreadCursorPagination(IdCursorPagination):
+    ordering = "path"
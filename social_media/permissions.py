@@ -14,4 +14,7 @@ class IsObjectOwner(BasePermission):
     message = "You are not an object owner"
 
     def has_object_permission(self, request, view, obj) -> bool:
-        return request.method in SAFE_METHODS or obj.user_profile.user == request.user
+        return (
+            request.method in SAFE_METHODS
+            or obj.user_profile_id == request.user.profile.id
+        )
@@ -0,0 +1,261 @@
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from django.db.models.functions import Left, Length
+
+from social_media.models import (
+    UserProfile,
+    Post,
+    Comment,
+    PostponedPost,
+    TimelineEntry,
+    UploadSession,
+    DataExport,
+    Notification,
+    CounterMixin,
+)
+
+logger = logging.getLogger(__name__)
+
+FollowThrough = UserProfile.followers.through
+LikeThrough = Post.likes.through
+
+
+def get_purge_lock_key(user_profile_id: int) -> str:
+    return f"purge:profile:{user_profile_id}"
+
+
+def decrement_counters(
+    model: type[CounterMixin], name: str, amounts: dict[int, int]
+) -> None:
+    """Subtract the amount of each row, one update per distinct amount"""
+    pks_by_amount = defaultdict(list)
+    for pk, amount in amounts.items():
+        pks_by_amount[amount].append(pk)
+
+    for amount, pks in pks_by_amount.items():
+        model.update_counters_many(pks, **{name: -amount})
+
+
+def delete_batch(
+    queryset: QuerySet, batch_size: int, ordering: tuple[str, ...] = ()
+) -> int:
+    pks = list(queryset.order_by(*ordering).values_list("pk", flat=True)[:batch_size])
+    if pks:
+        queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def delete_edge_batch(
+    queryset: QuerySet,
+    batch_size: int,
+    target_field: str,
+    target_model: type[CounterMixin],
+    counter: str,
+) -> int:
+    """Delete follow or like rows and decrement the counter of the other side"""
+    with transaction.atomic():
+        # Locked so a concurrent purge of the other side doesn't count them again
+        edges = list(
+            queryset.order_by()
+            .select_for_update()
+            .values_list("pk", target_field)[:batch_size]
+        )
+        if edges:
+            queryset.model.objects.filter(pk__in=[pk for pk, _ in edges]).delete()
+            decrement_counters(
+                target_model, counter, {target_id: 1 for _, target_id in edges}
+            )
+    return len(edges)
+
+
+def purge_followings(user_profile_id: int, batch_size: int) -> int:
+    # from_userprofile is the followed profile, to_userprofile the follower
+    return delete_edge_batch(
+        FollowThrough.objects.filter(to_userprofile_id=user_profile_id),
+        batch_size,
+        "from_userprofile_id",
+        UserProfile,
+        "follower_count",
+    )
+
+
+def purge_followers(user_profile_id: int, batch_size: int) -> int:
+    return delete_edge_batch(
+        FollowThrough.objects.filter(from_userprofile_id=user_profile_id),
+        batch_size,
+        "to_userprofile_id",
+        UserProfile,
+        "following_count",
+    )
+
+
+def purge_likes(user_profile_id: int, batch_size: int) -> int:
+    return delete_edge_batch(
+        LikeThrough.objects.filter(userprofile_id=user_profile_id),
+        batch_size,
+        "post_id",
+        Post,
+        "like_count",
+    )
+
+
+def purge_comments(user_profile_id: int, batch_size: int) -> int:
+    """
+    Delete comments on posts of other profiles together with their replies.
+    Deepest first, so a batch holds at most batch_size rows however large
+    the reply subtrees are and the cascade doesn't reach past it.
+    """
+    own_comments = Comment.objects.filter(user_profile_id=user_profile_id).exclude(
+        post__user_profile_id=user_profile_id
+    )
+    # A comment of the profile whose path is a prefix of the outer one
+    own_ancestors = own_comments.filter(
+        root_id=OuterRef("root_id"), path=Left(OuterRef("path"), Length("path"))
+    )
+    with transaction.atomic():
+        comments = list(
+            Comment.objects.filter(
+                Exists(own_ancestors), root_id__in=own_comments.values("root_id")
+            )
+            .order_by("-depth")
+            .select_for_update()
+            .values_list("pk", "post_id")[:batch_size]
+        )
+        if comments:
+            Comment.objects.filter(pk__in=[pk for pk, _ in comments]).delete()
+            decrement_counters(
+                Post, "comment_count", Counter(post_id for _, post_id in comments)
+            )
+    return len(comments)
+
+
+def purge_timeline_entries(user_profile_id: int, batch_size: int) -> int:
+    return delete_batch(
+        TimelineEntry.objects.filter(owner_id=user_profile_id), batch_size
+    )
+
+
+def purge_notifications(user_profile_id: int, batch_size: int) -> int:
+    return delete_batch(
+        Notification.objects.filter(recipient_id=user_profile_id), batch_size
+    )
+
+
+def purge_post_timeline_entries(user_profile_id: int, batch_size: int) -> int:
+    return delete_batch(
+        TimelineEntry.objects.filter(post__user_profile_id=user_profile_id),
+        batch_size,
+    )
+
+
+def purge_post_likes(user_profile_id: int, batch_size: int) -> int:
+    # The posts go away, their counters don't need to follow
+    return delete_batch(
+        LikeThrough.objects.filter(post__user_profile_id=user_profile_id), batch_size
+    )
+
+
+def purge_post_comments(user_profile_id: int, batch_size: int) -> int:
+    # Deepest first, the replies of a batch are in it or already gone,
+    # so the cascade over parent and root doesn't reach past the batch
+    return delete_batch(
+        Comment.objects.filter(post__user_profile_id=user_profile_id),
+        batch_size,
+        ordering=("-depth",),
+    )
+
+
+def purge_posts(user_profile_id: int, batch_size: int) -> int:
+    # Images are released by the post_delete signal once the batch commits
+    pks = list(
+        Post.objects.filter(user_profile_id=user_profile_id)
+        .order_by()
+        .values_list("pk", flat=True)[:batch_size]
+    )
+    if pks:
+        with transaction.atomic():
+            Notification.discard_unread(post_id__in=pks)
+            Post.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def purge_postponed_posts(user_profile_id: int, batch_size: int) -> int:
+    # Their publication tasks find nothing to publish
+    return delete_batch(
+        PostponedPost.objects.filter(user_profile_id=user_profile_id), batch_size
+    )
+
+
+def purge_upload_sessions(user_profile_id: int, batch_size: int) -> int:
+    uploads = list(
+        UploadSession.objects.filter(user_profile_id=user_profile_id)[:batch_size]
+    )
+    for upload in uploads:
+        upload.discard()
+    return len(uploads)
+
+
+def purge_data_exports(user_profile_id: int, batch_size: int) -> int:
+    return delete_batch(
+        DataExport.objects.filter(user_profile_id=user_profile_id), batch_size
+    )
+
+
+# Rows that change counters of other profiles and posts go first
+PURGE_STEPS: list[Callable[[int, int], int]] = [
+    purge_followings,
+    purge_followers,
+    purge_likes,
+    purge_comments,
+    purge_timeline_entries,
+    purge_notifications,
+    purge_post_timeline_entries,
+    purge_post_likes,
+    purge_post_comments,
+    purge_posts,
+    purge_postponed_posts,
+    purge_upload_sessions,
+    purge_data_exports,
+]
+
+
+def purge_profile(user_profile_id: int) -> bool:
+    """
+    Delete a soft deleted profile and everything it owns in batches of
+    PROFILE_PURGE_BATCH_SIZE rows, pausing PROFILE_PURGE_BATCH_DELAY
+    between batches. Return False when PROFILE_PURGE_TIME_LIMIT runs out,
+    the steps only see the remaining rows so a new run picks up from there.
+    """
+    if not UserProfile.objects.filter(
+        pk=user_profile_id, deleted_at__isnull=False
+    ).exists():
+        return True
+
+    started_at = time.monotonic()
+    batch_size = settings.PROFILE_PURGE_BATCH_SIZE
+    deleted = 0
+
+    for step in PURGE_STEPS:
+        while True:
+            if time.monotonic() - started_at > settings.PROFILE_PURGE_TIME_LIMIT:
+                logger.info(
+                    "Profile %s purge paused after %s rows", user_profile_id, deleted
+                )
+                return False
+
+            step_deleted = step(user_profile_id, batch_size)
+            deleted += step_deleted
+            if step_deleted < batch_size:
+                break
+            time.sleep(settings.PROFILE_PURGE_BATCH_DELAY)
+
+    # Rows created since their step ran go with the profile
+    UserProfile.objects.filter(pk=user_profile_id, deleted_at__isnull=False).delete()
+    logger.info("Profile %s purged, %s rows deleted", user_profile_id, deleted)
+    return True
@@ -0,0 +1,198 @@
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.db.models import Model
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+HEALTHY_REPLICAS_KEY = "replicas:healthy"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+replica_reads = ContextVar("replica_reads", default=None)
+
+
+def get_pin_key(user_id: int) -> str:
+    return f"replicas:pin:{user_id}"
+
+
+def get_replica_lag(alias: str) -> float | None:
+    """Seconds the replica is behind the primary, None when it can't tell"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE "
+                "WHEN NOT pg_is_in_recovery() THEN 0 "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+                "END"
+            )
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        logger.warning("Cannot check lag of replica %s", alias, exc_info=True)
+        return None
+
+    return None if lag is None else float(lag)
+
+
+def check_replicas() -> list[str]:
+    """
+    Store the replicas within REPLICA_MAX_LAG of the primary.
+    The list expires unless it is refreshed, reads stay on the primary then.
+    """
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        lag = get_replica_lag(alias)
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+            healthy.append(alias)
+        else:
+            logger.warning("Replica %s is out of rotation, lag %s", alias, lag)
+
+    cache.set(HEALTHY_REPLICAS_KEY, healthy, settings.REPLICA_LAG_CHECK_INTERVAL * 3)
+    return healthy
+
+
+class ReplicaReads:
+    """
+    Pick the database for the reads of one request or task.
+    The replica is chosen once, reads of a user who wrote within
+    REPLICA_PIN_SECONDS go to the primary.
+    """
+
+    def __init__(self, request: HttpRequest | None = None) -> None:
+        self.request = request
+        self.replica = None
+        self.pinned = {}
+        self.resolving_user = False
+
+    def get_replica(self) -> str | None:
+        # Empty once it's known that no replica is healthy
+        if self.replica is None:
+            healthy = cache.get(HEALTHY_REPLICAS_KEY)
+            self.replica = random.choice(healthy) if healthy else ""
+        return self.replica or None
+
+    def get_user_id(self) -> int | None:
+        # Loading a lazy user reads the database, those reads use the primary
+        self.resolving_user = True
+        try:
+            user = getattr(self.request, "user", None)
+            return user.pk if user is not None and user.is_authenticated else None
+        finally:
+            self.resolving_user = False
+
+    def is_pinned(self, user_id: int) -> bool:
+        if user_id not in self.pinned:
+            self.pinned[user_id] = cache.get(get_pin_key(user_id)) is not None
+        return self.pinned[user_id]
+
+    def db_for_read(self) -> str | None:
+        if self.resolving_user or connections["default"].in_atomic_block:
+            return None
+
+        replica = self.get_replica()
+        if replica is None:
+            return None
+
+        user_id = self.get_user_id() if self.request is not None else None
+        if user_id is not None and self.is_pinned(user_id):
+            return None
+        return replica
+
+
+@contextmanager
+def use_replica() -> Iterator[None]:
+    """Send reads of the block or decorated function to a replica"""
+    token = replica_reads.set(ReplicaReads())
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary. Reads go to a replica inside requests with
+    safe methods and use_replica blocks, everywhere else to the primary.
+    """
+
+    # Authentication reads users, tokens and sessions right after they are created
+    primary_apps = {"account", "knox", "sessions"}
+
+    def db_for_read(self, model: type[Model], **hints) -> str | None:
+        reads = replica_reads.get()
+        if reads is None or model._meta.app_label in self.primary_apps:
+            return None
+        return reads.db_for_read()
+
+    def db_for_write(self, model: type[Model], **hints) -> str:
+        return "default"
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints) -> bool:
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, **hints) -> bool:
+        return db == "default"
+
+
+class ReplicaMiddleware:
+    """
+    Route the reads of safe requests to a replica and pin users
+    to the primary for REPLICA_PIN_SECONDS after a successful write.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            self.pin(request, response)
+            return response
+
+        token = replica_reads.set(ReplicaReads(request))
+        try:
+            return self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            await sync_to_async(self.pin)(request, response)
+            return response
+
+        # Sync ORM calls run with a copy of this context
+        token = replica_reads.set(ReplicaReads(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+    @staticmethod
+    def pin(request: HttpRequest, response: HttpResponse) -> None:
+        user = getattr(request, "user", None)
+        if response.status_code < 400 and user is not None and user.is_authenticated:
+            cache.set(get_pin_key(user.pk), 1, settings.REPLICA_PIN_SECONDS)
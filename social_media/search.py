@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import QuerySet, F, Func, FloatField, Value
+from django.db.models.functions import Log, Greatest, Cast
+
+MIN_SEARCH_RANK = 1e-6
+
+
+class Epoch(Func):
+    template = "EXTRACT(EPOCH FROM %(expressions)s)"
+    output_field = FloatField()
+
+
+def search_posts(queryset: QuerySet, query_text: str) -> QuerySet:
+    """
+    Filter posts matching the query and annotate them with search_score.
+    The score blends the text rank with recency; it doesn't depend on
+    the current time, so it is stable for keyset pagination.
+    """
+    query = SearchQuery(
+        query_text, search_type="websearch", config=settings.POST_SEARCH_CONFIG
+    )
+    rank = Cast(SearchRank(F("search_vector"), query), FloatField())
+
+    score = Log(Value(10.0), Greatest(rank, Value(MIN_SEARCH_RANK))) + Epoch(
+        "created_at"
+    ) / Value(float(settings.POST_SEARCH_RECENCY_SECONDS))
+
+    return queryset.filter(search_vector=query).annotate(
+        search_score=Cast(score, FloatField())
+    )
@@ -1,20 +1,81 @@
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.validators import get_available_image_extensions
 from django.db import transaction
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator
 
-from social_media.models import UserProfile, Post, Comment, PostponedPost
+from social_media.cache import bump_profile_versions
+from social_media.images import IMAGE_VARIANT_FORMATS
+from social_media.models import (
+    UserProfile,
+    Post,
+    Comment,
+    PostponedPost,
+    UploadSession,
+    DataExport,
+    Notification,
+)
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Expose stored image variants with absolute urls and a webp srcset"""
+
+    def __init__(self, image_field_name: str, **kwargs) -> None:
+        self.image_field_name = image_field_name
+        super().__init__(**kwargs)
+
+    def build_url(self, name: str) -> str:
+        storage = self.parent.Meta.model._meta.get_field(self.image_field_name).storage
+        url = storage.url(name)
+
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, value: dict) -> dict:
+        variants = {}
+        srcset = []
+        for variant_name, variant in value.items():
+            variants[variant_name] = {
+                key: self.build_url(item) if key in IMAGE_VARIANT_FORMATS else item
+                for key, item in variant.items()
+            }
+            if "webp" in variant:
+                srcset.append(f"{variants[variant_name]['webp']} {variant['width']}w")
+
+        if srcset:
+            variants["srcset"] = ", ".join(srcset)
+        return variants
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
     user = serializers.EmailField(source="user.email", read_only=True)
     username = serializers.CharField(source="user.username", read_only=True)
-    follower_count = serializers.IntegerField(read_only=True)
+    profile_picture_variants = ImageVariantsField(
+        "profile_picture", source="image_variants"
+    )
 
     class Meta:
         model = UserProfile
-        fields = ["id", "user", "username", "bio", "profile_picture", "follower_count"]
+        fields = [
+            "id",
+            "user",
+            "username",
+            "bio",
+            "profile_picture",
+            "profile_picture_variants",
+            "follower_count",
+            "following_count",
+            "post_count",
+        ]
+        read_only_fields = ["follower_count", "following_count", "post_count"]
 
 
 class UserProfileCreateSerializer(serializers.ModelSerializer):
@@ -26,10 +87,17 @@ class UserProfileCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data: dict) -> UserProfile:
 
-        if UserProfile.objects.filter(user=validated_data["user"]).exists():
+        user_profile = UserProfile.objects.filter(user=validated_data["user"]).first()
+        if user_profile is not None and user_profile.deleted_at is not None:
+            raise serializers.ValidationError(
+                "The previous user profile is still being deleted"
+            )
+        if user_profile is not None:
             raise serializers.ValidationError("User profile is already registered")
 
-        return super().create(validated_data)
+        user_profile = super().create(validated_data)
+        bump_profile_versions(user_profile.pk)
+        return user_profile
 
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
@@ -55,6 +123,7 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
                 user.username = user_data.get("username", user.username)
                 user.save()
 
+            bump_profile_versions(instance.pk)
             return super().update(instance, validated_data)
 
 
@@ -77,23 +146,195 @@ class FollowSerializer(serializers.Serializer):
         return data
 
 
+class BatchIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+
+class BatchResultSerializer(serializers.Serializer):
+    results = serializers.DictField(
+        child=serializers.CharField(), help_text="Outcome per requested id"
+    )
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    actors = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = [
+            "id",
+            "verb",
+            "post",
+            "actor_count",
+            "actors",
+            "is_read",
+            "created_at",
+            "updated_at",
+        ]
+
+    @extend_schema_field(UserProfileShortSerializer(many=True))
+    def get_actors(self, notification: Notification) -> list[dict]:
+        """
+        Latest actors first, usernames are resolved once per page.
+        Deleted profiles are left out.
+        """
+        usernames = self.context.get("actor_usernames", {})
+        return [
+            {"id": actor_id, "username": usernames[actor_id]}
+            for actor_id in notification.actor_ids
+            if actor_id in usernames
+        ]
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    unread_count = serializers.IntegerField()
+
+
+class EventTicketSerializer(serializers.Serializer):
+    ticket = serializers.CharField()
+    expires_in = serializers.IntegerField(help_text="Seconds the ticket is valid")
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "offset", "completed", "created_at"]
+        read_only_fields = ["id", "offset", "completed", "created_at"]
+
+    def validate_filename(self, value: str) -> str:
+        extension = Path(value).suffix.lower().lstrip(".")
+        if extension not in get_available_image_extensions():
+            raise serializers.ValidationError("Unsupported image file extension")
+        return value
+
+    def validate_size(self, value: int) -> int:
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Ensure the file size is at most {settings.UPLOAD_MAX_SIZE} bytes"
+            )
+        return value
+
+
+class DataExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DataExport
+        fields = [
+            "id",
+            "status",
+            "include_media",
+            "download_url",
+            "created_at",
+            "finished_at",
+        ]
+        read_only_fields = ["id", "status", "created_at", "finished_at"]
+
+    @extend_schema_field(OpenApiTypes.URI)
+    def get_download_url(self, export: DataExport) -> str | None:
+        if export.status != DataExport.Status.COMPLETED:
+            return None
+        return reverse(
+            "social_media:export-download",
+            args=[export.id],
+            request=self.context.get("request"),
+        )
+
+
+class UploadHandleMixin(serializers.Serializer):
+    """Accept a completed upload session in place of an inline image"""
+
+    upload = serializers.PrimaryKeyRelatedField(
+        queryset=UploadSession.objects.filter(completed=True),
+        write_only=True,
+        required=False,
+        help_text="Id of a completed upload session to use as the image",
+    )
+
+    def validate_upload(self, value: UploadSession) -> UploadSession:
+        if value.user_profile_id != self.context["request"].user.profile.id:
+            raise serializers.ValidationError("Upload session not found")
+        return value
+
+    def validate(self, data: dict) -> dict:
+        if data.get("upload") and data.get("image"):
+            raise serializers.ValidationError(
+                "Provide either an image or an upload, not both"
+            )
+        return super().validate(data)
+
+    @property
+    def replaces_image(self) -> bool:
+        return "image" in self.validated_data or "upload" in self.validated_data
+
+    def create(self, validated_data: dict) -> Post | PostponedPost:
+        upload = validated_data.pop("upload", None)
+        if upload is None:
+            return super().create(validated_data)
+
+        with upload.open() as image_file:
+            instance = super().create({**validated_data, "image": image_file})
+
+        upload.discard()
+        return instance
+
+    def update(self, instance, validated_data: dict) -> Post | PostponedPost:
+        upload = validated_data.pop("upload", None)
+        if upload is None:
+            return super().update(instance, validated_data)
+
+        with upload.open() as image_file:
+            instance = super().update(instance, {**validated_data, "image": image_file})
+
+        upload.discard()
+        return instance
+
+
 class PostSerializer(serializers.ModelSerializer):
     username = serializers.CharField(
         source="user_profile.user.username", read_only=True
     )
-    count_likes = serializers.IntegerField(read_only=True)
+    count_likes = serializers.IntegerField(source="like_count", read_only=True)
+    image_variants = ImageVariantsField("image")
 
     class Meta:
         model = Post
-        fields = ["id", "username", "content", "image", "count_likes"]
-
-
-class PostCreateUpdateSerializer(serializers.ModelSerializer):
+        fields = [
+            "id",
+            "username",
+            "content",
+            "image",
+            "image_variants",
+            "count_likes",
+            "comment_count",
+        ]
+        read_only_fields = ["comment_count"]
+
+
+class PostCreateUpdateSerializer(UploadHandleMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False)
 
     class Meta:
         model = Post
-        fields = ["id", "content", "image"]
+        fields = ["id", "content", "image", "upload"]
+
+    def create(self, validated_data: dict) -> Post:
+        with transaction.atomic():
+            post = super().create(validated_data)
+            post.sync_hashtags(replace=False)
+            return post
+
+    def update(self, instance: Post, validated_data: dict) -> Post:
+        with transaction.atomic():
+            post = super().update(instance, validated_data)
+            if "content" in validated_data:
+                post.sync_hashtags()
+            return post
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -103,19 +344,56 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ["id", "username", "content", "created_at"]
+        fields = ["id", "username", "parent", "depth", "content", "created_at"]
+
+
+class CommentThreadSerializer(CommentSerializer):
+    reply_count = serializers.IntegerField(read_only=True)
+    replies = CommentSerializer(source="preview_replies", many=True, read_only=True)
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ["reply_count", "replies"]
 
 
 class CommentCreateSerializer(serializers.ModelSerializer):
 
+    class Meta:
+        model = Comment
+        fields = ["id", "content", "parent"]
+
+    def validate_parent(self, parent: Comment | None) -> Comment | None:
+        if parent is None:
+            return parent
+        if parent.post_id != self.context["post"].id:
+            raise serializers.ValidationError(
+                "The parent comment belongs to another post"
+            )
+        if parent.depth >= settings.COMMENT_MAX_DEPTH:
+            raise serializers.ValidationError(
+                f"Replies can't be nested deeper than {settings.COMMENT_MAX_DEPTH} "
+                "levels"
+            )
+        return parent
+
+
+class CommentUpdateSerializer(serializers.ModelSerializer):
+
     class Meta:
         model = Comment
         fields = ["id", "content"]
 
 
-class PostponedPostCreateSerializer(serializers.ModelSerializer):
+class PostponedPostCreateSerializer(UploadHandleMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False)
 
+    class Meta:
+        model = PostponedPost
+        fields = ["id", "content", "image", "upload", "postponed_at"]
+
+
+class PostponedPostRescheduleSerializer(serializers.ModelSerializer):
+
     class Meta:
         model = PostponedPost
         fields = ["id", "content", "image", "postponed_at"]
+        read_only_fields = ["id", "content", "image"]
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from account.authentication import evict_user_tokens
+from social_media.cache import bump_profile_versions
+
+from social_media.models import Post, PostponedPost, UserProfile, DataExport
+from social_media.storage import release_media
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=PostponedPost)
+def release_post_image(sender, instance: Post | PostponedPost, **kwargs) -> None:
+    release_media(instance, "image")
+
+
+@receiver(post_delete, sender=UserProfile)
+def release_profile_picture(sender, instance: UserProfile, **kwargs) -> None:
+    release_media(instance, "profile_picture")
+
+
+@receiver(post_delete, sender=UserProfile)
+def bump_deleted_profile_version(sender, instance: UserProfile, **kwargs) -> None:
+    bump_profile_versions(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def evict_new_profile_owner_tokens(
+    sender, instance: UserProfile, created: bool, **kwargs
+) -> None:
+    # Cached principals remember whether the user has a profile,
+    # they are evicted once the profile commits
+    if created:
+        evict_user_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def evict_soft_deleted_profile_owner_tokens(
+    sender, instance: UserProfile, update_fields=None, **kwargs
+) -> None:
+    if update_fields and "deleted_at" in update_fields:
+        evict_user_tokens(instance.user_id)
+
+
+@receiver(post_delete, sender=UserProfile)
+def evict_deleted_profile_owner_tokens(sender, instance: UserProfile, **kwargs) -> None:
+    evict_user_tokens(instance.user_id)
+
+
+@receiver(post_delete, sender=DataExport)
+def delete_export_file(sender, instance: DataExport, **kwargs) -> None:
+    file = instance.file
+    if file:
+        transaction.on_commit(lambda: file.delete(save=False))
@@ -0,0 +1,147 @@
+import hashlib
+import os
+from collections import Counter
+from pathlib import PurePosixPath
+from tempfile import NamedTemporaryFile
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.db import transaction, models
+from django.db.models import F
+
+from social_media.images import get_variant_file_names
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Store every file once under the sha256 digest of its content.
+    Saving the same bytes again only increments the reference count of
+    the blob, deleting decrements it and removes the file at zero.
+    """
+
+    blob_directory = "blobs"
+
+    @staticmethod
+    def get_blob_model() -> type[models.Model]:
+        return apps.get_model("social_media", "MediaBlob")
+
+    def get_blob_name(self, digest: str, extension: str) -> str:
+        return str(
+            PurePosixPath(self.blob_directory, digest[:2], digest[2:4])
+            / f"{digest}{extension.lower()}"
+        )
+
+    def get_available_name(self, name: str, max_length: int | None = None) -> str:
+        # The final name is derived from the content in _save
+        return name
+
+    def write_temporary_file(self, content: File) -> tuple[str, str, int]:
+        temporary_directory = self.path(os.path.join(self.blob_directory, "tmp"))
+        os.makedirs(temporary_directory, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        size = 0
+        with NamedTemporaryFile(dir=temporary_directory, delete=False) as temp_file:
+            for chunk in content.chunks():
+                hasher.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+
+        return temp_file.name, hasher.hexdigest(), size
+
+    def _save(self, name: str, content: File) -> str:
+        temp_path, digest, size = self.write_temporary_file(content)
+        blob_name = self.get_blob_name(digest, PurePosixPath(name).suffix)
+        MediaBlob = self.get_blob_model()
+
+        try:
+            with transaction.atomic():
+                blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                    name=blob_name,
+                    defaults={"digest": digest, "size": size, "ref_count": 1},
+                )
+                full_path = self.path(blob_name)
+                if not os.path.exists(full_path):
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    os.replace(temp_path, full_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_path, self.file_permissions_mode)
+
+                if not created:
+                    MediaBlob.objects.filter(pk=blob.pk).update(
+                        ref_count=F("ref_count") + 1
+                    )
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return blob_name
+
+    def retain(self, name: str, count: int = 1) -> None:
+        """Add references to a blob that is shared by one more row"""
+        self.get_blob_model().objects.filter(name=name).update(
+            ref_count=F("ref_count") + count
+        )
+
+    def release(self, name: str, count: int = 1) -> None:
+        MediaBlob = self.get_blob_model()
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+
+            if blob.ref_count > count:
+                MediaBlob.objects.filter(pk=blob.pk).update(
+                    ref_count=F("ref_count") - count
+                )
+                return
+
+            blob.delete()
+            super().delete(name)
+
+    def delete(self, name: str) -> None:
+        self.release(name)
+
+
+def get_media_storage() -> Storage:
+    return storages["media"]
+
+
+def get_export_storage() -> Storage:
+    return storages["exports"]
+
+
+def get_media_names(instance: models.Model, field_name: str) -> list[str]:
+    """Names of the files of the field, once per reference the row holds"""
+    image = getattr(instance, field_name)
+    if not image:
+        return []
+
+    return [image.name, *get_variant_file_names(instance.image_variants)]
+
+
+def release_media_names(storage: Storage, names: list[str]) -> None:
+    """Release the files once the transaction dropping the references commits"""
+    if not names or not hasattr(storage, "release"):
+        return
+
+    def release() -> None:
+        for name, count in Counter(names).items():
+            storage.release(name, count)
+
+    transaction.on_commit(release, robust=True)
+
+
+def retain_media(instance: models.Model, field_name: str) -> None:
+    storage = getattr(instance, field_name).storage
+    if hasattr(storage, "retain"):
+        for name, count in Counter(get_media_names(instance, field_name)).items():
+            storage.retain(name, count)
+
+
+def release_media(instance: models.Model, field_name: str) -> None:
+    release_media_names(
+        getattr(instance, field_name).storage, get_media_names(instance, field_name)
+    )
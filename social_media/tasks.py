@@ -1,16 +1,246 @@
-from celery import shared_task
+import logging
+import time
+from datetime import timedelta
+
+from celery import shared_task, uuid
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, models
 from django.utils import timezone
 
-from social_media.models import PostponedPost
+from social_media import purge, timeline
+from social_media.cache import bump_profile_versions
+from social_media.exports import build_export
+from social_media.images import build_image_variants, get_variant_file_names
+from social_media.models import (
+    PostponedPost,
+    Post,
+    UploadSession,
+    UserProfile,
+    DataExport,
+)
+from social_media.replicas import check_replicas, use_replica
+from social_media.storage import release_media_names
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def publish_postponed_posts(spawn_workers: bool = True) -> dict:
+    """
+    Publish due postponed posts chunk by chunk.
+    When the first chunk is full, extra workers are started to drain
+    the backlog in parallel.
+    """
+    started_at = time.monotonic()
+    chunk_size = settings.POSTPONED_POST_PUBLISH_CHUNK_SIZE
+    processed = 0
+
+    while time.monotonic() - started_at < settings.POSTPONED_POST_PUBLISH_TIME_LIMIT:
+        posts = PostponedPost.publish_due(chunk_size)
+        if not posts:
+            break
+
+        if spawn_workers and processed == 0 and len(posts) == chunk_size:
+            for _ in range(settings.POSTPONED_POST_PUBLISH_WORKERS - 1):
+                publish_postponed_posts.delay(spawn_workers=False)
+
+        processed += len(posts)
+        for post in posts:
+            schedule_post_processing(post)
+
+    duration = time.monotonic() - started_at
+    logger.info("Published %s postponed posts in %.3f s", processed, duration)
+    return {"processed": processed, "duration": duration}
+
+
+@shared_task(bind=True)
+def publish_postponed_post(self, postponed_post_id: int) -> None:
+    postponed_post = PostponedPost.objects.filter(
+        id=postponed_post_id, published=False
+    ).first()
+
+    # The post was cancelled, rescheduled or already published by the sweep
+    if postponed_post is None or postponed_post.task_id != self.request.id:
+        return
+
+    if postponed_post.postponed_at > timezone.now():
+        schedule_postponed_post(postponed_post)
+        return
+
+    post = postponed_post.publish()
+    if post is not None:
+        schedule_post_processing(post)
+
+
+def schedule_postponed_post(postponed_post: PostponedPost) -> None:
+    """Enqueue publication of the post exactly at postponed_at"""
+    task_id = uuid()
+    PostponedPost.objects.filter(id=postponed_post.id).update(task_id=task_id)
+    postponed_post.task_id = task_id
+
+    transaction.on_commit(
+        lambda: publish_postponed_post.apply_async(
+            args=[postponed_post.id],
+            eta=postponed_post.postponed_at,
+            task_id=task_id,
+        )
+    )
+
+
+def revoke_postponed_post(postponed_post: PostponedPost) -> None:
+    if postponed_post.task_id:
+        task_id = postponed_post.task_id
+        transaction.on_commit(
+            lambda: publish_postponed_post.AsyncResult(task_id).revoke()
+        )
+
+
+@shared_task
+def fan_out_post(post_id: int) -> None:
+    timeline.fan_out_post(post_id)
+
+
+@shared_task
+def backfill_timeline(owner_id: int, author_id: int) -> None:
+    timeline.backfill_timeline(owner_id, author_id)
+
+
+@shared_task
+def trim_timeline(owner_id: int, author_id: int) -> None:
+    timeline.trim_timeline(owner_id, author_id)
+
+
+def schedule_fan_out(post_id: int) -> None:
+    if settings.TIMELINE_FANOUT_ENABLED:
+        transaction.on_commit(lambda: fan_out_post.delay(post_id))
+
+
+def schedule_backfill_timeline(owner_id: int, author_id: int) -> None:
+    if settings.TIMELINE_FANOUT_ENABLED:
+        transaction.on_commit(lambda: backfill_timeline.delay(owner_id, author_id))
+
+
+def schedule_trim_timeline(owner_id: int, author_id: int) -> None:
+    if settings.TIMELINE_FANOUT_ENABLED:
+        transaction.on_commit(lambda: trim_timeline.delay(owner_id, author_id))
 
 
 @shared_task
-def publish_postponed_posts() -> None:
+def generate_image_variants(model_label: str, pk: int, field_name: str) -> None:
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+
+    image = getattr(instance, field_name)
+    replaced_variant_names = get_variant_file_names(instance.image_variants)
+    variants = {}
+    if image:
+        try:
+            variants = build_image_variants(image)
+        except OSError:
+            logger.warning("Cannot build variants of %s", image.name, exc_info=True)
+            return
 
-    post_for_publication = PostponedPost.objects.filter(
-        published=False,
-        postponed_at__lte=timezone.now(),
+    # Skip the result if the image was replaced while encoding
+    changes = {"image_variants": variants}
+    if hasattr(model, "updated_at"):
+        changes["updated_at"] = timezone.now()
+    updated = model.objects.filter(pk=pk, **{field_name: image.name}).update(**changes)
+    if updated and model is UserProfile:
+        bump_profile_versions(pk)
+    release_media_names(
+        image.storage,
+        replaced_variant_names if updated else get_variant_file_names(variants),
     )
 
-    for post in post_for_publication.all():
-        post.publish()
+
+def schedule_image_variants(instance: models.Model, field_name: str) -> None:
+    model_label = instance._meta.label
+    transaction.on_commit(
+        lambda: generate_image_variants.delay(model_label, instance.pk, field_name)
+    )
+
+
+def schedule_post_processing(post: Post) -> None:
+    schedule_fan_out(post.id)
+    if post.image and not post.image_variants:
+        schedule_image_variants(post, "image")
+
+
+@shared_task
+def purge_upload_sessions() -> None:
+    expired_before = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    for upload in UploadSession.objects.filter(created_at__lt=expired_before):
+        upload.discard()
+
+
+@shared_task
+def export_user_data(export_id: str) -> None:
+    claimed = DataExport.objects.filter(
+        pk=export_id, status=DataExport.Status.PENDING
+    ).update(status=DataExport.Status.RUNNING)
+    if not claimed:
+        return
+
+    export = DataExport.objects.select_related("user_profile__user").get(pk=export_id)
+    try:
+        with use_replica():
+            build_export(export)
+    except Exception:
+        logger.exception("Cannot build data export %s", export_id)
+        export.status = DataExport.Status.FAILED
+    else:
+        export.status = DataExport.Status.COMPLETED
+
+    export.finished_at = timezone.now()
+    export.save(update_fields=["file", "status", "finished_at"])
+
+
+def schedule_data_export(export: DataExport) -> None:
+    export_id = str(export.id)
+    transaction.on_commit(lambda: export_user_data.delay(export_id))
+
+
+@shared_task
+def purge_data_exports() -> None:
+    expired_before = timezone.now() - timedelta(seconds=settings.DATA_EXPORT_TTL)
+    for export in DataExport.objects.filter(created_at__lt=expired_before):
+        export.file.delete(save=False)
+        export.delete()
+
+
+@shared_task
+def check_replica_lag() -> list[str]:
+    return check_replicas()
+
+
+@shared_task
+def purge_profile(user_profile_id: int) -> None:
+    """Purge a soft deleted profile, continuing in a new task past the time limit"""
+    lock_key = purge.get_purge_lock_key(user_profile_id)
+    if not cache.add(lock_key, 1, settings.PROFILE_PURGE_TIME_LIMIT * 2):
+        return
+
+    try:
+        finished = purge.purge_profile(user_profile_id)
+    finally:
+        cache.delete(lock_key)
+
+    if not finished:
+        purge_profile.delay(user_profile_id)
+
+
+def schedule_profile_purge(user_profile_id: int) -> None:
+    transaction.on_commit(lambda: purge_profile.delay(user_profile_id))
+
+
+@shared_task
+def purge_deleted_profiles() -> None:
+    """Restart purges whose tasks were lost, running ones hold the lock"""
+    for user_profile_id in UserProfile.objects.filter(
+        deleted_at__isnull=False
+    ).values_list("id", flat=True):
+        purge_profile.delay(user_profile_id)
@@ -0,0 +1,21 @@
+from django.http import HttpResponse
+
+
+def assert_query_budget(response: HttpResponse, budget: int | None = None) -> None:
+    """
+    Fail when the request behind a test client response ran more queries
+    than the budget, by default the query_budget declared on its view.
+    """
+    stats = getattr(response, "query_stats", None)
+    assert stats is not None, "QueryInstrumentationMiddleware is not installed"
+
+    budget = response.query_budget if budget is None else budget
+    assert budget is not None, "The view declares no query_budget"
+
+    if stats.count > budget:
+        statements = "\n".join(
+            f"{count} x {sql}" for sql, count in stats.statements.most_common()
+        )
+        raise AssertionError(
+            f"{stats.count} queries ran, the budget is {budget}:\n{statements}"
+        )
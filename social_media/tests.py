@@ -1,3 +1,1173 @@
-from django.test import TestCase
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import count
+from typing import Callable
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Count
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from knox.models import AuthToken
+from PIL import Image
+from rest_framework.test import APIClient
+
+from account.authentication import (
+    CachedTokenAuthentication,
+    evict_tokens,
+    get_cached_token,
+)
+from social_media import purge, tasks
+from social_media.cache import PROFILE_LIST_VERSION_KEY, get_version
+from social_media.events import (
+    EventBus,
+    coalesce_events,
+    format_event,
+    get_event_bus,
+    get_profile_channel,
+)
+from social_media.helpers import get_comment_path_segment
+from social_media.management.commands.generate_social_graph import iter_shuffled
+from social_media.models import (
+    UserProfile,
+    Post,
+    PostponedPost,
+    Comment,
+    Notification,
+    MediaBlob,
+    TimelineEntry,
+)
+from social_media.replicas import HEALTHY_REPLICAS_KEY, get_pin_key, use_replica
+from social_media.tasks import check_replica_lag, generate_image_variants
+from social_media.testing import assert_query_budget
+
+BASE_URL = "/api/v1/social-media/"
+
+
+def create_profile(username: str) -> UserProfile:
+    user = get_user_model().objects.create_user(
+        email=f"{username}@example.com", password="password", username=username
+    )
+    return UserProfile.objects.create(user=user, bio=f"Bio of {username}")
+
+
+def create_comment(
+    user_profile: UserProfile, post: Post, parent: Comment | None = None
+) -> Comment:
+    return Comment.objects.create(
+        user_profile=user_profile,
+        post=post,
+        content="Comment",
+        **Comment.get_thread_fields(parent),
+    )
+
+
+def get_image_file(size: tuple[int, int] = (50, 40)) -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new("RGB", size, (200, 100, 50)).save(buffer, "PNG")
+    return SimpleUploadedFile("image.png", buffer.getvalue(), "image/png")
+
+
+def use_temp_media(test_case: TestCase) -> str:
+    """Keep media and upload sessions of the test in a temporary directory"""
+    media_root = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, media_root)
+    media_settings = override_settings(
+        MEDIA_ROOT=media_root, UPLOAD_SESSION_ROOT=os.path.join(media_root, "uploads")
+    )
+    media_settings.enable()
+    test_case.addCleanup(media_settings.disable)
+    return media_root
+
+
+def get_client(user_profile: UserProfile) -> APIClient:
+    """Authenticate like the token cache does, the user comes with the profile"""
+    client = APIClient()
+    client.force_authenticate(
+        get_user_model().objects.select_related("profile").get(pk=user_profile.user_id)
+    )
+    return client
+
+
+def upload_image(client: APIClient, content: bytes) -> str:
+    """Upload the content in one chunk through an upload session"""
+    response = client.post(
+        f"{BASE_URL}uploads/", {"filename": "image.png", "size": len(content)}
+    )
+    url = f"{BASE_URL}uploads/{response.data['id']}/"
+    client.put(
+        url, content, content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=0
+    )
+    client.post(f"{url}complete/")
+    return response.data["id"]
+
+
+class QueryBudgetTests(TestCase):
+    """Every endpoint with a query_budget stays within it"""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.owner = create_profile("owner")
+        cls.author = create_profile("author")
+        cls.author.add_follower(cls.owner)
+
+        cls.own_post = Post.objects.create(user_profile=cls.owner, content="#own")
+        cls.post = Post.objects.create(user_profile=cls.author, content="#news")
+        UserProfile.update_counters(cls.owner.pk, post_count=1)
+        UserProfile.update_counters(cls.author.pk, post_count=1)
+        cls.own_post.add_like(cls.author)
+
+        cls.comment = create_comment(cls.owner, cls.post)
+        reply = create_comment(cls.author, cls.post, cls.comment)
+        create_comment(cls.owner, cls.post, reply)
+        Post.update_counters(cls.post.pk, comment_count=3)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = get_client(self.owner)
+
+    def assert_within_budget(self, response, status_code: int = 200) -> None:
+        self.assertEqual(response.status_code, status_code, response.content)
+        assert_query_budget(response)
+
+    def test_profile_endpoints(self) -> None:
+        self.assert_within_budget(self.client.get(f"{BASE_URL}user-profiles/"))
+        self.assert_within_budget(
+            self.client.get(f"{BASE_URL}user-profiles/{self.author.pk}/")
+        )
+        self.assert_within_budget(self.client.get(f"{BASE_URL}user-profiles/me/"))
+        self.assert_within_budget(
+            self.client.patch(f"{BASE_URL}user-profiles/me/", {"bio": "New bio"})
+        )
+        self.assert_within_budget(
+            self.client.patch(f"{BASE_URL}user-profiles/me/", {"username": "renamed"})
+        )
+        self.assert_within_budget(
+            self.client.get(f"{BASE_URL}user-profiles/me/followers/")
+        )
+        self.assert_within_budget(
+            self.client.get(f"{BASE_URL}user-profiles/me/followings/")
+        )
+
+    def test_follow_endpoints(self) -> None:
+        other = create_profile("other")
+        url = f"{BASE_URL}user-profiles/{other.pk}/"
+
+        self.assert_within_budget(self.client.post(f"{url}follow/"), 204)
+        self.assert_within_budget(self.client.post(f"{url}unfollow/"), 204)
+        ids = {"ids": [other.pk, self.author.pk]}
+        self.assert_within_budget(
+            self.client.post(f"{BASE_URL}user-profiles/follow/", ids, format="json")
+        )
+        self.assert_within_budget(
+            self.client.post(f"{BASE_URL}user-profiles/unfollow/", ids, format="json")
+        )
+
+    def test_post_endpoints(self) -> None:
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/"))
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/?hashtags=news"))
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/search/?q=news"))
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/liked_post/"))
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/{self.post.pk}/"))
+
+        response = self.client.post(f"{BASE_URL}posts/", {"content": "Hello #new"})
+        self.assert_within_budget(response, 201)
+        url = f"{BASE_URL}posts/{response.data['id']}/"
+        self.assert_within_budget(self.client.patch(url, {"content": "Hi #edited"}))
+        self.assert_within_budget(self.client.delete(url), 204)
+
+    def test_post_from_upload_session(self) -> None:
+        use_temp_media(self)
+        upload_id = upload_image(self.client, get_image_file().read())
+
+        response = self.client.post(
+            f"{BASE_URL}posts/", {"content": "Uploaded", "upload": upload_id}
+        )
+
+        self.assert_within_budget(response, 201)
+
+    @override_settings(TIMELINE_FANOUT_ENABLED=True)
+    def test_fan_out_post_list(self) -> None:
+        self.assert_within_budget(self.client.get(f"{BASE_URL}posts/"))
+
+    def test_like_endpoints(self) -> None:
+        url = f"{BASE_URL}posts/{self.post.pk}/"
+        ids = {"ids": [self.post.pk, self.own_post.pk]}
+
+        self.assert_within_budget(self.client.post(f"{url}like/"), 204)
+        self.assert_within_budget(self.client.post(f"{url}unlike/"), 204)
+        self.assert_within_budget(
+            self.client.post(f"{BASE_URL}posts/like/", ids, format="json")
+        )
+        self.assert_within_budget(
+            self.client.post(f"{BASE_URL}posts/unlike/", ids, format="json")
+        )
+
+    def test_comment_endpoints(self) -> None:
+        url = f"{BASE_URL}posts/{self.post.pk}/comments/"
+
+        self.assert_within_budget(self.client.get(url))
+        self.assert_within_budget(self.client.get(f"{url}{self.comment.pk}/"))
+        self.assert_within_budget(self.client.get(f"{url}{self.comment.pk}/thread/"))
+
+        response = self.client.post(
+            url, {"content": "Reply", "parent": self.comment.pk}
+        )
+        self.assert_within_budget(response, 201)
+        self.assert_within_budget(
+            self.client.patch(f"{url}{response.data['id']}/", {"content": "Edited"})
+        )
+        self.assert_within_budget(self.client.delete(f"{url}{self.comment.pk}/"), 204)
+
+    def test_notification_endpoints(self) -> None:
+        notification = Notification.objects.get(recipient=self.owner)
+        url = f"{BASE_URL}notifications/"
+
+        self.assert_within_budget(self.client.get(url))
+        self.assert_within_budget(self.client.get(f"{url}unread-count/"))
+        self.assert_within_budget(
+            self.client.post(f"{url}{notification.pk}/read/"), 204
+        )
+        self.assert_within_budget(self.client.post(f"{url}read/"), 204)
+
+    def test_data_export_endpoints(self) -> None:
+        url = f"{BASE_URL}exports/"
+
+        response = self.client.post(url, {"include_media": False})
+        self.assert_within_budget(response, 202)
+        self.assert_within_budget(self.client.get(url))
+        self.assert_within_budget(self.client.get(f"{url}{response.data['id']}/"))
+        self.assert_within_budget(
+            self.client.get(f"{url}{response.data['id']}/download/"), 409
+        )
+
+    def test_async_endpoints(self) -> None:
+        _, token = AuthToken.objects.create(self.owner.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        # The first request puts the token into the cache
+        client.get(f"{BASE_URL}async/posts/")
+
+        self.assert_within_budget(client.get(f"{BASE_URL}async/posts/"))
+        self.assert_within_budget(client.get(f"{BASE_URL}async/posts/{self.post.pk}/"))
+        self.assert_within_budget(
+            client.get(f"{BASE_URL}async/posts/{self.post.pk}/comments/")
+        )
+        self.assert_within_budget(
+            client.get(f"{BASE_URL}async/user-profiles/{self.author.pk}/")
+        )
+        self.assert_within_budget(client.post(f"{BASE_URL}events/ticket/"))
+
+    def test_delete_own_profile(self) -> None:
+        self.assert_within_budget(
+            self.client.delete(f"{BASE_URL}user-profiles/me/"), 204
+        )
+
+
+class PostponedPostTests(TestCase):
+    """Publication tasks are queued and revoked through mocks, run with apply"""
+
+    def setUp(self) -> None:
+        self.owner = create_profile("owner")
+        self.client = get_client(self.owner)
+        apply_async = mock.patch.object(tasks.publish_postponed_post, "apply_async")
+        async_result = mock.patch.object(tasks.publish_postponed_post, "AsyncResult")
+        self.apply_async = apply_async.start()
+        self.async_result = async_result.start()
+        self.addCleanup(apply_async.stop)
+        self.addCleanup(async_result.stop)
+
+        postponed_at = timezone.now() + timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"{BASE_URL}posts/create-postponed-post/",
+                {"content": "Later", "postponed_at": postponed_at.isoformat()},
+            )
+        self.assertEqual(response.status_code, 201)
+        self.postponed_post = PostponedPost.objects.get(pk=response.data["id"])
+        self.url = f"{BASE_URL}posts/postponed-posts/{self.postponed_post.pk}/"
+
+    def test_creation_queues_the_post_at_its_time(self) -> None:
+        self.apply_async.assert_called_once_with(
+            args=[self.postponed_post.pk],
+            eta=self.postponed_post.postponed_at,
+            task_id=self.postponed_post.task_id,
+        )
+
+    def test_cancel_revokes_and_deletes(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{self.url}cancel/")
+
+        self.assertEqual(response.status_code, 204)
+        self.async_result.assert_called_once_with(self.postponed_post.task_id)
+        self.async_result.return_value.revoke.assert_called_once_with()
+        self.assertFalse(PostponedPost.objects.exists())
+        self.assertEqual(self.client.post(f"{self.url}cancel/").status_code, 404)
+
+    def test_reschedule_replaces_the_task(self) -> None:
+        postponed_at = timezone.now() + timedelta(days=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"{self.url}reschedule/", {"postponed_at": postponed_at.isoformat()}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.async_result.assert_called_once_with(self.postponed_post.task_id)
+        rescheduled = PostponedPost.objects.get(pk=self.postponed_post.pk)
+        self.assertEqual(rescheduled.postponed_at, postponed_at)
+        self.assertNotEqual(rescheduled.task_id, self.postponed_post.task_id)
+        self.apply_async.assert_called_with(
+            args=[rescheduled.pk], eta=postponed_at, task_id=rescheduled.task_id
+        )
+
+    def test_only_the_current_task_publishes(self) -> None:
+        PostponedPost.objects.filter(pk=self.postponed_post.pk).update(
+            postponed_at=timezone.now(), task_id="current"
+        )
+
+        tasks.publish_postponed_post.apply(
+            args=[self.postponed_post.pk], task_id=self.postponed_post.task_id
+        )
+        self.assertFalse(Post.objects.exists())
+        tasks.publish_postponed_post.apply(
+            args=[self.postponed_post.pk], task_id="current"
+        )
+        self.assertTrue(Post.objects.filter(content="Later").exists())
+
+    def test_published_and_foreign_posts_cannot_be_changed(self) -> None:
+        other_client = get_client(create_profile("other"))
+        self.assertEqual(other_client.post(f"{self.url}cancel/").status_code, 404)
+
+        PostponedPost.objects.update(published=True)
+
+        self.assertEqual(self.client.post(f"{self.url}cancel/").status_code, 404)
+        response = self.client.post(
+            f"{self.url}reschedule/", {"postponed_at": timezone.now().isoformat()}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self) -> None:
+        use_temp_media(self)
+        self.content = get_image_file().read()
+        self.client = get_client(create_profile("owner"))
+        response = self.client.post(
+            f"{BASE_URL}uploads/", {"filename": "image.png", "size": len(self.content)}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.url = f"{BASE_URL}uploads/{response.data['id']}/"
+
+    def put_chunk(self, chunk: bytes, offset: int):
+        return self.client.put(
+            self.url,
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=offset,
+        )
+
+    def test_chunks_must_start_at_the_offset(self) -> None:
+        self.assertEqual(self.put_chunk(self.content[:10], 0).status_code, 200)
+
+        response = self.put_chunk(self.content[10:], 0)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 10)
+        self.assertEqual(self.put_chunk(self.content[10:], 10).status_code, 200)
+        self.assertEqual(self.client.post(f"{self.url}complete/").status_code, 200)
+        self.assertEqual(self.put_chunk(b"x", len(self.content)).status_code, 409)
+
+    def test_oversized_uploads_are_rejected(self) -> None:
+        response = self.put_chunk(self.content + b"extra", 0)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).data["offset"], 0)
+        response = self.client.post(
+            f"{BASE_URL}uploads/",
+            {"filename": "image.png", "size": settings.UPLOAD_MAX_SIZE + 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("size", response.data)
+
+    def test_incomplete_uploads_cannot_complete(self) -> None:
+        self.put_chunk(self.content[:10], 0)
+
+        self.assertEqual(self.client.post(f"{self.url}complete/").status_code, 400)
+
+    def test_sessions_of_other_users_are_not_found(self) -> None:
+        self.client = get_client(create_profile("other"))
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.put_chunk(self.content, 0).status_code, 404)
+        self.assertEqual(self.client.post(f"{self.url}complete/").status_code, 404)
+
+
+class HashtagFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.owner = create_profile("owner")
+        cls.python = Post.objects.create(user_profile=cls.owner, content="#python")
+        cls.py = Post.objects.create(user_profile=cls.owner, content="#Py")
+        cls.both = Post.objects.create(
+            user_profile=cls.owner, content="#py and #django"
+        )
+        for post in [cls.python, cls.py, cls.both]:
+            post.sync_hashtags(replace=False)
+
+    def get_post_ids(self, query: str) -> set[int]:
+        response = get_client(self.owner).get(f"{BASE_URL}posts/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return {post["id"] for post in response.data["results"]}
+
+    def test_hashtags_match_whole_names(self) -> None:
+        self.assertEqual(self.get_post_ids("hashtags=py"), {self.py.pk, self.both.pk})
+        self.assertEqual(self.get_post_ids("hashtags=%23PYTHON"), {self.python.pk})
+        self.assertEqual(self.get_post_ids("hashtags=pyth"), set())
+
+    def test_posts_match_any_hashtag_by_default(self) -> None:
+        expected = {self.python.pk, self.both.pk}
+
+        self.assertEqual(self.get_post_ids("hashtags=python&hashtags=django"), expected)
+        self.assertEqual(
+            self.get_post_ids("hashtags=python&hashtags=django&hashtags_match=any"),
+            expected,
+        )
+
+    def test_posts_match_all_hashtags(self) -> None:
+        self.assertEqual(
+            self.get_post_ids("hashtags=py&hashtags=django&hashtags_match=all"),
+            {self.both.pk},
+        )
+        self.assertEqual(
+            self.get_post_ids("hashtags=py&hashtags=python&hashtags_match=all"),
+            set(),
+        )
+
+
+@override_settings(TIMELINE_FANOUT_ENABLED=True)
+class TimelineFanOutTests(TestCase):
+    """The timeline tasks run in the test, as a worker would run them"""
+
+    def setUp(self) -> None:
+        self.owner = create_profile("owner")
+        self.author = create_profile("author")
+        self.client = get_client(self.owner)
+        for name in ["fan_out_post", "backfill_timeline", "trim_timeline"]:
+            task = getattr(tasks, name)
+            patcher = mock.patch.object(task, "delay", side_effect=task)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_timeline_post_ids(self) -> list[int]:
+        response = self.client.get(f"{BASE_URL}posts/")
+        self.assertEqual(response.status_code, 200)
+        return [post["id"] for post in response.data["results"]]
+
+    def follow(self, action: str = "follow") -> None:
+        url = f"{BASE_URL}user-profiles/{self.author.pk}/{action}/"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 204)
+
+    def test_follow_backfills_the_timeline(self) -> None:
+        posts = [
+            Post.objects.create(user_profile=self.author, content=f"Post {i}")
+            for i in range(3)
+        ]
+        self.assertEqual(self.get_timeline_post_ids(), [])
+
+        self.follow()
+
+        self.assertEqual(
+            self.get_timeline_post_ids(), [post.pk for post in reversed(posts)]
+        )
+
+    def test_unfollow_trims_the_timeline(self) -> None:
+        Post.objects.create(user_profile=self.author, content="Post")
+        own_post = Post.objects.create(user_profile=self.owner, content="Own")
+        TimelineEntry.objects.create(owner=self.owner, post=own_post)
+        self.follow()
+
+        self.follow("unfollow")
+
+        self.assertEqual(self.get_timeline_post_ids(), [own_post.pk])
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                owner=self.owner, post__user_profile=self.author
+            ).exists()
+        )
+
+    def test_deleted_posts_leave_the_timeline(self) -> None:
+        self.follow()
+        author_client = get_client(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = author_client.post(f"{BASE_URL}posts/", {"content": "New"})
+        self.assertEqual(self.get_timeline_post_ids(), [response.data["id"]])
+
+        url = f"{BASE_URL}posts/{response.data['id']}/"
+        self.assertEqual(author_client.delete(url).status_code, 204)
+
+        self.assertEqual(self.get_timeline_post_ids(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+class MediaStorageTests(TestCase):
+    """
+    A 50x40 image encodes to the same bytes at every variant size,
+    so each of its jpeg and webp blobs is referenced three times per row.
+    """
+
+    def setUp(self) -> None:
+        self.media_root = use_temp_media(self)
+        self.user_profile = create_profile("owner")
+
+    def add_variants(self, instance: Post | PostponedPost) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_image_variants(instance._meta.label, instance.pk, "image")
+        instance.refresh_from_db()
+
+    def create_post(self) -> Post:
+        post = Post.objects.create(
+            user_profile=self.user_profile, content="Image", image=get_image_file()
+        )
+        self.add_variants(post)
+        return post
+
+    def get_ref_counts(self) -> list[int]:
+        return sorted(MediaBlob.objects.values_list("ref_count", flat=True))
+
+    def get_stored_files(self) -> list[str]:
+        return [
+            name
+            for _, _, names in os.walk(os.path.join(self.media_root, "blobs"))
+            for name in names
+        ]
+
+    def test_identical_files_are_counted_per_reference(self) -> None:
+        first_post = self.create_post()
+        second_post = self.create_post()
+
+        self.assertEqual(first_post.image.name, second_post.image.name)
+        self.assertEqual(self.get_ref_counts(), [2, 6, 6])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first_post.delete()
+        self.assertEqual(self.get_ref_counts(), [1, 3, 3])
+        self.assertEqual(len(self.get_stored_files()), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second_post.delete()
+        self.assertEqual(self.get_ref_counts(), [])
+        self.assertEqual(self.get_stored_files(), [])
+
+    def test_published_posts_retain_the_media(self) -> None:
+        postponed_post = PostponedPost.objects.create(
+            user_profile=self.user_profile,
+            content="Image",
+            image=get_image_file(),
+            postponed_at=timezone.now(),
+        )
+        self.add_variants(postponed_post)
+
+        [post] = PostponedPost.publish_many([postponed_post])
+
+        self.assertEqual(self.get_ref_counts(), [2, 6, 6])
+        with self.captureOnCommitCallbacks(execute=True):
+            postponed_post.delete()
+            post.delete()
+        self.assertEqual(self.get_stored_files(), [])
+
+    def test_replaced_variants_are_released(self) -> None:
+        post = self.create_post()
+
+        self.add_variants(post)
+
+        self.assertEqual(self.get_ref_counts(), [1, 3, 3])
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self) -> None:
+        self.user_profile = create_profile("owner")
+        self.post = Post.objects.create(user_profile=self.user_profile, content="Post")
+        self.client = get_client(self.user_profile)
+        self.comments_url = f"{BASE_URL}posts/{self.post.pk}/comments/"
+
+    def reply(self, parent: int | None = None) -> int:
+        data = {} if parent is None else {"parent": parent}
+        response = self.client.post(self.comments_url, {"content": "Comment", **data})
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def get_ids(self, url: str) -> list[int]:
+        return [comment["id"] for comment in self.client.get(url).data["results"]]
+
+    def test_replies_extend_the_path_of_their_parent(self) -> None:
+        root = Comment.objects.get(pk=self.reply())
+        reply = Comment.objects.get(pk=self.reply(root.id))
+        nested_reply = Comment.objects.get(pk=self.reply(reply.id))
+
+        self.assertEqual((root.root_id, root.depth), (root.id, 0))
+        self.assertEqual(root.path, get_comment_path_segment(root.id))
+        self.assertEqual((reply.root_id, reply.depth), (root.id, 1))
+        self.assertEqual(reply.path, root.path + get_comment_path_segment(reply.id))
+        self.assertEqual((nested_reply.root_id, nested_reply.depth), (root.id, 2))
+        self.assertTrue(nested_reply.path.startswith(reply.path))
+
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_replies_deeper_than_max_depth_are_rejected(self) -> None:
+        reply_id = self.reply(self.reply())
+
+        response = self.client.post(
+            self.comments_url, {"content": "Reply", "parent": reply_id}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parent", response.data)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_deleting_a_comment_deletes_its_replies(self) -> None:
+        root_id = self.reply()
+        reply_id = self.reply(root_id)
+        self.reply(self.reply(reply_id))
+        sibling_id = self.reply(root_id)
+
+        response = self.client.delete(f"{self.comments_url}{reply_id}/")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            set(Comment.objects.values_list("id", flat=True)), {root_id, sibling_id}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    @override_settings(COMMENT_THREAD_PREVIEW_SIZE=2)
+    def test_threads_are_listed_with_previews_in_thread_order(self) -> None:
+        root_id = self.reply()
+        first_reply_id = self.reply(root_id)
+        second_reply_id = self.reply(root_id)
+        nested_reply_id = self.reply(first_reply_id)
+        newer_root_id = self.reply()
+
+        threads = self.client.get(self.comments_url).data["results"]
+
+        self.assertEqual([thread["id"] for thread in threads], [newer_root_id, root_id])
+        self.assertEqual(threads[0]["reply_count"], 0)
+        self.assertEqual(threads[1]["reply_count"], 3)
+        self.assertEqual(
+            [reply["id"] for reply in threads[1]["replies"]],
+            [first_reply_id, nested_reply_id],
+        )
+        self.assertEqual(
+            self.get_ids(f"{self.comments_url}{root_id}/thread/"),
+            [root_id, first_reply_id, nested_reply_id, second_reply_id],
+        )
+        self.assertEqual(
+            self.get_ids(f"{self.comments_url}{first_reply_id}/thread/"),
+            [first_reply_id, nested_reply_id],
+        )
+
+
+class NotificationCountTests(TestCase):
+    def test_post_delete_leaves_unread_counts(self) -> None:
+        author = create_profile("author")
+        commenter = create_profile("commenter")
+        replier = create_profile("replier")
+        post = Post.objects.create(user_profile=author, content="Post")
+        UserProfile.update_counters(author.pk, post_count=1)
+        # The reply notifies the commenter about a post of someone else
+        Notification.notify(author.pk, "comment", commenter.pk, post.pk)
+        Notification.notify(commenter.pk, "comment", replier.pk, post.pk)
+        Notification.notify(commenter.pk, "follow", replier.pk)
+
+        response = get_client(author).delete(f"{BASE_URL}posts/{post.pk}/")
+
+        self.assertEqual(response.status_code, 204)
+        counts = dict(
+            UserProfile.objects.values_list("pk", "unread_notification_count")
+        )
+        self.assertEqual(counts[author.pk], 0)
+        self.assertEqual(counts[commenter.pk], 1)
+
+
+class ProfilePurgeTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.owner = create_profile("owner")
+        self.other = create_profile("other")
+        self.other.add_follower(self.owner)
+        self.owner.add_follower(self.other)
+
+        self.post = Post.objects.create(user_profile=self.other, content="Other")
+        self.post.add_like(self.owner)
+        create_comment(self.owner, self.post)
+        Post.update_counters(self.post.pk, comment_count=1)
+
+        self.own_post = Post.objects.create(user_profile=self.owner, content="Own")
+        root = create_comment(self.other, self.own_post)
+        reply = create_comment(self.owner, self.own_post, root)
+        create_comment(self.other, self.own_post, reply)
+        Notification.notify(
+            self.other.pk, Notification.Verb.COMMENT, self.owner.pk, self.own_post.pk
+        )
+
+    def assert_purged(self) -> None:
+        self.assertFalse(UserProfile.objects.filter(pk=self.owner.pk).exists())
+        self.assertFalse(Post.objects.filter(pk=self.own_post.pk).exists())
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.follower_count, 0)
+        self.assertEqual(self.other.following_count, 0)
+        # The follow and like notifications stay, the one of the own post goes
+        self.assertEqual(self.other.unread_notification_count, 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_delete_own_profile_soft_deletes_it(self) -> None:
+        client = get_client(self.owner)
+
+        with mock.patch("social_media.tasks.purge_profile.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.delete(f"{BASE_URL}user-profiles/me/")
+
+        self.assertEqual(response.status_code, 204)
+        delay.assert_called_once_with(self.owner.pk)
+        self.owner.refresh_from_db()
+        self.assertIsNotNone(self.owner.deleted_at)
+        response = get_client(self.other).get(f"{BASE_URL}user-profiles/")
+        self.assertEqual(
+            [user_profile["id"] for user_profile in response.data["results"]],
+            [self.other.pk],
+        )
+
+    def test_purge_decrements_counters(self) -> None:
+        self.owner.soft_delete()
+
+        self.assertTrue(purge.purge_profile(self.owner.pk))
+
+        self.assert_purged()
+
+    @override_settings(
+        PROFILE_PURGE_BATCH_SIZE=1,
+        PROFILE_PURGE_BATCH_DELAY=0,
+        PROFILE_PURGE_TIME_LIMIT=2,
+    )
+    def test_purge_resumes_after_time_limit(self) -> None:
+        self.owner.soft_delete()
+
+        # Every clock reading is a second later, only the followings get done
+        with mock.patch("social_media.purge.time.monotonic", side_effect=count()):
+            self.assertFalse(purge.purge_profile(self.owner.pk))
+
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.follower_count, 0)
+        self.assertEqual(self.other.following_count, 1)
+        self.assertTrue(Post.objects.filter(pk=self.own_post.pk).exists())
+
+        self.assertTrue(purge.purge_profile(self.owner.pk))
+
+        self.assert_purged()
+
+    def test_purge_post_comments_stays_in_batch(self) -> None:
+        self.assertEqual(purge.purge_post_comments(self.owner.pk, 1), 1)
+
+        self.assertEqual(Comment.objects.filter(post=self.own_post).count(), 2)
+
+    def test_purge_comments_is_bounded_by_rows(self) -> None:
+        # Replies of other profiles go with the comment they answer
+        comment = Comment.objects.get(post=self.post)
+        reply = create_comment(self.other, self.post, comment)
+        create_comment(self.other, self.post, reply)
+        create_comment(self.other, self.post, comment)
+        other_comment = create_comment(self.other, self.post)
+        Post.update_counters(self.post.pk, comment_count=4)
+
+        self.assertEqual(purge.purge_comments(self.owner.pk, 2), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+
+        self.assertEqual(purge.purge_comments(self.owner.pk, 2), 2)
+        self.assertEqual(purge.purge_comments(self.owner.pk, 2), 0)
+        self.assertEqual(list(Comment.objects.filter(post=self.post)), [other_comment])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.owner = create_profile("owner")
+        self.author = create_profile("author")
+        self.client = get_client(self.owner)
+
+    def get_profiles(self) -> tuple[dict, str]:
+        response = self.client.get(f"{BASE_URL}user-profiles/")
+        profiles = {profile["id"]: profile for profile in response.data["results"]}
+        return profiles, response["X-Cache"]
+
+    def test_profile_list_is_cached(self) -> None:
+        self.get_profiles()
+
+        _, cache_status = self.get_profiles()
+
+        self.assertEqual(cache_status, "HIT")
+
+    def test_profile_update_drops_cached_profile_list(self) -> None:
+        self.get_profiles()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"{BASE_URL}user-profiles/me/", {"bio": "New bio"})
+        profiles, cache_status = self.get_profiles()
+
+        self.assertEqual(cache_status, "MISS")
+        self.assertEqual(profiles[self.owner.pk]["bio"], "New bio")
+
+    def test_follow_drops_cached_profile_list(self) -> None:
+        version = get_version(PROFILE_LIST_VERSION_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"{BASE_URL}user-profiles/{self.author.pk}/follow/"
+            )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertNotEqual(get_version(PROFILE_LIST_VERSION_KEY), version)
+
+
+class GenerateSocialGraphTests(TestCase):
+    def test_generate_social_graph(self) -> None:
+        call_command("generate_social_graph", users=20, stdout=StringIO())
+
+        self.assertEqual(UserProfile.objects.count(), 20)
+        self.assertTrue(Post.objects.exists())
+        self.assertFalse(UserProfile.objects.exclude(unread_notification_count=0))
+
+    def test_counters_match_rows_across_chunks(self) -> None:
+        call_command("generate_social_graph", users=30, chunk_size=7, stdout=StringIO())
+
+        for user_profile in UserProfile.objects.annotate(
+            post_rows=Count("posts", distinct=True),
+            follower_rows=Count("followers", distinct=True),
+        ):
+            self.assertEqual(user_profile.post_count, user_profile.post_rows)
+            self.assertEqual(user_profile.follower_count, user_profile.follower_rows)
+        for post in Post.objects.annotate(comment_rows=Count("comments")):
+            self.assertEqual(post.comment_count, post.comment_rows)
+
+    def test_shuffled_indexes_keep_their_counts(self) -> None:
+        indexes = list(iter_shuffled([3, 0, 2, 1], random.Random(0)))
+
+        self.assertEqual(sorted(indexes), [0, 0, 0, 2, 2, 3])
+
+
+@skipUnless("replica_0" in settings.DATABASES, "needs the test settings")
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    replica_0 mirrors the test database, the queries captured
+    on its connection tell which reads were routed to it.
+    Outside of TestCase so reads aren't inside its atomic block.
+    """
+
+    databases = {"default", *settings.DATABASE_REPLICAS}
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        cache.set(HEALTHY_REPLICAS_KEY, ["replica_0"])
+        self.user_profile = create_profile("owner")
+        self.post = Post.objects.create(user_profile=self.user_profile, content="Post")
+        self.client = get_client(self.user_profile)
+
+    def count_replica_reads(self, read: Callable[[], object]) -> int:
+        with CaptureQueriesContext(connections["replica_0"]) as queries:
+            read()
+        return len(queries)
+
+    def get_post(self) -> None:
+        response = self.client.get(f"{BASE_URL}posts/{self.post.pk}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_safe_requests_read_from_replica(self) -> None:
+        self.assertGreater(self.count_replica_reads(self.get_post), 0)
+
+    def test_unsafe_requests_pin_user_to_primary(self) -> None:
+        response = self.client.post(f"{BASE_URL}notifications/read/")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNotNone(cache.get(get_pin_key(self.user_profile.user_id)))
+        self.assertEqual(self.count_replica_reads(self.get_post), 0)
+
+        cache.delete(get_pin_key(self.user_profile.user_id))
+        self.assertGreater(self.count_replica_reads(self.get_post), 0)
+
+    def test_atomic_blocks_read_from_primary(self) -> None:
+        def read_in_atomic_block() -> None:
+            with transaction.atomic():
+                Post.objects.get(pk=self.post.pk)
+
+        with use_replica():
+            self.assertEqual(self.count_replica_reads(read_in_atomic_block), 0)
+
+    def test_use_replica_routes_task_reads(self) -> None:
+        def read_post() -> None:
+            Post.objects.get(pk=self.post.pk)
+
+        def read_user() -> None:
+            get_user_model().objects.get(pk=self.user_profile.user_id)
+
+        self.assertEqual(self.count_replica_reads(read_post), 0)
+        with use_replica():
+            self.assertEqual(self.count_replica_reads(read_post), 1)
+            # Authentication models stay on the primary
+            self.assertEqual(self.count_replica_reads(read_user), 0)
+
+    def test_check_replicas_drops_lagging_replica(self) -> None:
+        self.assertEqual(check_replica_lag(), ["replica_0"])
+
+        with mock.patch(
+            "social_media.replicas.get_replica_lag",
+            return_value=settings.REPLICA_MAX_LAG + 1,
+        ):
+            self.assertEqual(check_replica_lag(), [])
+
+        self.assertEqual(self.count_replica_reads(self.get_post), 0)
+
+
+class ProfileTokenEvictionTests(TestCase):
+    def test_new_profile_evicts_owner_tokens_on_commit(self) -> None:
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password", username="user"
+        )
+        auth_token, token = AuthToken.objects.create(user)
+        CachedTokenAuthentication().authenticate_credentials(token.encode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.create(user=user)
+            # Requests before the commit still see the user without a profile
+            self.assertIsNotNone(get_cached_token(auth_token.digest))
+
+        self.assertIsNone(get_cached_token(auth_token.digest))
+
+
+class CommentListETagTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.author = create_profile("author")
+        self.commenter = create_profile("commenter")
+        self.post = Post.objects.create(user_profile=self.author, content="Post")
+        create_comment(self.commenter, self.post)
+        create_comment(self.author, self.post)
+        _, token = AuthToken.objects.create(self.author.user)
+        CachedTokenAuthentication().authenticate_credentials(token.encode())
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def get_etags(self) -> list[str]:
+        return [
+            self.client.get(f"{BASE_URL}{prefix}posts/{self.post.pk}/comments/")["ETag"]
+            for prefix in ("", "async/")
+        ]
+
+    def test_sync_and_async_etags_match(self) -> None:
+        sync_etag, async_etag = self.get_etags()
+
+        self.assertEqual(sync_etag, async_etag)
+
+    def test_soft_deleted_commenter_changes_etags(self) -> None:
+        etags = self.get_etags()
+
+        self.commenter.soft_delete()
+
+        sync_etag, async_etag = self.get_etags()
+        self.assertNotEqual(sync_etag, etags[0])
+        self.assertEqual(sync_etag, async_etag)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.author = create_profile("author")
+        self.post = Post.objects.create(user_profile=self.author, content="Post")
+        create_comment(self.author, self.post)
+        self.client = get_client(self.author)
+        self.urls = [
+            f"{BASE_URL}posts/{self.post.pk}/",
+            f"{BASE_URL}posts/{self.post.pk}/comments/",
+            f"{BASE_URL}user-profiles/{self.author.pk}/",
+        ]
+
+    def test_current_etags_are_not_modified(self) -> None:
+        for url in self.urls:
+            etag = self.client.get(url)["ETag"]
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+
+    def test_changes_are_sent_with_a_new_etag(self) -> None:
+        url = f"{BASE_URL}posts/{self.post.pk}/"
+        etag = self.client.get(url)["ETag"]
+
+        self.post.add_like(create_profile("fan"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["count_likes"], 1)
+
+    def test_unchanged_since_last_modified(self) -> None:
+        url = f"{BASE_URL}posts/{self.post.pk}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_failed_preconditions(self) -> None:
+        url = f"{BASE_URL}posts/{self.post.pk}/"
+        an_hour_ago = http_date((timezone.now() - timedelta(hours=1)).timestamp())
+
+        response = self.client.get(url, HTTP_IF_MATCH='"stale"')
+        self.assertEqual(response.status_code, 412)
+        response = self.client.get(url, HTTP_IF_UNMODIFIED_SINCE=an_hour_ago)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.get(url, HTTP_IF_MATCH=self.client.get(url)["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user_profile = create_profile("owner")
+        self.auth_token, token = AuthToken.objects.create(self.user_profile.user)
+        CachedTokenAuthentication().authenticate_credentials(token.encode())
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def get_ticket(self) -> str:
+        response = self.client.post(f"{BASE_URL}events/ticket/")
+        self.assertEqual(response.status_code, 200)
+        return response.data["ticket"]
+
+    def test_coalesce_events_merges_bursts_per_post(self) -> None:
+        events = [
+            {"type": "like", "post_id": 1, "actor_id": 2},
+            {"type": "comment", "post_id": 1, "actor_id": 2},
+            {"type": "like", "post_id": 1, "actor_id": 3},
+            {"type": "like", "post_id": 2, "actor_id": 2},
+        ]
+
+        self.assertEqual(
+            coalesce_events(events),
+            [
+                {"type": "comment", "post_id": 1, "actor_id": 2, "count": 1},
+                {"type": "like", "post_id": 1, "actor_id": 3, "count": 2},
+                {"type": "like", "post_id": 2, "actor_id": 2, "count": 1},
+            ],
+        )
+
+    def test_full_queues_drop_the_oldest_event(self) -> None:
+        queue = asyncio.Queue(2)
+
+        for index in range(3):
+            EventBus.put_latest(queue, {"index": index})
+
+        self.assertEqual(
+            [queue.get_nowait()["index"] for _ in range(queue.qsize())], [1, 2]
+        )
+
+    @override_settings(EVENT_STREAM_COALESCE_WINDOW=0.01)
+    async def test_stream_opened_with_ticket_sends_coalesced_events(self) -> None:
+        ticket = await sync_to_async(self.get_ticket)()
+
+        response = await self.async_client.get(f"{BASE_URL}events/?ticket={ticket}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        channel = get_profile_channel(self.user_profile.pk)
+        for actor_id in (2, 3):
+            get_event_bus().publish(
+                channel, {"type": "like", "post_id": 1, "actor_id": actor_id}
+            )
+
+        message = await asyncio.wait_for(anext(stream), 5)
+        await response.streaming_content.aclose()
+        self.assertEqual(
+            message,
+            format_event(
+                {"type": "like", "post_id": 1, "actor_id": 3, "count": 2}
+            ).encode(),
+        )
+
+    async def test_tickets_are_single_use(self) -> None:
+        ticket = await sync_to_async(self.get_ticket)()
+        url = f"{BASE_URL}events/?ticket={ticket}"
+
+        response = await self.async_client.get(url)
+        await response.streaming_content.aclose()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+    def test_revoked_tokens_void_their_tickets(self) -> None:
+        ticket = self.get_ticket()
+        with self.captureOnCommitCallbacks(execute=True):
+            evict_tokens(self.auth_token.digest)
+
+        response = self.client.get(f"{BASE_URL}events/?ticket={ticket}")
+
+        self.assertEqual(response.status_code, 401)
+
+
+class MetricsTests(TestCase):
+    def test_staff_read_query_metrics(self) -> None:
+        user_profile = create_profile("staff")
+        get_user_model().objects.filter(pk=user_profile.user_id).update(is_staff=True)
+        client = get_client(user_profile)
+        client.get(f"{BASE_URL}posts/")
+
+        response = client.get(f"{BASE_URL}metrics/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(
+            response.data["queries"]["PostViewSet.list"]["requests"], 1
+        )
+        self.assertIn("saturation", response.data["pools"]["default"])
+
+    def test_staff_read_cache_metrics(self) -> None:
+        cache.clear()
+        user_profile = create_profile("staff")
+        get_user_model().objects.filter(pk=user_profile.user_id).update(is_staff=True)
+        client = get_client(user_profile)
+        client.get(f"{BASE_URL}user-profiles/")
+        client.get(f"{BASE_URL}user-profiles/")
+
+        response = client.get(f"{BASE_URL}metrics/")
+
+        self.assertGreaterEqual(response.data["cache"]["profile_list.hit"], 1)
+        self.assertGreaterEqual(response.data["cache"]["profile_list.miss"], 1)
+
+    def test_metrics_are_staff_only(self) -> None:
+        client = get_client(create_profile("member"))
+
+        response = client.get(f"{BASE_URL}metrics/")
+
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.db.models import QuerySet, Q
+
+from social_media.models import UserProfile, Post, TimelineEntry
+
+FollowThrough = UserProfile.followers.through
+
+
+def get_follower_count(user_profile_id: int) -> int:
+    return (
+        UserProfile.objects.filter(id=user_profile_id)
+        .values_list("follower_count", flat=True)
+        .first()
+        or 0
+    )
+
+
+def is_pulled_author(user_profile_id: int) -> bool:
+    """
+    Authors with huge audiences are not fanned out on write,
+    their posts are pulled into the timeline at read time instead.
+    """
+    return get_follower_count(user_profile_id) > settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def get_pulled_authors(user_profile: UserProfile) -> QuerySet:
+    return user_profile.followings.filter(
+        follower_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+        deleted_at__isnull=True,
+    ).values_list("id", flat=True)
+
+
+def filter_home_timeline(
+    user_profile: UserProfile, pulled_author_ids: list[int]
+) -> QuerySet:
+    timeline_post_ids = TimelineEntry.objects.filter(owner=user_profile).values(
+        "post_id"
+    )
+    q = Q(id__in=timeline_post_ids)
+
+    if pulled_author_ids:
+        q |= Q(user_profile_id__in=pulled_author_ids)
+
+    # Entries of soft deleted authors stay until the purge reaches them
+    return Post.objects.filter(q, user_profile__deleted_at__isnull=True)
+
+
+def get_home_timeline(user_profile: UserProfile) -> QuerySet:
+    return filter_home_timeline(user_profile, list(get_pulled_authors(user_profile)))
+
+
+async def aget_home_timeline(user_profile: UserProfile) -> QuerySet:
+    pulled_author_ids = [
+        author_id async for author_id in get_pulled_authors(user_profile)
+    ]
+    return filter_home_timeline(user_profile, pulled_author_ids)
+
+
+def bulk_insert_entries(entries: list[TimelineEntry]) -> None:
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post_id: int) -> None:
+    author_id = (
+        Post.objects.filter(id=post_id)
+        .values_list("user_profile_id", flat=True)
+        .first()
+    )
+    if author_id is None:
+        return
+
+    bulk_insert_entries([TimelineEntry(owner_id=author_id, post_id=post_id)])
+
+    if is_pulled_author(author_id):
+        return
+
+    follower_ids = FollowThrough.objects.filter(
+        from_userprofile_id=author_id
+    ).values_list("to_userprofile_id", flat=True)
+
+    batch = []
+    for follower_id in follower_ids.iterator(
+        chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE
+    ):
+        batch.append(TimelineEntry(owner_id=follower_id, post_id=post_id))
+        if len(batch) >= settings.TIMELINE_FANOUT_BATCH_SIZE:
+            bulk_insert_entries(batch)
+            batch = []
+
+    if batch:
+        bulk_insert_entries(batch)
+
+
+def backfill_timeline(owner_id: int, author_id: int) -> None:
+    """Copy the latest posts of a newly followed author into the timeline"""
+    if owner_id != author_id and is_pulled_author(author_id):
+        return
+
+    post_ids = (
+        Post.objects.filter(user_profile_id=author_id)
+        .order_by("-id")
+        .values_list("id", flat=True)[: settings.TIMELINE_BACKFILL_SIZE]
+    )
+
+    bulk_insert_entries(
+        [TimelineEntry(owner_id=owner_id, post_id=post_id) for post_id in post_ids]
+    )
+
+
+def trim_timeline(owner_id: int, author_id: int) -> None:
+    """Remove posts of an unfollowed author from the timeline"""
+    TimelineEntry.objects.filter(
+        owner_id=owner_id, post__user_profile_id=author_id
+    ).delete()
+
+
+def rebuild_timeline(owner: UserProfile) -> None:
+    backfill_timeline(owner.id, owner.id)
+    for author_id in owner.followings.values_list("id", flat=True):
+        backfill_timeline(owner.id, author_id)
@@ -1,6 +1,13 @@
 from django.urls import path
 from rest_framework_nested import routers
 
+from social_media.async_views import (
+    AsyncPostListView,
+    AsyncPostDetailView,
+    AsyncUserProfileDetailView,
+    AsyncCommentListView,
+    AsyncEventStreamView,
+)
 from social_media.views import (
     UserProfileViewSet,
     UserManageApiView,
@@ -9,11 +16,21 @@ from social_media.views import (
     PostViewSet,
     CommentViewSet,
     PostponedPostCreateApiView,
+    PostponedPostCancelApiView,
+    PostponedPostRescheduleApiView,
+    UploadSessionViewSet,
+    DataExportViewSet,
+    NotificationViewSet,
+    EventTicketApiView,
+    MetricsApiView,
 )
 
 router = routers.DefaultRouter()
 router.register("user-profiles", UserProfileViewSet, basename="user_profiles")
 router.register("posts", PostViewSet, basename="post")
+router.register("uploads", UploadSessionViewSet, basename="upload")
+router.register("exports", DataExportViewSet, basename="export")
+router.register("notifications", NotificationViewSet, basename="notification")
 
 post_router = routers.NestedDefaultRouter(router, "posts", lookup="post")
 post_router.register("comments", CommentViewSet, basename="post_comment")
@@ -40,6 +57,35 @@ urlpatterns = (
             PostponedPostCreateApiView.as_view(),
             name="create_postponed_post",
         ),
+        path(
+            "posts/postponed-posts/<int:pk>/cancel/",
+            PostponedPostCancelApiView.as_view(),
+            name="cancel_postponed_post",
+        ),
+        path(
+            "posts/postponed-posts/<int:pk>/reschedule/",
+            PostponedPostRescheduleApiView.as_view(),
+            name="reschedule_postponed_post",
+        ),
+        path("async/posts/", AsyncPostListView.as_view(), name="async_post_list"),
+        path(
+            "async/posts/<int:pk>/",
+            AsyncPostDetailView.as_view(),
+            name="async_post_detail",
+        ),
+        path(
+            "async/posts/<int:post_pk>/comments/",
+            AsyncCommentListView.as_view(),
+            name="async_post_comment_list",
+        ),
+        path("events/", AsyncEventStreamView.as_view(), name="event_stream"),
+        path("events/ticket/", EventTicketApiView.as_view(), name="event_ticket"),
+        path("metrics/", MetricsApiView.as_view(), name="metrics"),
+        path(
+            "async/user-profiles/<int:pk>/",
+            AsyncUserProfileDetailView.as_view(),
+            name="async_user_profile_detail",
+        ),
     ]
     + router.urls
     + post_router.urls
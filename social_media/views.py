@@ -1,19 +1,61 @@
 from typing import Type, Any
 
-from django.db.models import QuerySet, Count, Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import FileResponse
+from PIL import Image
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, status, mixins, generics
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
-
+from rest_framework.views import APIView
+
+from account.authentication import issue_ticket
+from social_media.cache import (
+    PROFILE_LIST_VERSION_KEY,
+    get_version,
+    get_profile_version_key,
+    get_response_cache_key,
+    cached_response,
+)
+from social_media.conditional import conditional_response
 from social_media.filters import HashtagSearchBackend
-from social_media.models import UserProfile, Post, Comment
+from social_media.metrics import get_metrics
+from social_media.pagination import (
+    SearchCursorPagination,
+    NotificationCursorPagination,
+    CommentThreadCursorPagination,
+)
+from social_media.models import (
+    UserProfile,
+    Post,
+    Comment,
+    PostponedPost,
+    UploadSession,
+    DataExport,
+    Notification,
+)
 from social_media.permissions import HasUserProfile, IsObjectOwner
+from social_media.search import search_posts
+from social_media.storage import get_media_names, release_media_names
+from social_media.tasks import (
+    schedule_postponed_post,
+    revoke_postponed_post,
+    schedule_post_processing,
+    schedule_image_variants,
+    schedule_backfill_timeline,
+    schedule_trim_timeline,
+    schedule_data_export,
+    schedule_profile_purge,
+)
+from social_media.timeline import get_home_timeline
 
 from social_media.serializers import (
     UserProfileSerializer,
@@ -23,9 +65,19 @@ from social_media.serializers import (
     PostSerializer,
     PostCreateUpdateSerializer,
     CommentSerializer,
+    CommentThreadSerializer,
     CommentCreateSerializer,
+    CommentUpdateSerializer,
     PostponedPostCreateSerializer,
+    PostponedPostRescheduleSerializer,
     FollowSerializer,
+    BatchIdsSerializer,
+    BatchResultSerializer,
+    UploadSessionSerializer,
+    DataExportSerializer,
+    NotificationSerializer,
+    UnreadCountSerializer,
+    EventTicketSerializer,
 )
 
 
@@ -37,6 +89,15 @@ class UserProfileViewSet(
 ):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budget = {
+        "list": 1,
+        "retrieve": 2,
+        "create": 3,
+        "follow": 7,
+        "unfollow": 6,
+        "follow_many": 6,
+        "unfollow_many": 5,
+    }
 
     def get_serializer_class(self) -> Type[Serializer]:
         if self.action == "create":
@@ -45,11 +106,7 @@ class UserProfileViewSet(
         return super().get_serializer_class()
 
     def get_queryset(self) -> QuerySet:
-        profile_qs = (
-            UserProfile.objects.select_related("user")
-            .annotate(follower_count=Count("followers"))
-            .order_by("id")
-        )
+        profile_qs = UserProfile.active().select_related("user").order_by("id")
 
         query_username = self.request.query_params.get("username")
         if query_username:
@@ -57,6 +114,11 @@ class UserProfileViewSet(
 
         return profile_qs
 
+    def perform_create(self, serializer: Serializer) -> None:
+        user_profile = serializer.save()
+        if user_profile.profile_picture:
+            schedule_image_variants(user_profile, "profile_picture")
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -73,11 +135,48 @@ class UserProfileViewSet(
         Return a list of all profiles.
         Can be filtered by username.
         """
-        return super().list(request, *args, **kwargs)
+        key = get_response_cache_key(
+            "profile:list", get_version(PROFILE_LIST_VERSION_KEY), request
+        )
+        return cached_response(
+            "profile_list",
+            key,
+            settings.PROFILE_LIST_CACHE_TTL,
+            lambda: super(UserProfileViewSet, self).list(request, *args, **kwargs),
+        )
 
     def retrieve(self, request: Request, *args, **kwargs) -> Response:
         """Return a single profile."""
-        return super().retrieve(request, *args, **kwargs)
+        state = (
+            self.get_queryset()
+            .filter(pk=kwargs["pk"])
+            .values_list(
+                "updated_at",
+                "user__username",
+                "follower_count",
+                "following_count",
+                "post_count",
+            )
+            .first()
+        )
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        version = get_version(get_profile_version_key(kwargs["pk"]))
+        key = get_response_cache_key("profile:detail", version, request)
+        return conditional_response(
+            request,
+            state,
+            state[0],
+            lambda: cached_response(
+                "profile_detail",
+                key,
+                settings.PROFILE_CACHE_TTL,
+                lambda: super(UserProfileViewSet, self).retrieve(
+                    request, *args, **kwargs
+                ),
+            ),
+        )
 
     def create(self, request: Request, *args, **kwargs) -> Response:
         """
@@ -111,9 +210,9 @@ class UserProfileViewSet(
         serializer = self.get_serializer(data={}, context=serializer_context)
         serializer.is_valid(raise_exception=True)
 
-        user_profile.followers.add(follower_profile)
+        if user_profile.add_follower(follower_profile):
+            schedule_backfill_timeline(follower_profile.id, user_profile.id)
 
-        user_profile.followers.add(follower_profile)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @extend_schema(
@@ -131,13 +230,74 @@ class UserProfileViewSet(
     def unfollow(self, request, pk=None) -> Response:
         user_profile = self.get_object()
         follower_profile = request.user.profile
-        user_profile.followers.remove(follower_profile)
+        if user_profile.remove_follower(follower_profile):
+            schedule_trim_timeline(follower_profile.id, user_profile.id)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(
+        operation_id="social_media_user_profiles_follow_many",
+        request=BatchIdsSerializer,
+        responses=BatchResultSerializer,
+        description=(
+            "Follow several user profiles at once. Results are followed, "
+            "already_following, self or not_found per id"
+        ),
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="follow",
+        url_name="follow_many",
+        serializer_class=BatchIdsSerializer,
+        permission_classes=[HasUserProfile],
+    )
+    def follow_many(self, request: Request) -> Response:
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        follower_profile = request.user.profile
+        results = follower_profile.follow_many(serializer.validated_data["ids"])
+        for user_profile_id, result in results.items():
+            if result == "followed":
+                schedule_backfill_timeline(follower_profile.id, user_profile_id)
+
+        return Response(BatchResultSerializer({"results": results}).data)
+
+    @extend_schema(
+        operation_id="social_media_user_profiles_unfollow_many",
+        request=BatchIdsSerializer,
+        responses=BatchResultSerializer,
+        description=(
+            "Unfollow several user profiles at once. Results are unfollowed, "
+            "not_following or not_found per id"
+        ),
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="unfollow",
+        url_name="unfollow_many",
+        serializer_class=BatchIdsSerializer,
+        permission_classes=[HasUserProfile],
+    )
+    def unfollow_many(self, request: Request) -> Response:
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        follower_profile = request.user.profile
+        results = follower_profile.unfollow_many(serializer.validated_data["ids"])
+        for user_profile_id, result in results.items():
+            if result == "unfollowed":
+                schedule_trim_timeline(follower_profile.id, user_profile_id)
+
+        return Response(BatchResultSerializer({"results": results}).data)
+
 
 class UserManageApiView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [HasUserProfile]
+    # A new username is checked against the other users
+    query_budget = 5
 
     def get_serializer_class(self) -> Type[Serializer]:
         if self.request.method in ["PUT", "PATCH"]:
@@ -145,10 +305,24 @@ class UserManageApiView(generics.RetrieveUpdateDestroyAPIView):
         return UserProfileSerializer
 
     def get_object(self) -> UserProfile:
-        return UserProfile.objects.annotate(follower_count=Count("followers")).get(
-            user=self.request.user
+        return UserProfile.objects.select_related("user").get(
+            pk=self.request.user.profile.id
         )
 
+    def perform_destroy(self, instance: UserProfile) -> None:
+        with transaction.atomic():
+            instance.soft_delete()
+            schedule_profile_purge(instance.pk)
+
+    def perform_update(self, serializer: Serializer) -> None:
+        if "profile_picture" in serializer.validated_data:
+            replaced_media = get_media_names(serializer.instance, "profile_picture")
+            user_profile = serializer.save(image_variants={})
+            release_media_names(user_profile.profile_picture.storage, replaced_media)
+            schedule_image_variants(user_profile, "profile_picture")
+        else:
+            serializer.save()
+
     def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Retrieve authenticated user's profile"""
         return super().retrieve(request, *args, **kwargs)
@@ -162,16 +336,22 @@ class UserManageApiView(generics.RetrieveUpdateDestroyAPIView):
         return super().partial_update(request, *args, **kwargs)
 
     def destroy(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        """Delete authenticated user's profile"""
-        return super().partial_update(request, *args, **kwargs)
+        """
+        Delete authenticated user's profile.
+        The profile and its content are hidden at once and deleted in the background.
+        """
+        return super().destroy(request, *args, **kwargs)
 
 
 class FollowerApiView(generics.ListAPIView):
     permission_classes = [HasUserProfile]
     serializer_class = UserProfileShortSerializer
+    query_budget = 1
 
     def get_queryset(self) -> QuerySet:
-        follower_qs = self.request.user.profile.followers.all()
+        follower_qs = self.request.user.profile.followers.filter(
+            deleted_at__isnull=True
+        ).select_related("user")
         return follower_qs
 
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
@@ -182,9 +362,12 @@ class FollowerApiView(generics.ListAPIView):
 class FollowingApiView(generics.ListAPIView):
     permission_classes = [HasUserProfile]
     serializer_class = UserProfileShortSerializer
+    query_budget = 1
 
     def get_queryset(self) -> QuerySet:
-        follower_qs = self.request.user.profile.followings.all()
+        follower_qs = self.request.user.profile.followings.filter(
+            deleted_at__isnull=True
+        ).select_related("user")
         return follower_qs
 
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
@@ -196,6 +379,21 @@ class PostViewSet(viewsets.ModelViewSet):
     serializer_class = PostSerializer
     permission_classes = [HasUserProfile, IsObjectOwner]
     filter_backends = [HashtagSearchBackend]
+    query_budget = {
+        # The pulled authors of the fan-out timeline take one more query
+        "list": 2,
+        "retrieve": 2,
+        "search": 1,
+        "liked_post": 1,
+        "create": 6,
+        "update": 8,
+        "partial_update": 8,
+        "destroy": 10,
+        "like": 6,
+        "unlike": 4,
+        "like_many": 5,
+        "unlike_many": 4,
+    }
 
     def get_serializer_class(self) -> Type[Serializer]:
         if self.action in ["create", "update", "partial_update"]:
@@ -203,21 +401,42 @@ class PostViewSet(viewsets.ModelViewSet):
         return super().get_serializer_class()
 
     def get_queryset(self) -> QuerySet:
-        post_qs = Post.objects.filter(
-            Q(user_profile__user=self.request.user)
-            | Q(user_profile__followers=self.request.user.profile)
-        )
+        if self.action == "list" and settings.TIMELINE_FANOUT_ENABLED:
+            post_qs = get_home_timeline(self.request.user.profile)
+        else:
+            post_qs = Post.visible_to(self.request.user.profile)
         if self.request.method == "GET":
             post_qs = (
-                post_qs.prefetch_related("user_profile", "likes")
-                .annotate(count_likes=Count("likes"))
+                post_qs.select_related("user_profile__user")
+                .defer("search_vector")
                 .order_by("-id")
             )
 
         return post_qs
 
     def perform_create(self, serializer: Serializer) -> Post:
-        return serializer.save(user_profile=self.request.user.profile)
+        with transaction.atomic():
+            post = serializer.save(user_profile=self.request.user.profile)
+            UserProfile.update_counters(post.user_profile_id, post_count=1)
+
+        schedule_post_processing(post)
+        return post
+
+    def perform_update(self, serializer: Serializer) -> None:
+        if serializer.replaces_image:
+            replaced_media = get_media_names(serializer.instance, "image")
+            post = serializer.save(image_variants={})
+            release_media_names(post.image.storage, replaced_media)
+            schedule_image_variants(post, "image")
+        else:
+            serializer.save()
+
+    def perform_destroy(self, instance: Post) -> None:
+        with transaction.atomic():
+            # Cascaded notifications of every recipient leave the unread counts
+            Notification.discard_unread(post=instance)
+            instance.delete()
+            UserProfile.update_counters(instance.user_profile_id, post_count=-1)
 
     @extend_schema(
         parameters=[
@@ -229,6 +448,14 @@ class PostViewSet(viewsets.ModelViewSet):
                 many=True,
                 type=OpenApiTypes.STR,
             ),
+            OpenApiParameter(
+                name="hashtags_match",
+                description="Match posts with any (default) or all of the hashtags",
+                required=False,
+                location=OpenApiParameter.QUERY,
+                type=OpenApiTypes.STR,
+                enum=["any", "all"],
+            ),
         ],
     )
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
@@ -244,7 +471,26 @@ class PostViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Return a post detail"""
-        return super().retrieve(request, *args, **kwargs)
+        state = (
+            self.get_queryset()
+            .filter(pk=kwargs["pk"])
+            .values_list(
+                "updated_at",
+                "user_profile__user__username",
+                "like_count",
+                "comment_count",
+            )
+            .first()
+        )
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        return conditional_response(
+            request,
+            state,
+            state[0],
+            lambda: super(PostViewSet, self).retrieve(request, *args, **kwargs),
+        )
 
     def update(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Update own post"""
@@ -271,8 +517,8 @@ class PostViewSet(viewsets.ModelViewSet):
         permission_classes=[HasUserProfile],
     )
     def like(self, request: Request, pk: int = None) -> Response:
-        user_profile = self.get_object()
-        user_profile.likes.add(request.user.profile)
+        post = self.get_object()
+        post.add_like(request.user.profile)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @extend_schema(
@@ -288,12 +534,61 @@ class PostViewSet(viewsets.ModelViewSet):
         permission_classes=[HasUserProfile],
     )
     def unlike(self, request: Request, pk: int = None) -> Response:
-        user_profile = self.get_object()
-        user_profile.likes.remove(request.user.profile)
+        post = self.get_object()
+        post.remove_like(request.user.profile)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(
+        operation_id="social_media_posts_like_many",
+        request=BatchIdsSerializer,
+        responses=BatchResultSerializer,
+        description=(
+            "Like several posts at once. Results are liked, already_liked "
+            "or not_found per id"
+        ),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="like",
+        url_name="like_many",
+        serializer_class=BatchIdsSerializer,
+        permission_classes=[HasUserProfile],
+    )
+    def like_many(self, request: Request) -> Response:
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = Post.like_many(request.user.profile, serializer.validated_data["ids"])
+        return Response(BatchResultSerializer({"results": results}).data)
+
+    @extend_schema(
+        operation_id="social_media_posts_unlike_many",
+        request=BatchIdsSerializer,
+        responses=BatchResultSerializer,
+        description=(
+            "Unlike several posts at once. Results are unliked, not_liked "
+            "or not_found per id"
+        ),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="unlike",
+        url_name="unlike_many",
+        serializer_class=BatchIdsSerializer,
+        permission_classes=[HasUserProfile],
+    )
+    def unlike_many(self, request: Request) -> Response:
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = Post.unlike_many(
+            request.user.profile, serializer.validated_data["ids"]
+        )
+        return Response(BatchResultSerializer({"results": results}).data)
+
     @extend_schema(
         request=None,
+        responses=PostSerializer(many=True),
         description="Return a list of liked posts",
     )
     @action(
@@ -304,8 +599,43 @@ class PostViewSet(viewsets.ModelViewSet):
     )
     def liked_post(self, request: Request) -> Response:
         post_qs = self.get_queryset().filter(likes=request.user.profile)
-        serializer = self.get_serializer(post_qs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        page = self.paginate_queryset(post_qs)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Full-text search query",
+                required=True,
+                location=OpenApiParameter.QUERY,
+                type=OpenApiTypes.STR,
+            ),
+        ],
+        request=None,
+        responses=PostSerializer(many=True),
+        description="Return visible posts matching the query, best matches first",
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="search",
+        url_name="search",
+        pagination_class=SearchCursorPagination,
+        filter_backends=[],
+    )
+    def search(self, request: Request) -> Response:
+        query_text = request.query_params.get("q", "").strip()
+        if not query_text:
+            raise ValidationError({"q": "This query parameter is required."})
+
+        post_qs = search_posts(self.get_queryset(), query_text)
+
+        page = self.paginate_queryset(post_qs)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class PostponedPostCreateApiView(generics.CreateAPIView):
@@ -313,41 +643,182 @@ class PostponedPostCreateApiView(generics.CreateAPIView):
     permission_classes = [HasUserProfile]
 
     def perform_create(self, serializer: Serializer) -> None:
-        serializer.save(user_profile=self.request.user.profile)
+        with transaction.atomic():
+            postponed_post = serializer.save(user_profile=self.request.user.profile)
+            schedule_postponed_post(postponed_post)
+            if postponed_post.image:
+                schedule_image_variants(postponed_post, "image")
 
     def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Create a postponed post of user profile"""
         return super().post(request, *args, **kwargs)
 
 
+class PostponedPostManageMixin:
+    permission_classes = [HasUserProfile]
+
+    def get_queryset(self) -> QuerySet:
+        return PostponedPost.objects.filter(
+            user_profile=self.request.user.profile, published=False
+        ).select_for_update()
+
+
+class PostponedPostCancelApiView(PostponedPostManageMixin, generics.GenericAPIView):
+
+    @extend_schema(request=None, responses={status.HTTP_204_NO_CONTENT: None})
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Cancel a not yet published postponed post"""
+        with transaction.atomic():
+            postponed_post = self.get_object()
+            revoke_postponed_post(postponed_post)
+            postponed_post.delete()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class PostponedPostRescheduleApiView(PostponedPostManageMixin, generics.GenericAPIView):
+    serializer_class = PostponedPostRescheduleSerializer
+
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Change publication time of a not yet published postponed post"""
+        with transaction.atomic():
+            postponed_post = self.get_object()
+            serializer = self.get_serializer(postponed_post, data=request.data)
+            serializer.is_valid(raise_exception=True)
+
+            revoke_postponed_post(postponed_post)
+            postponed_post = serializer.save()
+            schedule_postponed_post(postponed_post)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     permission_classes = [HasUserProfile, IsObjectOwner]
+    query_budget = {
+        "list": 4,
+        "retrieve": 1,
+        "thread": 2,
+        "create": 6,
+        "update": 2,
+        "partial_update": 2,
+        "destroy": 6,
+    }
+    _post = None
 
     def get_serializer_class(self) -> Type[Serializer]:
-        if self.action in ["create", "update", "partial_update"]:
+        if self.action == "create":
             return CommentCreateSerializer
+        if self.action in ["update", "partial_update"]:
+            return CommentUpdateSerializer
+        if self.action == "list":
+            return CommentThreadSerializer
         return CommentSerializer
 
+    def get_serializer_context(self) -> dict:
+        context = super().get_serializer_context()
+        if self.action == "create":
+            context["post"] = self.get_post()
+        return context
+
     def get_post(self) -> Post:
-        post_qs = Post.objects.filter(
-            Q(user_profile__user=self.request.user)
-            | Q(user_profile__followers=self.request.user.profile)
-        )
-        return get_object_or_404(post_qs, pk=self.kwargs.get("post_pk"))
+        if self._post is None:
+            self._post = get_object_or_404(
+                Post.visible_to(self.request.user.profile),
+                pk=self.kwargs.get("post_pk"),
+            )
+        return self._post
 
     def get_queryset(self) -> QuerySet:
-        return Comment.objects.filter(post=self.get_post())
+        # The post visibility is checked in the same query as the comments
+        post_qs = Post.visible_to(self.request.user.profile).filter(
+            pk=self.kwargs.get("post_pk")
+        )
+        return (
+            Comment.visible()
+            .filter(post__in=post_qs.values("pk"))
+            .select_related("user_profile__user")
+        )
 
     def perform_create(self, serializer: Serializer) -> None:
-        serializer.save(
-            user_profile=self.request.user.profile,
-            post=self.get_post(),
-        )
+        post = self.get_post()
+        parent = serializer.validated_data.get("parent")
+        with transaction.atomic():
+            comment = serializer.save(
+                user_profile=self.request.user.profile,
+                post=post,
+                **Comment.get_thread_fields(parent),
+            )
+            Post.update_counters(post.id, comment_count=1)
+
+            # The post author and the author of the replied comment
+            recipient_ids = {post.user_profile_id}
+            if parent is not None:
+                recipient_ids.add(parent.user_profile_id)
+            Notification.notify_many(
+                Notification.Verb.COMMENT,
+                comment.user_profile_id,
+                [(recipient_id, post.id) for recipient_id in recipient_ids],
+                comment_id=comment.id,
+            )
+
+    def perform_destroy(self, instance: Comment) -> None:
+        with transaction.atomic():
+            # One query over the path prefix instead of a cascade per level
+            _, deleted = Comment.objects.filter(
+                root_id=instance.root_id, path__startswith=instance.path
+            ).delete()
+            Post.update_counters(
+                instance.post_id, comment_count=-deleted.get(Comment._meta.label, 0)
+            )
 
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        """Return a list of post comments"""
-        return super().list(request, *args, **kwargs)
+        """
+        Return the threads of the post, newest first,
+        with the first replies of each thread
+        """
+        post = self.get_post()
+        state = Comment.objects.filter(post=post).aggregate(**Comment.get_list_state())
+
+        def get_response() -> Response:
+            roots = self.paginate_queryset(
+                Comment.visible()
+                .filter(post=post, parent__isnull=True)
+                .select_related("user_profile__user")
+            )
+            replies = Comment.get_reply_previews([root.id for root in roots])
+            Comment.attach_replies(roots, list(replies))
+            serializer = self.get_serializer(roots, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        # Deleting a comment only shows up in the post counter and timestamp
+        return conditional_response(
+            request,
+            (post.comment_count, post.updated_at, *state.values()),
+            max([post.updated_at, *filter(None, state.values())]),
+            get_response,
+        )
+
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="thread",
+        url_name="thread",
+        pagination_class=CommentThreadCursorPagination,
+    )
+    def thread(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Return the comment and all of its replies in thread order"""
+        comment = self.get_object()
+        subtree_qs = (
+            Comment.visible()
+            .filter(root_id=comment.root_id, path__startswith=comment.path)
+            .select_related("user_profile__user")
+        )
+
+        page = self.paginate_queryset(subtree_qs)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Add a comment to the post"""
@@ -364,3 +835,238 @@ class CommentViewSet(viewsets.ModelViewSet):
     def destroy(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Delete own comment of the post"""
         return super().destroy(request, *args, **kwargs)
+
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [HasUserProfile]
+    offset_header = "Upload-Offset"
+
+    def get_queryset(self) -> QuerySet:
+        return UploadSession.objects.filter(user_profile=self.request.user.profile)
+
+    def perform_create(self, serializer: Serializer) -> None:
+        serializer.save(user_profile=self.request.user.profile)
+
+    def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Start a resumable image upload"""
+        return super().create(request, *args, **kwargs)
+
+    def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Return the upload session, its offset tells where to resume"""
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="Upload-Offset",
+                description="Byte offset of the chunk, must match the session offset",
+                required=True,
+                location=OpenApiParameter.HEADER,
+                type=OpenApiTypes.INT,
+            ),
+        ],
+        request={"application/octet-stream": OpenApiTypes.BINARY},
+        responses=UploadSessionSerializer,
+    )
+    def update(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Append a raw chunk of bytes to the upload"""
+        try:
+            offset = int(request.headers[self.offset_header])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            raise ValidationError(
+                f"{self.offset_header} and Content-Length headers are required"
+            )
+
+        with transaction.atomic():
+            upload = get_object_or_404(
+                self.get_queryset().select_for_update(), pk=kwargs["pk"]
+            )
+            if upload.completed or offset != upload.offset:
+                return Response(
+                    {"detail": "Offset mismatch", "offset": upload.offset},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if offset + length > upload.size:
+                raise ValidationError("Chunk exceeds the declared upload size")
+
+            upload.write_chunk(request.stream, length)
+            upload.save(update_fields=["offset"])
+
+        serializer = self.get_serializer(upload)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(request=None, responses=UploadSessionSerializer)
+    @action(detail=True, methods=["POST"], url_path="complete", url_name="complete")
+    def complete(self, request: Request, pk: str = None) -> Response:
+        """Finish the upload, its id can then be passed as upload to create posts"""
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if upload.offset != upload.size:
+                raise ValidationError(
+                    f"Upload is incomplete, received {upload.offset} of {upload.size} bytes"
+                )
+
+            try:
+                with Image.open(upload.path) as image:
+                    image.verify()
+            except (OSError, SyntaxError):
+                raise ValidationError("Upload is not a valid image")
+
+            upload.completed = True
+            upload.save(update_fields=["completed"])
+
+        serializer = self.get_serializer(upload)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class DataExportViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    serializer_class = DataExportSerializer
+    permission_classes = [HasUserProfile]
+    query_budget = {"list": 1, "retrieve": 1, "create": 1, "download": 1}
+
+    def get_queryset(self) -> QuerySet:
+        return DataExport.objects.filter(user_profile=self.request.user.profile)
+
+    def perform_create(self, serializer: Serializer) -> None:
+        export = serializer.save(user_profile=self.request.user.profile)
+        schedule_data_export(export)
+
+    def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Start exporting own posts, comments, likes and follows
+        as gzip compressed NDJSON, optionally in a tar with the media.
+        """
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Return own data exports"""
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Return the export status, download_url is set once it completes"""
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        responses={
+            (status.HTTP_200_OK, "application/octet-stream"): OpenApiTypes.BINARY,
+            status.HTTP_409_CONFLICT: None,
+        }
+    )
+    @action(detail=True, methods=["GET"], url_path="download", url_name="download")
+    def download(self, request: Request, pk=None) -> Response | FileResponse:
+        """Download the completed export archive"""
+        export = self.get_object()
+        if export.status != DataExport.Status.COMPLETED:
+            return Response(
+                {"detail": f"The export is {export.status}"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        return FileResponse(export.file.open("rb"), as_attachment=True)
+
+
+class NotificationViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = NotificationSerializer
+    permission_classes = [HasUserProfile]
+    pagination_class = NotificationCursorPagination
+    query_budget = {"list": 2, "unread_count": 1, "read": 3, "read_all": 2}
+
+    def get_queryset(self) -> QuerySet:
+        return Notification.objects.filter(recipient=self.request.user.profile)
+
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Return own notifications, the most recently updated first"""
+        page = self.paginate_queryset(self.get_queryset())
+        actor_ids = {
+            actor_id for notification in page for actor_id in notification.actor_ids
+        }
+        actor_usernames = (
+            dict(
+                UserProfile.active()
+                .filter(id__in=actor_ids)
+                .values_list("id", "user__username")
+            )
+            if actor_ids
+            else {}
+        )
+        serializer = self.get_serializer(
+            page,
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                "actor_usernames": actor_usernames,
+            },
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(responses=UnreadCountSerializer)
+    @action(detail=False, methods=["GET"], url_path="unread-count")
+    def unread_count(self, request: Request) -> Response:
+        """Return the number of unread notifications"""
+        unread_count = (
+            UserProfile.objects.filter(pk=request.user.profile.id)
+            .values_list("unread_notification_count", flat=True)
+            .get()
+        )
+        return Response(UnreadCountSerializer({"unread_count": unread_count}).data)
+
+    @extend_schema(request=None, responses={status.HTTP_204_NO_CONTENT: None})
+    @action(detail=True, methods=["POST"], url_path="read", url_name="read")
+    def read(self, request: Request, pk=None) -> Response:
+        """Mark the notification read"""
+        notification = self.get_object()
+        Notification.mark_read(request.user.profile.id, pk=notification.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(
+        operation_id="social_media_notifications_read_all",
+        request=None,
+        responses={status.HTTP_204_NO_CONTENT: None},
+    )
+    @action(detail=False, methods=["POST"], url_path="read", url_name="read_all")
+    def read_all(self, request: Request) -> Response:
+        """Mark all own notifications read"""
+        Notification.mark_read(request.user.profile.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class EventTicketApiView(APIView):
+    permission_classes = [HasUserProfile]
+    query_budget = 0
+
+    @extend_schema(request=None, responses=EventTicketSerializer)
+    def post(self, request: Request) -> Response:
+        """
+        Issue a single use ticket for opening the event stream
+        as events/?ticket=, EventSource can't send the token header
+        """
+        ttl = settings.EVENT_STREAM_TICKET_TTL
+        serializer = EventTicketSerializer(
+            {"ticket": issue_ticket(request.auth, ttl), "expires_in": ttl}
+        )
+        return Response(serializer.data)
+
+
+class MetricsApiView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    def get(self, request: Request) -> Response:
+        """
+        Return the query metrics per view, the response cache hits and misses
+        and the connection pool metrics of the worker serving the request
+        """
+        return Response(get_metrics())
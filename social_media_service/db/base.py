@@ -0,0 +1,112 @@
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg import Connection, IsolationLevel
+from psycopg_pool import ConnectionPool
+
+from social_media_service.db.creation import DatabaseCreation
+
+
+def get_pool_metrics() -> dict:
+    """
+    Pool statistics of this process per database alias. Saturation is
+    the share of max_size checked out, requests_wait_ms the total time
+    requests queued for a connection.
+    """
+    metrics = {}
+    for (pid, alias), pool in list(DatabaseWrapper._connection_pools.items()):
+        # Pools are only reported once the process opened them
+        if pid != os.getpid():
+            continue
+
+        stats = pool.get_stats()
+        in_use = stats["pool_size"] - stats["pool_available"]
+        metrics[alias] = {**stats, "saturation": round(in_use / pool.max_size, 3)}
+    return metrics
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that checks connections out of a psycopg pool
+    when OPTIONS["pool"] is set, backported from Django 5.1.
+    CONN_HEALTH_CHECKS verifies each connection on checkout.
+    """
+
+    creation_class = DatabaseCreation
+
+    # One pool per process and alias, forked workers build their own
+    _connection_pools = {}
+
+    @property
+    def pool(self) -> ConnectionPool | None:
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        key = (os.getpid(), self.alias)
+        if key not in self._connection_pools:
+            if self.settings_dict["CONN_MAX_AGE"] != 0:
+                raise ImproperlyConfigured(
+                    "Pooling doesn't support persistent connections."
+                )
+            if "isolation_level" in self.settings_dict["OPTIONS"]:
+                raise ImproperlyConfigured(
+                    "Pooled connections use the default isolation level."
+                )
+
+            connect_kwargs = self.get_connection_params()
+            # Django switches to the configured autocommit after checkout
+            connect_kwargs["autocommit"] = True
+            pool = ConnectionPool(
+                kwargs=connect_kwargs,
+                open=False,
+                check=(
+                    ConnectionPool.check_connection
+                    if self.settings_dict["CONN_HEALTH_CHECKS"]
+                    else None
+                ),
+                name=self.alias,
+                **({} if pool_options is True else pool_options),
+            )
+            # The first pool set wins when threads race on startup
+            self._connection_pools.setdefault(key, pool)
+
+        return self._connection_pools[key]
+
+    def close_pool(self) -> None:
+        pool = self._connection_pools.pop((os.getpid(), self.alias), None)
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self) -> dict:
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params: dict) -> Connection:
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        self.isolation_level = IsolationLevel.READ_COMMITTED
+        # Opening an open pool does nothing
+        pool.open()
+        return pool.getconn()
+
+    def _close(self) -> None:
+        if self.connection is None or self.pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            # The connection goes back to the pool that created it
+            self.connection._pool.putconn(self.connection)
+            self.connection = None
+
+    def close_if_health_check_failed(self) -> None:
+        # The pool checks connections on checkout
+        if self.pool is None:
+            super().close_if_health_check_failed()
@@ -0,0 +1,30 @@
+from django.db import connections
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Pools keep connections to the database they were opened for,
+    they are closed when the test database is created or destroyed.
+    """
+
+    def close_pools(self) -> None:
+        # Test mirrors share the database and hold pools of their own
+        name = self.connection.settings_dict["NAME"]
+        for connection in connections.all():
+            if connection.settings_dict["NAME"] == name:
+                connection.close()
+                connection.close_pool()
+
+    def create_test_db(self, *args, **kwargs) -> str:
+        self.close_pools()
+        return super().create_test_db(*args, **kwargs)
+
+    def set_as_test_mirror(self, primary_settings_dict: dict) -> None:
+        self.connection.close()
+        self.connection.close_pool()
+        super().set_as_test_mirror(primary_settings_dict)
+
+    def destroy_test_db(self, *args, **kwargs) -> None:
+        self.close_pools()
+        super().destroy_test_db(*args, **kwargs)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "knox",
     "drf_spectacular",
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "social_media.instrumentation.QueryInstrumentationMiddleware",
+    "social_media.replicas.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,6 +61,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "social_media_service.urls"
 
+# Query count, DB time and duplicate SQL per request as response headers
+QUERY_INSTRUMENTATION_HEADERS = DEBUG
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -80,17 +86,107 @@ WSGI_APPLICATION = "social_media_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are checked out of a per process pool and checked on checkout
+DATABASE_POOL_ENABLED = (
+    os.environ.get("DATABASE_POOL_ENABLED", "true").lower() == "true"
+)
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "social_media_service.db",
         "NAME": os.environ.get("POSTGRES_DB"),
         "USER": os.environ.get("POSTGRES_USER"),
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),
         "PORT": os.environ.get("POSTGRES_PORT"),
+        # Without the pool connections persist for a minute instead
+        "CONN_MAX_AGE": 0 if DATABASE_POOL_ENABLED else 60,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": DATABASE_POOL_ENABLED
+            and {
+                "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+                # Seconds a checkout waits for a free connection
+                "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+            },
+        },
     },
 }
 
+# Streaming replicas of the primary as comma separated host[:port] entries
+DATABASE_REPLICAS = []
+for index, address in enumerate(
+    filter(None, os.environ.get("POSTGRES_REPLICA_HOSTS", "").split(","))
+):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["social_media.replicas.ReplicaRouter"]
+
+# Users read from the primary for this long after a write
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+# Replicas further behind are taken out of rotation until they catch up
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 2))
+REPLICA_LAG_CHECK_INTERVAL = 5.0
+
+# Redis in production, process local memory when CACHE_URL isn't set (tests)
+if os.environ.get("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_URL"),
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
+# Activity events reach open streams through Redis pub/sub in production
+if os.environ.get("CACHE_URL"):
+    EVENT_BUS_BACKEND = "social_media.events.RedisEventBus"
+    EVENT_BUS_URL = os.environ.get("EVENT_BUS_URL", os.environ.get("CACHE_URL"))
+else:
+    EVENT_BUS_BACKEND = "social_media.events.InMemoryEventBus"
+
+# Events arriving within the window are coalesced into one message
+EVENT_STREAM_COALESCE_WINDOW = float(
+    os.environ.get("EVENT_STREAM_COALESCE_WINDOW", 0.5)
+)
+EVENT_STREAM_HEARTBEAT_INTERVAL = 15
+EVENT_STREAM_QUEUE_SIZE = 100
+# Seconds a single use ticket for opening an event stream stays valid
+EVENT_STREAM_TICKET_TTL = 30
+
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", 300))
+PROFILE_LIST_CACHE_TTL = int(os.environ.get("PROFILE_LIST_CACHE_TTL", 60))
+
+# Most ids accepted by one batch follow or like request
+BATCH_MAX_SIZE = 100
+
+# Latest actors kept on a rolled up notification
+NOTIFICATION_ACTOR_SAMPLE_SIZE = 5
+
+# Deepest reply level and replies listed with each comment thread
+COMMENT_MAX_DEPTH = 10
+COMMENT_THREAD_PREVIEW_SIZE = 3
+
+# Authenticated tokens are kept in the cache with their user
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get("AUTH_TOKEN_CACHE_TTL", 300))
+AUTH_TOKEN_REFRESH_FLUSH_INTERVAL = int(
+    os.environ.get("AUTH_TOKEN_REFRESH_FLUSH_INTERVAL", 30)
+)
+
 AUTH_USER_MODEL = "account.User"
 
 # Password validation
@@ -132,6 +228,26 @@ STATIC_URL = "static/"
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    # Uploaded images are deduplicated and named by their content digest
+    "media": {
+        "BACKEND": "social_media.storage.ContentAddressedStorage",
+    },
+    # Data exports are private, they are only served through the API
+    "exports": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": os.environ.get("DATA_EXPORT_ROOT", BASE_DIR / "exports"),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -139,8 +255,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": ["knox.auth.TokenAuthentication"],
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "account.authentication.CachedTokenAuthentication"
+    ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "social_media.pagination.IdCursorPagination",
+    "PAGE_SIZE": 20,
 }
 
 
@@ -157,9 +277,79 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+POSTPONED_POST_PUBLISH_CHUNK_SIZE = 500
+POSTPONED_POST_PUBLISH_WORKERS = int(
+    os.environ.get("POSTPONED_POST_PUBLISH_WORKERS", 4)
+)
+# Stay well within the sweep interval so runs don't pile up
+POSTPONED_POST_PUBLISH_TIME_LIMIT = 45.0
+
+# Postponed posts are published by ETA tasks, the sweep only catches lost tasks
+POSTPONED_POST_SWEEP_INTERVAL = float(
+    os.environ.get("POSTPONED_POST_SWEEP_INTERVAL", 600)
+)
+
 CELERY_BEAT_SCHEDULE = {
     "publish_post-every-minutes": {
         "task": "social_media.tasks.publish_postponed_posts",
-        "schedule": 60.0,
+        "schedule": POSTPONED_POST_SWEEP_INTERVAL,
+    },
+    "purge-upload-sessions-every-hour": {
+        "task": "social_media.tasks.purge_upload_sessions",
+        "schedule": 3600.0,
+    },
+    "purge-data-exports-every-hour": {
+        "task": "social_media.tasks.purge_data_exports",
+        "schedule": 3600.0,
     },
+    "purge-deleted-profiles-every-hour": {
+        "task": "social_media.tasks.purge_deleted_profiles",
+        "schedule": 3600.0,
+    },
+}
+if DATABASE_REPLICAS:
+    CELERY_BEAT_SCHEDULE["check-replica-lag"] = {
+        "task": "social_media.tasks.check_replica_lag",
+        "schedule": REPLICA_LAG_CHECK_INTERVAL,
+    }
+
+
+TIMELINE_FANOUT_ENABLED = (
+    os.environ.get("TIMELINE_FANOUT_ENABLED", "false").lower() == "true"
+)
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(
+    os.environ.get("TIMELINE_FANOUT_MAX_FOLLOWERS", 10000)
+)
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 200
+
+
+POST_SEARCH_CONFIG = "english"
+# Age difference that is worth a tenfold rank difference in search results
+POST_SEARCH_RECENCY_SECONDS = int(os.environ.get("POST_SEARCH_RECENCY_SECONDS", 86400))
+
+
+# Longest side in pixels of each image variant
+IMAGE_VARIANTS = {
+    "thumbnail": 160,
+    "feed": 720,
+    "full": 1600,
 }
+IMAGE_VARIANT_QUALITY = 80
+
+
+UPLOAD_SESSION_ROOT = Path(
+    os.environ.get("UPLOAD_SESSION_ROOT", BASE_DIR / "upload_sessions")
+)
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_CHUNK_READ_SIZE = 64 * 1024
+
+DATA_EXPORT_CHUNK_SIZE = 2000
+DATA_EXPORT_TTL = 7 * 24 * 60 * 60
+
+PROFILE_PURGE_BATCH_SIZE = int(os.environ.get("PROFILE_PURGE_BATCH_SIZE", 500))
+# Pause between batches so purges don't starve the hot tables
+PROFILE_PURGE_BATCH_DELAY = float(os.environ.get("PROFILE_PURGE_BATCH_DELAY", 0.2))
+# A purge task hands over to a new one after this many seconds
+PROFILE_PURGE_TIME_LIMIT = 240.0
@@ -0,0 +1,14 @@
+"""
+Settings for the test suite, run it with
+python manage.py test --settings=social_media_service.test_settings
+"""
+
+from social_media_service.settings import *  # noqa: F401, F403
+from social_media_service.settings import DATABASES
+
+# A replica mirroring the test database, so the router is tested on one server
+DATABASES = {
+    "default": DATABASES["default"],
+    "replica_0": {**DATABASES["default"], "TEST": {"MIRROR": "default"}},
+}
+DATABASE_REPLICAS = ["replica_0"]